@@ -0,0 +1,132 @@
+"""
+Times the voice activity detection of encoder/audio.trim_long_silences() against its
+previous implementation, which converted the waveform to PCM with struct.pack() (every
+sample unpacked into a Python argument) before calling webrtcvad on each window:
+
+- pcm: the conversion of the float waveform to the 16-bit PCM webrtcvad reads, with
+  struct.pack() vs a numpy buffer whose windows are memoryview slices
+- webrtcvad: the whole trim_long_silences() with webrtcvad, before vs now, and whether
+  they keep the same samples (skipped when webrtcvad isn't installed)
+- spectral: trim_long_silences() with the NumPy spectral detector, against the previous
+  webrtcvad implementation when webrtcvad is installed
+
+    python benchmark_vad.py --seconds 10 60 300
+    python benchmark_vad.py --wav recording.wav
+"""
+from scipy.ndimage import binary_dilation
+from encoder.params_data import *
+from encoder import audio
+from pathlib import Path
+import numpy as np
+import argparse
+import struct
+import time
+
+
+def legacy_trim_long_silences(wav):
+    """trim_long_silences() as it was, with webrtcvad"""
+    samples_per_window = (vad_window_length * sampling_rate) // 1000
+    wav = wav[:len(wav) - (len(wav) % samples_per_window)]
+    pcm_wave = legacy_pcm(wav)
+    voice_flags = []
+    vad = audio.webrtcvad.Vad(mode=3)
+    for window_start in range(0, len(wav), samples_per_window):
+        window_end = window_start + samples_per_window
+        voice_flags.append(vad.is_speech(pcm_wave[window_start * 2:window_end * 2],
+                                         sample_rate=sampling_rate))
+    voice_flags = np.array(voice_flags)
+
+    width = vad_moving_average_width
+    array_padded = np.concatenate((np.zeros((width - 1) // 2), voice_flags, np.zeros(width // 2)))
+    ret = np.cumsum(array_padded, dtype=float)
+    ret[width:] = ret[width:] - ret[:-width]
+    audio_mask = np.round(ret[width - 1:] / width).astype(bool)
+    audio_mask = binary_dilation(audio_mask, np.ones(vad_max_silence_length + 1))
+    return wav[np.repeat(audio_mask, samples_per_window)]
+
+
+def legacy_pcm(wav):
+    return struct.pack("%dh" % len(wav), *(np.round(wav * audio.int16_max)).astype(np.int16))
+
+
+def pcm_windows(wav):
+    """The PCM conversion of webrtcvad_flags(), down to the window slices"""
+    window_bytes = (vad_window_length * sampling_rate) // 1000 * 2
+    pcm_wave = audio.to_pcm16(wav)
+    return [pcm_wave[i:i + window_bytes] for i in range(0, len(pcm_wave), window_bytes)]
+
+
+def synthetic_speech(seconds, seed=0):
+    """
+    Harmonic bursts with a syllable-rate envelope, separated by pauses of 0.1 to 1.5s, over
+    a noise floor. Stands in for speech as far as the detectors and the timings go.
+    """
+    rng = np.random.RandomState(seed)
+    n_samples = int(seconds * sampling_rate)
+    segments = []
+    while sum(map(len, segments)) < n_samples:
+        n = rng.randint(int(0.3 * sampling_rate), int(2.5 * sampling_rate))
+        t = np.arange(n) / sampling_rate
+        f0 = rng.uniform(90, 250)
+        voiced = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 16))
+        segments.append(0.2 * voiced * (0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)))
+        segments.append(np.zeros(rng.randint(int(0.1 * sampling_rate), int(1.5 * sampling_rate))))
+    wav = np.concatenate(segments)[:n_samples]
+    return (wav + rng.normal(0, 0.005, n_samples)).astype(np.float32)
+
+
+def _timed(fn, repeats):
+    """Runs fn once to warm up, then <repeats> times. Returns the last result and the mean time."""
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the voice activity detection of trim_long_silences()",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--seconds", type=float, nargs="+", default=[10., 60., 300.],
+                        help="Durations of the synthetic waveforms")
+    parser.add_argument("--wav", type=Path, nargs="*", default=[],
+                        help="Audio files to benchmark on instead of synthetic waveforms")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per measurement")
+    args = parser.parse_args()
+
+    if args.wav:
+        wavs = [(fpath.name, audio.preprocess_wav(fpath, trim_silence=False)) for fpath in args.wav]
+    else:
+        wavs = [(f"synthetic {seconds:g}s", audio.normalize_volume(
+            synthetic_speech(seconds), audio_norm_target_dBFS, increase_only=True)) for seconds in args.seconds]
+    if audio.webrtcvad is None:
+        print("⚠ webrtcvad is not installed, only the PCM conversion and the spectral detector are timed")
+
+    print(f"\n{'audio':<20} {'step':<10} {'before (s)':>11} {'now (s)':>10} {'speedup':>8}  kept")
+    for name, wav in wavs:
+        samples_per_window = (vad_window_length * sampling_rate) // 1000
+        whole = wav[:len(wav) - len(wav) % samples_per_window]
+        rows = []
+        _, before = _timed(lambda: legacy_pcm(whole), args.repeats)
+        _, now = _timed(lambda: pcm_windows(whole), args.repeats)
+        rows.append(("pcm", before, now, ""))
+
+        legacy, legacy_time = None, None
+        if audio.webrtcvad is not None:
+            legacy, legacy_time = _timed(lambda: legacy_trim_long_silences(wav), args.repeats)
+            trimmed, now = _timed(lambda: audio.trim_long_silences(wav, "webrtcvad"), args.repeats)
+            identical = "identical" if np.array_equal(trimmed, legacy) else "DIFFERENT"
+            rows.append(("webrtcvad", legacy_time, now, f"{len(trimmed) / len(wav):.1%}, {identical}"))
+
+        trimmed, now = _timed(lambda: audio.trim_long_silences(wav, "spectral"), args.repeats)
+        kept = f"{len(trimmed) / len(wav):.1%}"
+        if legacy is not None:
+            kept += f" (webrtcvad {len(legacy) / len(wav):.1%})"
+        rows.append(("spectral", legacy_time, now, kept))
+
+        for step, before, now, kept in rows:
+            before_column = f"{before:>11.4f}" if before is not None else f"{'-':>11}"
+            speedup_column = f"{before / now:>7.1f}x" if before is not None else f"{'-':>8}"
+            print(f"{name:<20} {step:<10} {before_column} {now:>10.4f} {speedup_column}  {kept}")
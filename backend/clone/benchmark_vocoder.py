@@ -0,0 +1,61 @@
+"""
+Measures the real-time factor of Wave-RNN generation against the number of worker
+processes (see vocoder.parallel). A real-time factor below 1 is faster than real time.
+
+    python benchmark_vocoder.py saved_models/vocoder.pt --workers 1 2 4 --seconds 5
+"""
+from vocoder import inference as vocoder
+from vocoder import hparams as hp
+from pathlib import Path
+import numpy as np
+import argparse
+import time
+import os
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks Wave-RNN generation with several worker processes",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("weights_fpath", type=Path, help="Path to the Wave-RNN checkpoint")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="Worker counts to benchmark, 1 runs in-process without a pool")
+    parser.add_argument("--threads_per_worker", type=int, default=1, help="Torch threads per worker")
+    parser.add_argument("--seconds", type=float, default=5., help="Duration of the generated audio")
+    parser.add_argument("--utterances", type=int, default=1,
+                        help="Number of spectrograms vocoded together with infer_waveforms()")
+    parser.add_argument("--target", type=int, default=8000, help="Samples per fold")
+    parser.add_argument("--overlap", type=int, default=800, help="Overlap between folds")
+    parser.add_argument("--auto_folds", action="store_true",
+                        help="Calibrate and pick target and overlap automatically (see vocoder.fold_tuning)")
+    parser.add_argument("--repeats", type=int, default=2, help="Timed runs per worker count")
+    args = parser.parse_args()
+
+    vocoder.load_model(args.weights_fpath)
+    # The content does not matter for the speed, a random spectrogram will do
+    n_frames = int(args.seconds * hp.sample_rate / hp.hop_length)
+    mels = [np.random.uniform(-hp.mel_max_abs_value, hp.mel_max_abs_value, (hp.num_mels, n_frames))
+            .astype(np.float32) for _ in range(args.utterances)]
+    audio_seconds = args.utterances * n_frames * hp.hop_length / hp.sample_rate
+
+    print(f"\n{os.cpu_count()} CPUs, {args.utterances} x {args.seconds:.1f}s of audio")
+    print(f"{'workers':>8} {'target':>7} {'overlap':>8} {'time (s)':>10} {'RTF':>8} {'speedup':>8}")
+    baseline = None
+    for num_workers in args.workers:
+        vocoder.start_pool(num_workers, args.threads_per_worker)
+        target, overlap = args.target, args.overlap
+        if args.auto_folds:
+            vocoder.calibrate_folds()
+            target, overlap = vocoder.fold_params([n_frames] * args.utterances)
+        infer = lambda: vocoder.infer_waveforms(mels, target=target, overlap=overlap,
+                                                progress_callback=lambda *args: None)
+        infer()  # Warm-up
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            infer()
+        elapsed = (time.perf_counter() - start) / args.repeats
+        baseline = baseline or elapsed
+        print(f"{num_workers:>8} {target:>7} {overlap:>8} {elapsed:>10.2f} "
+              f"{elapsed / audio_seconds:>8.3f} {baseline / elapsed:>7.2f}x")
+    vocoder.stop_pool()
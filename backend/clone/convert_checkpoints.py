@@ -0,0 +1,95 @@
+"""
+Converts the checkpoints of a models directory to weights files (see model_export.py):
+the fp32 weights only, without the optimizer state, as flat tensors indexed by a json
+file, which the loaders map into memory instead of unpickling the checkpoint. Then times
+loading each model both ways.
+
+    python convert_checkpoints.py saved_models
+
+The checkpoints are kept: the weights files are tied to them and ignored once they change.
+"""
+from pathlib import Path
+import model_export
+import argparse
+import torch
+import time
+
+
+def _step(checkpoint):
+    """The training step of a checkpoint: stored next to the weights (encoder) or in them"""
+    if "step" in checkpoint:
+        return int(checkpoint["step"])
+    step = checkpoint["model_state"].get("step")
+    return int(step.item()) if step is not None else None
+
+
+def convert(weights_fpath):
+    """
+    Writes the weights file of a checkpoint.
+
+    :return: the path to the data file of the weights file
+    """
+    checkpoint = torch.load(weights_fpath, map_location="cpu", weights_only=False)
+    data_fpath, _ = model_export.save_weights(weights_fpath, checkpoint["model_state"], _step(checkpoint))
+    return data_fpath
+
+
+def time_loads(name, weights_fpath):
+    """Times loading a model from its checkpoint and from its weights file, on the CPU"""
+    device = torch.device("cpu")
+    times = []
+    for mapped in (False, True):
+        if name == "encoder":
+            from encoder.model import SpeakerEncoder
+            model = SpeakerEncoder(device, device)
+        elif name == "synthesizer":
+            from synthesizer.inference import Synthesizer
+            synthesizer = Synthesizer(weights_fpath, verbose=False, optimized=False)
+            synthesizer.device = device
+            synthesizer.load()  # Builds the model, which isn't timed
+            model = synthesizer.get_model()
+        else:
+            from vocoder import inference as vocoder
+            vocoder.load_model(weights_fpath, verbose=False, device=device, optimized=False)
+            model = vocoder.get_model()
+
+        start = time.perf_counter()
+        if mapped:
+            model_export.load_weights(model, weights_fpath)
+        else:
+            checkpoint = torch.load(weights_fpath, map_location=device)
+            model.load_state_dict(checkpoint["model_state"])
+        times.append(time.perf_counter() - start)
+    return times
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Converts checkpoints to memory-mapped weights files",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("models_dir", type=Path, nargs="?", default=Path("saved_models"),
+                        help="Directory with encoder.pt, synthesizer.pt and vocoder.pt")
+    parser.add_argument("--models", nargs="+", default=["encoder", "synthesizer", "vocoder"],
+                        choices=["encoder", "synthesizer", "vocoder"], help="Models to convert")
+    parser.add_argument("--no_check", action="store_true", help="Only convert, don't time the loads")
+    args = parser.parse_args()
+
+    rows = []
+    for name in args.models:
+        weights_fpath = args.models_dir / f"{name}.pt"
+        if not weights_fpath.exists():
+            print(f"⚠ {weights_fpath} not found, skipping the {name}")
+            continue
+        data_fpath = convert(weights_fpath)
+        print(f"✓ Converted {data_fpath} ({data_fpath.stat().st_size / 2 ** 20:.1f} MB, "
+              f"checkpoint {weights_fpath.stat().st_size / 2 ** 20:.1f} MB)")
+        if not args.no_check:
+            rows.append((name, *time_loads(name, weights_fpath)))
+
+    if rows:
+        # Both loads are from the page cache here; a cold start reads the checkpoint from
+        # disk, while the weights file is only read as the weights are used
+        print(f"\n{'model':<12} {'checkpoint (s)':>15} {'weights file (s)':>17} {'speedup':>8}")
+        for name, pickled_time, mapped_time in rows:
+            print(f"{name:<12} {pickled_time:>15.4f} {mapped_time:>17.4f} {pickled_time / mapped_time:>7.1f}x")
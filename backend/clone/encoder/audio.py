@@ -1,11 +1,17 @@
 from scipy.ndimage.morphology import binary_dilation
+from scipy.signal import firwin, resample_poly
 from encoder.params_data import *
+from functools import lru_cache
+from math import gcd
 from pathlib import Path
 from typing import Optional, Union
 from warnings import warn
+import soundfile as sf
 import numpy as np
+import subprocess
 import librosa
-import struct
+import shutil
+import io
 
 try:
     import webrtcvad
@@ -39,38 +45,217 @@ def preprocess_wav(fpath_or_wav: Union[str, Path, np.ndarray],
     
     # Resample the wav if needed
     if source_sr is not None and source_sr != sampling_rate:
-        wav = librosa.resample(wav, source_sr, sampling_rate)
+        wav = resample(wav, source_sr, sampling_rate)
         
     # Apply the preprocessing: normalize volume and shorten long silences 
     if normalize:
         wav = normalize_volume(wav, audio_norm_target_dBFS, increase_only=True)
-    if webrtcvad and trim_silence:
+    if trim_silence and vad_available():
         wav = trim_long_silences(wav)
     
     return wav
 
 
-def wav_to_mel_spectrogram(wav):
+def decode_audio(data: bytes, target_sr: int = sampling_rate):
+    """
+    Decodes an audio file held in memory, e.g. an upload, without writing it to disk.
+
+    :param data: the contents of the file. Formats soundfile reads (wav, flac, ogg, mp3...)
+    are decoded in-process; others (webm, m4a...) are piped through ffmpeg if it's installed.
+    :param target_sr: the sampling rate the waveform is resampled to
+    :return: the waveform as a mono float32 numpy array, and its sampling rate (target_sr)
+    """
+    try:
+        wav, source_sr = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+    except RuntimeError:
+        # Not a format libsndfile knows
+        return _decode_with_ffmpeg(data, target_sr), target_sr
+    return resample(wav.mean(axis=1), source_sr, target_sr), target_sr
+
+
+def _decode_with_ffmpeg(data, target_sr):
+    if shutil.which("ffmpeg") is None:
+        raise ValueError("Unsupported audio format, install ffmpeg to read compressed formats")
+    process = subprocess.run(["ffmpeg", "-loglevel", "error", "-i", "pipe:0",
+                              "-f", "f32le", "-ac", "1", "-ar", str(target_sr), "pipe:1"],
+                             input=data, capture_output=True)
+    if process.returncode != 0:
+        raise ValueError("Could not decode the audio: %s" % process.stderr.decode(errors="replace").strip())
+    return np.frombuffer(process.stdout, dtype=np.float32)
+
+
+@lru_cache(maxsize=16)
+def _resampling_filter(up: int, down: int):
+    """
+    The anti-aliasing low-pass filter of a polyphase resampling by up/down, the one
+    resample_poly() would design on every call. Uploads come at a handful of rates, so
+    each filter is designed once.
+    """
+    max_rate = max(up, down)
+    return firwin(20 * max_rate + 1, 1. / max_rate, window=("kaiser", 5.0)).astype(np.float32)
+
+
+def resample(wav: np.ndarray, source_sr: int, target_sr: int = sampling_rate):
+    """
+    Resamples a waveform with a polyphase filter.
+
+    :return: the resampled waveform as float32, or the waveform itself if the rates match
+    """
+    divisor = gcd(int(source_sr), int(target_sr))
+    up, down = int(target_sr) // divisor, int(source_sr) // divisor
+    if up == down:
+        return wav
+    return resample_poly(wav, up, down, window=_resampling_filter(up, down)).astype(np.float32)
+
+
+class StreamingResampler:
+    """
+    Polyphase resampling of a waveform that arrives in chunks, e.g. from a microphone. The
+    output is the same as resample() of the whole waveform: the input is kept until the
+    filter has all the samples around an output sample, so the output lags the input by a
+    few samples (the filter's half length, in input samples).
+    """
+    def __init__(self, source_sr: int, target_sr: int = sampling_rate):
+        divisor = gcd(int(source_sr), int(target_sr))
+        self.up, self.down = int(target_sr) // divisor, int(source_sr) // divisor
+        self.filter = _resampling_filter(self.up, self.down) if self.up != self.down else None
+        # Input samples on either side of an output sample that the filter reaches
+        self.radius = (len(self.filter) // 2) // self.up + 1 if self.filter is not None else 0
+        self._buffer = np.zeros(0, dtype=np.float32)  # Input not fully used yet
+        self._skip = 0  # Output samples of the buffer already returned
+
+    def process(self, wav: np.ndarray, final: bool = False):
+        """
+        :param wav: the next input samples
+        :param final: whether this is the end of the input, to flush the buffered samples
+        :return: the output samples now available
+        """
+        if self.filter is None:
+            return np.asarray(wav, dtype=np.float32)
+        self._buffer = np.concatenate((self._buffer, np.asarray(wav, dtype=np.float32)))
+        output = resample_poly(self._buffer, self.up, self.down, window=self.filter).astype(np.float32)
+        # Without the end of the input, only the outputs the filter fully covers are final
+        n_ready = len(output) if final else max((len(self._buffer) - self.radius) * self.up // self.down, 0)
+        ready = output[self._skip:n_ready]
+
+        # Drop the input that no output to come depends on, by whole steps of <down> input
+        # samples so that the outputs stay aligned
+        drop = max(n_ready * self.down // self.up - self.radius - 1, 0) // self.down * self.down
+        self._buffer = self._buffer[drop:]
+        self._skip = max(n_ready, self._skip) - drop * self.up // self.down
+        return ready
+
+
+def wav_to_mel_spectrogram(wav, center=True):
     """
     Derives a mel spectrogram ready to be used by the encoder from a preprocessed audio waveform.
     Note: this not a log-mel spectrogram.
+
+    :param center: pad the waveform so that frame t is centered on sample t * hop length. If
+    False, frame t starts at that sample, for a section of a longer waveform.
     """
     frames = librosa.feature.melspectrogram(
-        wav,
-        sampling_rate,
+        y=wav,
+        sr=sampling_rate,
         n_fft=int(sampling_rate * mel_window_length / 1000),
         hop_length=int(sampling_rate * mel_window_step / 1000),
-        n_mels=mel_n_channels
+        n_mels=mel_n_channels,
+        center=center
     )
     return frames.astype(np.float32).T
 
 
-def trim_long_silences(wav):
+def vad_available(backend: str = vad_backend):
+    """Whether the voice activity detector can run, webrtcvad is an optional dependency"""
+    if backend == "webrtcvad":
+        return webrtcvad is not None
+    if backend == "spectral":
+        return True
+    raise ValueError(f"Unknown VAD backend: {backend}")
+
+
+def to_pcm16(wav: np.ndarray):
+    """
+    Converts a float waveform to 16-bit mono PCM, as a memoryview of its bytes. Slicing the
+    memoryview doesn't copy, so the VAD windows are views of the one buffer.
+    """
+    pcm = np.round(wav * int16_max).astype(np.int16)
+    return memoryview(pcm).cast("B")
+
+
+def webrtcvad_flags(wav: np.ndarray, vad=None):
+    """
+    Voice flags of webrtcvad (mode 3) for each VAD window of a waveform.
+
+    :param wav: the waveform as a numpy array of floats, a whole number of windows long
+    :param vad: the webrtcvad.Vad to use, a new one if None
+    :return: a numpy array of bools, one per window
+    """
+    samples_per_window = (vad_window_length * sampling_rate) // 1000
+    window_bytes = samples_per_window * 2
+    pcm_wave = to_pcm16(wav)
+    vad = vad or webrtcvad.Vad(mode=3)
+    n_windows = len(wav) // samples_per_window
+    return np.fromiter((vad.is_speech(pcm_wave[i * window_bytes:(i + 1) * window_bytes], sampling_rate)
+                        for i in range(n_windows)), dtype=bool, count=n_windows)
+
+
+def window_power_spectra(wav: np.ndarray):
+    """Power spectra of the Hann-windowed VAD windows of a waveform, one row per window"""
+    samples_per_window = (vad_window_length * sampling_rate) // 1000
+    windows = wav.reshape(-1, samples_per_window).astype(np.float64)
+    return np.abs(np.fft.rfft(windows * np.hanning(samples_per_window), axis=1)) ** 2
+
+
+def estimate_noise(spectra: np.ndarray):
+    """The noise power spectrum: mean spectrum of the quietest vad_noise_percentile % of the windows"""
+    energies = spectra.sum(axis=1)
+    quiet = energies <= np.percentile(energies, vad_noise_percentile)
+    return spectra[quiet].mean(axis=0) + np.finfo(np.float64).eps
+
+
+def spectral_flags(spectra: np.ndarray, noise: np.ndarray, threshold: float = vad_spectral_threshold):
+    """
+    Voice flags of the spectral detector: the statistical model VAD of the commented-out
+    vad() in tts_utils/logmmse.py, with a fixed noise spectrum and the maximum likelihood
+    estimate of the a priori SNR, so that every window is scored at once.
+
+    :param spectra: power spectra of the windows, from window_power_spectra()
+    :param noise: the noise power spectrum, from estimate_noise()
+    :return: a numpy array of bools, one per window
+    """
+    ksi_min = 10 ** (-25 / 10)
+    gamma = np.minimum(spectra / noise, 40)  # A posteriori SNR
+    ksi = np.maximum(gamma - 1, ksi_min)  # A priori SNR
+    log_likelihood_ratios = gamma * ksi / (1 + ksi) - np.log(1 + ksi)
+    return log_likelihood_ratios.mean(axis=1) >= threshold
+
+
+def detect_voice(wav: np.ndarray, backend: str = vad_backend):
+    """
+    Voice activity of each VAD window of a waveform.
+
+    :param wav: the waveform as a numpy array of floats, a whole number of windows long
+    :param backend: "webrtcvad" or "spectral", see params_data.py
+    :return: a numpy array of bools, one per window
+    """
+    if backend == "webrtcvad":
+        return webrtcvad_flags(wav)
+    if backend == "spectral":
+        if len(wav) == 0:
+            return np.zeros(0, dtype=bool)
+        spectra = window_power_spectra(wav)
+        return spectral_flags(spectra, estimate_noise(spectra))
+    raise ValueError(f"Unknown VAD backend: {backend}")
+
+
+def trim_long_silences(wav, backend: str = vad_backend):
     """
     Ensures that segments without voice in the waveform remain no longer than a 
     threshold determined by the VAD parameters in params.py.
 
     :param wav: the raw waveform as a numpy array of floats 
+    :param backend: the voice activity detector, "webrtcvad" or "spectral"
     :return: the same waveform with silences trimmed away (length <= original wav length)
     """
     # Compute the voice detection window size
@@ -79,17 +264,8 @@ def trim_long_silences(wav):
     # Trim the end of the audio to have a multiple of the window size
     wav = wav[:len(wav) - (len(wav) % samples_per_window)]
     
-    # Convert the float waveform to 16-bit mono PCM
-    pcm_wave = struct.pack("%dh" % len(wav), *(np.round(wav * int16_max)).astype(np.int16))
-    
     # Perform voice activation detection
-    voice_flags = []
-    vad = webrtcvad.Vad(mode=3)
-    for window_start in range(0, len(wav), samples_per_window):
-        window_end = window_start + samples_per_window
-        voice_flags.append(vad.is_speech(pcm_wave[window_start * 2:window_end * 2],
-                                         sample_rate=sampling_rate))
-    voice_flags = np.array(voice_flags)
+    voice_flags = detect_voice(wav, backend)
     
     # Smooth the voice detection with a moving average
     def moving_average(array, width):
@@ -0,0 +1,215 @@
+"""
+Streaming speaker enrollment: the embedding of a speaker computed while they speak, from
+audio that arrives in chunks (e.g. from a microphone) rather than from a whole recording.
+
+The audio goes through the steps of preprocess_wav() and embed_utterance(), made incremental:
+- resampling to the encoder's sampling rate (StreamingResampler)
+- volume normalization, with the gain of the audio received so far
+- voice activity detection (StreamingVoiceDetector), which drops the same long silences as
+  trim_long_silences() with a delay of a few VAD windows
+- partial utterances, embedded as soon as their partials_n_frames frames are voiced
+- the speaker embedding, the normalized running mean of the partial embeddings
+
+After each partial, the enrollment reports how much the embedding still changes, so that
+recording can stop as soon as it has converged.
+"""
+from encoder.params_data import *
+from encoder import audio
+from encoder.inference import compute_partial_slices
+from collections import deque
+import numpy as np
+
+
+class StreamingVoiceDetector:
+    """
+    trim_long_silences() for a waveform that arrives in chunks. A VAD window is kept or
+    dropped once the moving average and the dilation of the voice flags around it are
+    known, i.e. vad_moving_average_width // 2 + vad_max_silence_length // 2 windows later,
+    and with webrtcvad the windows kept are the same as with the whole waveform.
+    """
+    def __init__(self, backend=vad_backend):
+        """
+        :param backend: the voice activity detector, "webrtcvad" or "spectral". The spectral
+        detector estimates the noise from the audio received so far, so its first flags can
+        differ from trim_long_silences(), which estimates it from the whole waveform.
+        """
+        self.samples_per_window = (vad_window_length * sampling_rate) // 1000
+        self.backend = backend if audio.vad_available(backend) else None
+        self.vad = audio.webrtcvad.Vad(mode=3) if self.backend == "webrtcvad" else None
+        self._spectra = np.zeros((0, self.samples_per_window // 2 + 1))  # Spectral detector only
+        # Windows on either side of a window that its moving average and dilation reach,
+        # as laid out by trim_long_silences()
+        self.average_before, self.average_after = (vad_moving_average_width - 1) // 2, vad_moving_average_width // 2
+        dilation_width = vad_max_silence_length + 1
+        self.dilation_before, self.dilation_after = dilation_width - 1 - dilation_width // 2, dilation_width // 2
+
+        self._pending = np.zeros(0, dtype=np.float32)  # Samples short of a whole window
+        self._windows = deque()  # Windows not kept or dropped yet
+        self._flags = []  # Voice flag of every window
+        self._mask = []  # Smoothed voice flag of every window, as far as known
+        self._n_done = 0  # Windows kept or dropped
+
+    def detect_voice(self, wav):
+        """Voice flags of whole windows, see audio.detect_voice()"""
+        if self.backend == "webrtcvad":
+            return audio.webrtcvad_flags(wav, self.vad)
+        spectra = audio.window_power_spectra(wav)
+        self._spectra = np.concatenate((self._spectra, spectra))
+        return audio.spectral_flags(spectra, audio.estimate_noise(self._spectra))
+
+    def process(self, wav: np.ndarray, final: bool = False):
+        """
+        :param wav: the next samples of the normalized waveform
+        :param final: whether this is the end of the waveform. The samples short of a whole
+        window at the end are dropped, as trim_long_silences() does.
+        :return: the voiced samples now known, in order
+        """
+        if self.backend is None:
+            # Like preprocess_wav(), there is no trimming without a voice activity detector
+            return np.asarray(wav, dtype=np.float32)
+
+        self._pending = np.concatenate((self._pending, np.asarray(wav, dtype=np.float32)))
+        n_windows = len(self._pending) // self.samples_per_window
+        if n_windows > 0:
+            windows = self._pending[:n_windows * self.samples_per_window]
+            self._windows.extend(windows.reshape(n_windows, self.samples_per_window))
+            self._flags.extend(self.detect_voice(windows).tolist())
+        self._pending = self._pending[n_windows * self.samples_per_window:]
+
+        # Past the end of the waveform, the flags and the mask are zeros
+        n_flags = len(self._flags)
+        n_mask = n_flags if final else max(n_flags - self.average_after, 0)
+        for i in range(len(self._mask), n_mask):
+            window_flags = self._flags[max(i - self.average_before, 0):i + self.average_after + 1]
+            self._mask.append(bool(np.round(sum(window_flags) / vad_moving_average_width)))
+
+        n_done = len(self._mask) if final else max(len(self._mask) - self.dilation_after, 0)
+        voiced = []
+        for i in range(self._n_done, n_done):
+            window = self._windows.popleft()
+            if any(self._mask[max(i - self.dilation_before, 0):i + self.dilation_after + 1]):
+                voiced.append(window)
+        self._n_done = max(n_done, self._n_done)
+        return np.concatenate(voiced) if voiced else np.zeros(0, dtype=np.float32)
+
+
+class StreamingEnrollment:
+    def __init__(self, embed_frames_fn, source_sr=sampling_rate, stability_lag=4,
+                 stability_threshold=0.98, min_voiced_seconds=3.0):
+        """
+        :param embed_frames_fn: embeds a batch of partial utterances, i.e.
+        inference.embed_frames_batch with the encoder held
+        :param source_sr: sampling rate of the audio
+        :param stability_lag: the stability is the cosine similarity of the embedding to
+        the embedding of this many partial utterances earlier...
+        :param stability_threshold: ...and the embedding has converged once it's at least
+        this...
+        :param min_voiced_seconds: ...with at least this many seconds of speech
+        """
+        self.embed_frames_fn = embed_frames_fn
+        self.stability_lag = stability_lag
+        self.stability_threshold = stability_threshold
+        self.min_voiced_seconds = min_voiced_seconds
+        self.resampler = audio.StreamingResampler(source_sr, sampling_rate)
+        self.detector = StreamingVoiceDetector()
+
+        self.hop_length = int(sampling_rate * mel_window_step / 1000)
+        self.n_fft = int(sampling_rate * mel_window_length / 1000)
+        # Partial utterances overlap by half, as with embed_utterance()
+        self.partial_step = max(int(np.round(partials_n_frames * 0.5)), 1) * self.hop_length
+        self.partial_samples = (partials_n_frames - 1) * self.hop_length + self.n_fft
+
+        self.n_received = 0
+        self.n_voiced = 0
+        self._power_sum = 0.0
+        # Voiced samples from the start of the next partial utterance on. The voiced
+        # waveform is padded with n_fft // 2 zeros, as the mel spectrogram is centered.
+        self._voiced = np.zeros(self.n_fft // 2, dtype=np.float32)
+        self._embeds_sum = None
+        self._history = []  # The embedding after each partial utterance
+        self.n_partials = 0
+
+    def add_audio(self, wav: np.ndarray):
+        """
+        Adds the next chunk of audio, and embeds the partial utterances it completes.
+
+        :param wav: the samples as a numpy array of floats in [-1, 1], at source_sr
+        :return: the status, see get_status()
+        """
+        self._add_voiced(self._preprocess(self.resampler.process(wav)))
+        frames = []
+        while len(self._voiced) >= self.partial_samples:
+            frames.append(self._partial_frames(self._voiced[:self.partial_samples]))
+            self._voiced = self._voiced[self.partial_step:]
+        self._embed(frames)
+        return self.get_status()
+
+    def finish(self):
+        """
+        Ends the audio: embeds the last partial utterances, padded as in embed_utterance().
+
+        :return: the status, see get_status(), with the speaker embedding
+        """
+        self._add_voiced(self._preprocess(self.resampler.process(np.zeros(0), final=True), final=True))
+        if self.n_voiced == 0:
+            raise ValueError("No speech was detected")
+
+        # The partial utterances of the whole voiced waveform that aren't embedded yet
+        _, mel_slices = compute_partial_slices(self.n_voiced)
+        n_remaining = max(len(mel_slices) - self.n_partials, 0)
+        padded_len = (n_remaining - 1) * self.partial_step + self.partial_samples
+        voiced = np.pad(self._voiced, (0, max(padded_len - len(self._voiced), 0)))
+        self._embed([self._partial_frames(voiced[i * self.partial_step:][:self.partial_samples])
+                     for i in range(n_remaining)])
+        return self.get_status(include_embedding=True)
+
+    def embedding(self):
+        """The speaker embedding from the partial utterances so far, None before the first one"""
+        return self._history[-1] if self._history else None
+
+    def stability(self):
+        """Cosine similarity of the embedding to the embedding <stability_lag> partials earlier"""
+        if len(self._history) <= self.stability_lag:
+            return None
+        return float(np.dot(self._history[-1], self._history[-1 - self.stability_lag]))
+
+    def get_status(self, include_embedding=False):
+        stability = self.stability()
+        status = {
+            'received_seconds': self.n_received / sampling_rate,
+            'voiced_seconds': self.n_voiced / sampling_rate,
+            'partials': self.n_partials,
+            'stability': stability,
+            'converged': (stability is not None and stability >= self.stability_threshold
+                          and self.n_voiced >= self.min_voiced_seconds * sampling_rate)
+        }
+        if include_embedding:
+            embedding = self.embedding()
+            status['embedding'] = embedding.tolist() if embedding is not None else None
+        return status
+
+    def _preprocess(self, wav, final=False):
+        """Normalizes the volume with the gain of the audio so far, then drops long silences"""
+        self.n_received += len(wav)
+        self._power_sum += float(np.sum(np.square(wav, dtype=np.float64)))
+        if self._power_sum > 0:
+            dBFS_change = audio_norm_target_dBFS - 10 * np.log10(self._power_sum / self.n_received)
+            if dBFS_change > 0:
+                wav = wav * (10 ** (dBFS_change / 20))
+        return self.detector.process(wav, final=final)
+
+    def _add_voiced(self, voiced):
+        self.n_voiced += len(voiced)
+        self._voiced = np.concatenate((self._voiced, voiced.astype(np.float32)))
+
+    def _partial_frames(self, samples):
+        return audio.wav_to_mel_spectrogram(samples, center=False)
+
+    def _embed(self, frames):
+        if not frames:
+            return
+        partial_embeds = self.embed_frames_fn(np.array(frames))
+        for partial_embed in partial_embeds:
+            self._embeds_sum = partial_embed if self._embeds_sum is None else self._embeds_sum + partial_embed
+            self.n_partials += 1
+            self._history.append(self._embeds_sum / np.linalg.norm(self._embeds_sum, 2))
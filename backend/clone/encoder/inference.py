@@ -4,6 +4,7 @@ from encoder.audio import preprocess_wav   # We want to expose this function fro
 from matplotlib import cm
 from encoder import audio
 from pathlib import Path
+import model_export
 import numpy as np
 import torch
 
@@ -11,7 +12,7 @@ _model = None # type: SpeakerEncoder
 _device = None # type: torch.device
 
 
-def load_model(weights_fpath: Path, device=None):
+def load_model(weights_fpath: Path, device=None, optimized=True):
     """
     Loads the model in memory. If this function is not explicitely called, it will be run on the
     first call to embed_frames() with the default weights file.
@@ -20,25 +21,50 @@ def load_model(weights_fpath: Path, device=None):
     :param device: either a torch device or the name of a torch device (e.g. "cpu", "cuda"). The
     model will be loaded and will run on this device. Outputs will however always be on the cpu.
     If None, will default to your GPU if it"s available, otherwise your CPU.
+    :param optimized: on the CPU, use the quantized TorchScript encoder exported next to the
+    weights by export_models.py, if there is one (see model_export.py). Otherwise the weights
+    are mapped from the weights file converted by convert_checkpoints.py, if there is one.
     """
     # TODO: I think the slow loading of the encoder might have something to do with the device it
     #   was saved on. Worth investigating.
     global _model, _device
     if device is None:
         _device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    elif isinstance(device, str):
+    else:
         _device = torch.device(device)
+
+    if optimized and _device.type == "cpu":
+        artifact = model_export.load_artifact(weights_fpath, "encoder")
+        if artifact is not None:
+            _model = model_export.load_script(artifact)
+            print("Loaded optimized encoder \"%s\" trained to step %d" % (weights_fpath.name, artifact["step"]))
+            return
+
     _model = SpeakerEncoder(_device, torch.device("cpu"))
-    checkpoint = torch.load(weights_fpath, _device)
-    _model.load_state_dict(checkpoint["model_state"])
+    # The memory-mapped weights file converted by convert_checkpoints.py, if there is one
+    step = model_export.load_weights(_model, weights_fpath)
+    if step is None:
+        checkpoint = torch.load(weights_fpath, _device)
+        _model.load_state_dict(checkpoint["model_state"])
+        step = checkpoint["step"]
     _model.eval()
-    print("Loaded encoder \"%s\" trained to step %d" % (weights_fpath.name, checkpoint["step"]))
+    print("Loaded encoder \"%s\" trained to step %d" % (weights_fpath.name, step))
 
 
 def is_loaded():
     return _model is not None
 
 
+def get_model():
+    return _model
+
+
+def unload_model():
+    """Frees the model, load_model() must be called again before inference"""
+    global _model
+    _model = None
+
+
 def embed_frames_batch(frames_batch):
     """
     Computes embeddings for a batch of mel spectrogram.
@@ -51,7 +77,8 @@ def embed_frames_batch(frames_batch):
         raise Exception("Model was not loaded. Call load_model() before inference.")
 
     frames = torch.from_numpy(frames_batch).to(_device)
-    embed = _model.forward(frames).detach().cpu().numpy()
+    with torch.no_grad():
+        embed = _model.forward(frames).detach().cpu().numpy()
     return embed
 
 
@@ -109,9 +136,8 @@ def compute_partial_slices(n_samples, partial_utterance_n_frames=partials_n_fram
 
 def embed_utterance(wav, using_partials=True, return_partials=False, **kwargs):
     """
-    Computes an embedding for a single utterance.
+    Computes an embedding for a single utterance. See embed_speaker() for several utterances.
 
-    # TODO: handle multiple wavs to benefit from batching on GPU
     :param wav: a preprocessed (see audio.py) utterance waveform as a numpy array of float32
     :param using_partials: if True, then the utterance is split in partial utterances of
     <partial_utterance_n_frames> frames and the utterance embedding is computed from their
@@ -134,15 +160,7 @@ def embed_utterance(wav, using_partials=True, return_partials=False, **kwargs):
             return embed, None, None
         return embed
 
-    # Compute where to split the utterance into partials and pad if necessary
-    wave_slices, mel_slices = compute_partial_slices(len(wav), **kwargs)
-    max_wave_length = wave_slices[-1].stop
-    if max_wave_length >= len(wav):
-        wav = np.pad(wav, (0, max_wave_length - len(wav)), "constant")
-
-    # Split the utterance into partials
-    frames = audio.wav_to_mel_spectrogram(wav)
-    frames_batch = np.array([frames[s] for s in mel_slices])
+    frames_batch, wave_slices = _partial_frames(wav, **kwargs)
     partial_embeds = embed_frames_batch(frames_batch)
 
     # Compute the utterance embedding from the partial embeddings
@@ -154,8 +172,50 @@ def embed_utterance(wav, using_partials=True, return_partials=False, **kwargs):
     return embed
 
 
+def _partial_frames(wav, **kwargs):
+    """
+    Splits an utterance into partial utterances, see compute_partial_slices().
+
+    :return: the mel spectrograms of the partials as a numpy array of float32 of shape
+    (n_partials, partials_n_frames, mel_n_channels), and the wav slices of the partials
+    """
+    # Compute where to split the utterance into partials and pad if necessary
+    wave_slices, mel_slices = compute_partial_slices(len(wav), **kwargs)
+    max_wave_length = wave_slices[-1].stop
+    if max_wave_length >= len(wav):
+        wav = np.pad(wav, (0, max_wave_length - len(wav)), "constant")
+
+    # Split the utterance into partials
+    frames = audio.wav_to_mel_spectrogram(wav)
+    return np.array([frames[s] for s in mel_slices]), wave_slices
+
+
 def embed_speaker(wavs, **kwargs):
-    raise NotImplemented()
+    """
+    Computes the embedding of a speaker from several of their utterances. The partial
+    utterances of all the wavs go through the model as a single batch.
+
+    :param wavs: the preprocessed (see audio.py) utterance waveforms as numpy arrays of float32
+    :param kwargs: additional arguments to compute_partial_splits()
+    :return: the speaker embedding as a numpy array of float32 of shape (model_embedding_size,),
+    the normalized average of the utterance embeddings, and the utterance embeddings (computed
+    as in embed_utterance()) as a numpy array of float32 of shape (n_wavs, model_embedding_size)
+    """
+    if len(wavs) == 0:
+        raise ValueError("embed_speaker() needs at least one utterance")
+    frames = [_partial_frames(wav, **kwargs)[0] for wav in wavs]
+    partial_embeds = embed_frames_batch(np.concatenate(frames))
+
+    # Each utterance embedding is the normalized average of its partial embeddings
+    bounds = np.cumsum([0] + [len(f) for f in frames])
+    utterance_embeds = np.array([partial_embeds[start:end].mean(axis=0)
+                                 for start, end in zip(bounds[:-1], bounds[1:])])
+    utterance_embeds /= np.linalg.norm(utterance_embeds, axis=1, keepdims=True)
+
+    # The speaker embedding is the centroid of the utterance embeddings, on the unit sphere
+    raw_embed = utterance_embeds.mean(axis=0)
+    embed = raw_embed / np.linalg.norm(raw_embed, 2)
+    return embed, utterance_embeds
 
 
 def plot_embedding_as_heatmap(embed, ax=None, title="", shape=None, color_range=(0, 0.30)):
@@ -22,6 +22,14 @@ vad_window_length = 30  # In milliseconds
 vad_moving_average_width = 8
 # Maximum number of consecutive silent frames a segment can have.
 vad_max_silence_length = 6
+# Voice activity detector: "webrtcvad", or "spectral" for the NumPy detector of audio.py,
+# which doesn't need webrtcvad. The encoder was trained on audio trimmed with webrtcvad.
+vad_backend = "webrtcvad"
+# Spectral detector: a window is voiced when the mean log likelihood ratio of speech over
+# noise across its frequency bins is at least this...
+vad_spectral_threshold = 0.3
+# ...with the noise spectrum estimated from this percentage of the quietest windows.
+vad_noise_percentile = 10
 
 
 ## Audio volume normalization
@@ -0,0 +1,158 @@
+"""
+Exports the inference-optimized models (see model_export.py) next to the checkpoints of a
+models directory, then checks them against the fp32 models on the CPU:
+
+- encoder: cosine similarity of the embeddings of the same utterances
+- synthesizer: mean absolute difference of the mel spectrograms decoded from the same
+  texts with the same seed (in the synthesizer's mel scale, [-4, 4]), and the difference
+  in their number of frames
+- vocoder: max absolute difference of the waveforms vocoded from the same mel spectrogram
+  with the same seed, and their log-spectral distance in dB
+
+and the speedup of each. The loaders use the artifacts from then on.
+
+    python export_models.py saved_models
+"""
+from pathlib import Path
+import model_export
+import numpy as np
+import argparse
+import librosa
+import torch
+import time
+
+
+def _timed(fn, repeats):
+    """Runs fn once to warm up, then <repeats> times. Returns the last result and the mean time."""
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeats
+
+
+def log_spectral_distance(wav_a, wav_b, n_fft=800, hop_length=200):
+    """Root mean square difference of the log power spectra of two waveforms, in dB, averaged over frames"""
+    n = min(len(wav_a), len(wav_b))
+    spectra = [np.abs(librosa.stft(wav[:n], n_fft=n_fft, hop_length=hop_length)) ** 2 for wav in (wav_a, wav_b)]
+    diff = 10 * np.log10(spectra[0] + 1e-10) - 10 * np.log10(spectra[1] + 1e-10)
+    return float(np.mean(np.sqrt(np.mean(diff ** 2, axis=0))))
+
+
+def check_encoder(weights_fpath, repeats):
+    from encoder import inference as encoder
+    from encoder.params_data import partials_n_frames, mel_n_channels
+
+    frames = np.random.rand(10, partials_n_frames, mel_n_channels).astype(np.float32)
+    results = []
+    for optimized in (False, True):
+        encoder.load_model(weights_fpath, "cpu", optimized=optimized)
+        results.append(_timed(lambda: encoder.embed_frames_batch(frames), repeats))
+    (embeds, fp32_time), (embeds_opt, opt_time) = results
+
+    similarity = np.sum(embeds * embeds_opt, axis=1) / (
+        np.linalg.norm(embeds, axis=1) * np.linalg.norm(embeds_opt, axis=1))
+    return f"cosine similarity min {similarity.min():.5f}", fp32_time, opt_time
+
+
+def check_synthesizer(weights_fpath, texts, repeats):
+    from synthesizer.inference import Synthesizer
+
+    embed = np.random.rand(Synthesizer.hparams.speaker_embedding_size).astype(np.float32)
+    embed /= np.linalg.norm(embed)
+    results = []
+    for optimized in (False, True):
+        synthesizer = Synthesizer(weights_fpath, verbose=False, optimized=optimized)
+        synthesizer.device = torch.device("cpu")
+        synthesizer.load()
+
+        def synthesize():
+            # The prenet's dropout stays on at inference, seed it the same for both models
+            torch.manual_seed(0)
+            return synthesizer.synthesize_spectrograms(texts, [embed] * len(texts))
+        results.append(_timed(synthesize, repeats))
+    (mels, fp32_time), (mels_opt, opt_time) = results
+
+    diffs = [np.abs(a[:, :min(a.shape[1], b.shape[1])] - b[:, :min(a.shape[1], b.shape[1])]).mean()
+             for a, b in zip(mels, mels_opt)]
+    frames = sum(mel.shape[1] for mel in mels)
+    frames_opt = sum(mel.shape[1] for mel in mels_opt)
+    # The decoders may stop at different frames, compare the time per frame
+    metric = f"mel L1 {np.mean(diffs):.4f}, frames {frames} vs {frames_opt}"
+    return metric, fp32_time / frames, opt_time / frames_opt, mels[0]
+
+
+def check_vocoder(weights_fpath, mel, repeats):
+    from vocoder import inference as vocoder
+
+    results = []
+    for optimized in (False, True):
+        vocoder.load_model(weights_fpath, verbose=False, device=torch.device("cpu"), optimized=optimized)
+
+        def vocode():
+            torch.manual_seed(0)
+            return vocoder.infer_waveform(mel, progress_callback=lambda *args: None)
+        results.append(_timed(vocode, repeats))
+    (wav, fp32_time), (wav_opt, opt_time) = results
+
+    max_diff = np.abs(wav - wav_opt).max()
+    lsd = log_spectral_distance(wav, wav_opt)
+    return f"max diff {max_diff:.2e}, LSD {lsd:.3f} dB", fp32_time, opt_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Exports the inference-optimized models and checks them against the fp32 models",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("models_dir", type=Path, nargs="?", default=Path("saved_models"),
+                        help="Directory with encoder.pt, synthesizer.pt and vocoder.pt")
+    parser.add_argument("--models", nargs="+", default=["encoder", "synthesizer", "vocoder"],
+                        choices=["encoder", "synthesizer", "vocoder"], help="Models to export and check")
+    parser.add_argument("--no_export", action="store_true", help="Only check the existing artifacts")
+    parser.add_argument("--no_check", action="store_true", help="Only export")
+    parser.add_argument("--text", nargs="+", default=[
+        "The quick brown fox jumps over the lazy dog.",
+        "Optimized models should sound just like the original ones."
+    ], help="Texts synthesized for the synthesizer and vocoder checks")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per model")
+    args = parser.parse_args()
+
+    exporters = {
+        "encoder": model_export.export_encoder,
+        "synthesizer": model_export.export_synthesizer,
+        "vocoder": model_export.export_vocoder,
+    }
+    for name in args.models:
+        weights_fpath = args.models_dir / f"{name}.pt"
+        if not weights_fpath.exists():
+            print(f"⚠ {weights_fpath} not found, skipping the {name}")
+            continue
+        if not args.no_export:
+            fpath = exporters[name](weights_fpath)
+            print(f"✓ Exported {fpath} ({fpath.stat().st_size / 2 ** 20:.1f} MB, "
+                  f"fp32 checkpoint {weights_fpath.stat().st_size / 2 ** 20:.1f} MB)")
+    if args.no_check:
+        exit(0)
+
+    # Vocode a real spectrogram when there is a synthesizer, the vocoder is only meant for those
+    from vocoder import hparams as voc_hp
+    mel = np.random.uniform(-voc_hp.mel_max_abs_value, voc_hp.mel_max_abs_value,
+                            (voc_hp.num_mels, 200)).astype(np.float32)
+    rows = []
+    for name in args.models:
+        weights_fpath = args.models_dir / f"{name}.pt"
+        if not model_export.artifact_fpath(weights_fpath).exists():
+            continue
+        if name == "encoder":
+            rows.append((name, *check_encoder(weights_fpath, args.repeats)))
+        elif name == "synthesizer":
+            metric, fp32_time, opt_time, mel = check_synthesizer(weights_fpath, args.text, args.repeats)
+            rows.append((name, metric, fp32_time, opt_time))
+        else:
+            rows.append((name, *check_vocoder(weights_fpath, mel, args.repeats)))
+
+    print(f"\n{'model':<12} {'parity':<40} {'fp32 (s)':>10} {'optimized (s)':>14} {'speedup':>8}")
+    for name, metric, fp32_time, opt_time in rows:
+        unit = "/frame" if name == "synthesizer" else ""
+        print(f"{name:<12} {metric:<40} {fp32_time:>10.4f} {opt_time:>14.4f} {fp32_time / opt_time:>7.2f}x {unit}")
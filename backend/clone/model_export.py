@@ -0,0 +1,260 @@
+"""
+Inference-optimized artifacts of the voice cloning models, exported next to the
+checkpoints by export_models.py and preferred by the loaders when present:
+
+- encoder: the speaker encoder with dynamic int8 quantization of its LSTM and linear
+  layers, traced with TorchScript.
+- synthesizer: the Tacotron with dynamic int8 quantization of its linear layers and
+  recurrent cells. Its decoder loop stops per item on the stop token and can't be
+  traced, so the artifact holds the quantized weights, loaded into a quantized Tacotron.
+- vocoder: the Wave-RNN sample loop (WaveRNNSampler) compiled with TorchScript. The
+  loop reads the layer weights directly rather than calling the layers, so it isn't
+  quantized; the rest of the model is light next to it and stays in fp32.
+
+Dynamically quantized modules only run on the CPU, so the artifacts are only used when
+the models are loaded on the CPU. Each artifact records the size and modification time
+of the checkpoint it was exported from and is ignored once the checkpoint changes.
+
+An artifact is saved as <checkpoint>.optimized.pt, e.g. saved_models/encoder.optimized.pt.
+
+The fp32 weights of a checkpoint can also be converted (convert_checkpoints.py) to a
+weights file, without the pickled optimizer state: the tensors laid out one after the
+other in <checkpoint>.weights, indexed by <checkpoint>.weights.json. The loaders map it
+into memory instead of unpickling the checkpoint, and on the CPU the model's parameters
+are views of the mapping, so nothing is copied: loading is about instant, the weights
+are only read from disk as they're used, and server processes on the same host share
+the same physical pages. The mapping is copy-on-write, a process writing to a parameter
+gets a private copy of that page and never changes the file.
+"""
+from pathlib import Path
+import numpy as np
+import warnings
+import json
+import io
+import os
+import torch
+import torch.nn as nn
+
+
+QUANTIZED_MODULES = {nn.Linear, nn.LSTM, nn.LSTMCell, nn.GRU, nn.GRUCell}
+
+
+def artifact_fpath(weights_fpath):
+    return Path(weights_fpath).with_suffix(".optimized.pt")
+
+
+def _fingerprint(weights_fpath):
+    stat = os.stat(weights_fpath)
+    return f"{stat.st_size}-{int(stat.st_mtime)}"
+
+
+def quantize(model):
+    """Dynamic int8 quantization of the linear and recurrent layers of a model, in place"""
+    with warnings.catch_warnings():
+        # torch points eager mode quantization to torchao, which isn't a dependency here
+        warnings.simplefilter("ignore")
+        return torch.ao.quantization.quantize_dynamic(model, QUANTIZED_MODULES, dtype=torch.qint8,
+                                                      inplace=True)
+
+
+def save_artifact(weights_fpath, kind, **contents):
+    """
+    Saves the artifact of a checkpoint.
+
+    :param weights_fpath: the checkpoint the artifact was exported from
+    :param kind: "encoder", "synthesizer" or "vocoder"
+    :param contents: the exported model, under "script" (TorchScript) or "model_state"
+    """
+    fpath = artifact_fpath(weights_fpath)
+    torch.save({"kind": kind, "source": _fingerprint(weights_fpath), **contents}, fpath)
+    return fpath
+
+
+def load_artifact(weights_fpath, kind):
+    """
+    The artifact exported from a checkpoint, or None if there is none or it is outdated.
+    """
+    fpath = artifact_fpath(weights_fpath)
+    if not fpath.exists():
+        return None
+    try:
+        artifact = torch.load(fpath, map_location="cpu", weights_only=False)
+    except Exception as e:
+        print(f"⚠ Could not load {fpath.name}, using the fp32 model: {e}")
+        return None
+    if artifact.get("kind") != kind or artifact.get("source") != _fingerprint(weights_fpath):
+        print(f"⚠ {fpath.name} was not exported from the current {Path(weights_fpath).name}, "
+              f"using the fp32 model. Run export_models.py again.")
+        return None
+    return artifact
+
+
+def script_to_bytes(module):
+    buffer = io.BytesIO()
+    with warnings.catch_warnings():
+        # TorchScript is deprecated in favour of torch.export, which can't express these loops
+        warnings.simplefilter("ignore", FutureWarning)
+        torch.jit.save(module, buffer)
+    return buffer.getvalue()
+
+
+def load_script(artifact):
+    """The TorchScript module of an artifact, on the CPU"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        return torch.jit.load(io.BytesIO(artifact["script"]), map_location="cpu")
+
+
+WEIGHTS_FORMAT = 1
+WEIGHTS_ALIGNMENT = 64  # Bytes, every tensor starts at a multiple of it
+
+
+def weights_fpaths(weights_fpath):
+    """The data and index files of the weights file of a checkpoint"""
+    weights_fpath = Path(weights_fpath)
+    return weights_fpath.with_suffix(".weights"), weights_fpath.with_suffix(".weights.json")
+
+
+def save_weights(weights_fpath, state_dict, step=None):
+    """
+    Writes a state dict as the weights file of a checkpoint.
+
+    :param weights_fpath: the checkpoint the weights come from
+    :param state_dict: the model's state dict, of dense tensors
+    :param step: the training step of the checkpoint
+    :return: the paths to the data and index files
+    """
+    data_fpath, index_fpath = weights_fpaths(weights_fpath)
+    tensors = {}
+    offset = 0
+    # Write under another name first, a weights file that's being written is never loaded
+    with open(f"{data_fpath}.tmp", "wb") as f:
+        for name, tensor in state_dict.items():
+            array = tensor.detach().cpu().contiguous().numpy()
+            padding = -offset % WEIGHTS_ALIGNMENT
+            f.write(b"\0" * padding)
+            offset += padding
+            tensors[name] = {"dtype": array.dtype.name, "shape": list(array.shape), "offset": offset}
+            f.write(array.tobytes())
+            offset += array.nbytes
+    index = {"format": WEIGHTS_FORMAT, "source": _fingerprint(weights_fpath), "step": step,
+             "size": offset, "tensors": tensors}
+    with open(f"{index_fpath}.tmp", "w") as f:
+        json.dump(index, f, indent=1)
+    os.replace(f"{data_fpath}.tmp", data_fpath)
+    os.replace(f"{index_fpath}.tmp", index_fpath)
+    return data_fpath, index_fpath
+
+
+def map_weights(weights_fpath):
+    """
+    Maps the weights file of a checkpoint into memory.
+
+    :return: (state_dict, step), with the tensors of the state dict on the CPU and backed
+    by the mapping, or None if there is no weights file or it is outdated
+    """
+    data_fpath, index_fpath = weights_fpaths(weights_fpath)
+    if not data_fpath.exists() or not index_fpath.exists():
+        return None
+    try:
+        with open(index_fpath) as f:
+            index = json.load(f)
+        if index.get("format") != WEIGHTS_FORMAT or index.get("source") != _fingerprint(weights_fpath):
+            print(f"⚠ {data_fpath.name} was not converted from the current {Path(weights_fpath).name}, "
+                  f"unpickling the checkpoint. Run convert_checkpoints.py again.")
+            return None
+        if data_fpath.stat().st_size != index["size"]:
+            raise ValueError(f"expected {index['size']} bytes, the file has {data_fpath.stat().st_size}")
+
+        # A private mapping: the pages are shared with every other process mapping the file
+        # until written to, which the tensors being writable (for torch) allows
+        buffer = np.memmap(data_fpath, dtype=np.uint8, mode="c") if index["size"] else np.zeros(0, np.uint8)
+        state_dict = {}
+        for name, info in index["tensors"].items():
+            dtype = np.dtype(info["dtype"])
+            count = int(np.prod(info["shape"]))
+            array = buffer[info["offset"]:info["offset"] + count * dtype.itemsize].view(dtype)
+            state_dict[name] = torch.from_numpy(array.reshape(info["shape"]))
+    except Exception as e:
+        print(f"⚠ Could not map {data_fpath.name}, unpickling the checkpoint: {e}")
+        return None
+    return state_dict, index["step"]
+
+
+def load_weights(model, weights_fpath):
+    """
+    Loads the weights file of a checkpoint into a model. On the CPU the model's parameters
+    and buffers become views of the mapping; on other devices they're copied there.
+
+    :return: the training step of the checkpoint, or None if there is no up to date weights
+    file, in which case the model is left untouched
+    """
+    mapped = map_weights(weights_fpath)
+    if mapped is None:
+        return None
+    state_dict, step = mapped
+    device = next(model.parameters()).device
+    model.load_state_dict(state_dict, assign=device.type == "cpu")
+    return step
+
+
+def export_encoder(weights_fpath, batch_size=4):
+    """
+    Quantizes and traces the speaker encoder of a checkpoint and saves the artifact.
+
+    :param batch_size: batch size of the example input of the trace, the traced encoder
+    takes any batch size
+    :return: the path to the artifact
+    """
+    from encoder.model import SpeakerEncoder
+    from encoder.params_data import partials_n_frames, mel_n_channels
+
+    device = torch.device("cpu")
+    model = SpeakerEncoder(device, device)
+    checkpoint = torch.load(weights_fpath, device)
+    model.load_state_dict(checkpoint["model_state"])
+    model.eval()
+    quantize(model)
+
+    example = torch.rand(batch_size, partials_n_frames, mel_n_channels)
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        # The quantized LSTM's packed weights defeat the trace checker, parity is
+        # checked on the outputs by export_models.py instead
+        traced = torch.jit.trace(model, example, check_trace=False)
+    return save_artifact(weights_fpath, "encoder", step=checkpoint["step"],
+                         script=script_to_bytes(traced))
+
+
+def export_synthesizer(weights_fpath):
+    """
+    Quantizes the Tacotron of a checkpoint and saves the artifact.
+
+    :return: the path to the artifact
+    """
+    from synthesizer.inference import Synthesizer
+
+    synthesizer = Synthesizer(weights_fpath, verbose=False, optimized=False)
+    synthesizer.device = torch.device("cpu")
+    synthesizer.load()
+    model = quantize(synthesizer._model)
+    return save_artifact(weights_fpath, "synthesizer", step=model.get_step(),
+                         model_state=model.state_dict())
+
+
+def export_vocoder(weights_fpath):
+    """
+    Compiles the sample loop of the Wave-RNN of a checkpoint and saves the artifact.
+
+    :return: the path to the artifact
+    """
+    from vocoder import inference
+    from vocoder.models.fatchord_version import WaveRNNSampler
+
+    inference.load_model(weights_fpath, verbose=False, device=torch.device("cpu"), optimized=False)
+    model = inference.get_model()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        sampler = torch.jit.script(WaveRNNSampler(model))
+    return save_artifact(weights_fpath, "vocoder", step=model.get_step(),
+                         script=script_to_bytes(sampler))
@@ -1,6 +1,7 @@
 import librosa
 import librosa.filters
 import numpy as np
+import torch
 from scipy import signal
 from scipy.io import wavfile
 import soundfile as sf
@@ -98,6 +99,56 @@ def inv_mel_spectrogram(mel_spectrogram, hparams):
     else:
         return inv_preemphasis(_griffin_lim(S ** hparams.power, hparams), hparams.preemphasis, hparams.preemphasize)
 
+def inv_mel_spectrograms_fast(mel_spectrograms, hparams, n_iters=None, momentum=None, device=None):
+    """Converts a batch of mel spectrograms to waveforms with the fast Griffin-Lim of torch_griffin_lim()
+    
+    Much faster than inv_mel_spectrogram(): all spectrograms are inverted together in torch, with
+    momentum, so fewer iterations are needed for the same quality.
+    """
+    n_iters = hparams.griffin_lim_fast_iters if n_iters is None else n_iters
+    momentum = hparams.griffin_lim_momentum if momentum is None else momentum
+    device = device if device is not None else torch.device("cpu")
+    hop_size = get_hop_size(hparams)
+    
+    # Pad to the longest with silence
+    n_frames = [mel.shape[1] for mel in mel_spectrograms]
+    silence = -hparams.max_abs_value if hparams.symmetric_mels else 0.
+    batch = np.full((len(mel_spectrograms), hparams.num_mels, max(n_frames)), silence, dtype=np.float32)
+    for i, mel in enumerate(mel_spectrograms):
+        batch[i, :, :mel.shape[1]] = mel
+    
+    if hparams.signal_normalization:
+        D = _denormalize(batch, hparams)
+    else:
+        D = batch
+    mel_amp = torch.from_numpy(_db_to_amp(D + hparams.ref_level_db).astype(np.float32)).to(device)
+    S = torch.clamp(torch.matmul(_inv_mel_basis_torch(hparams, device), mel_amp), min=1e-10)  # Convert back to linear
+    
+    wavs = torch_griffin_lim(S ** hparams.power, hparams, n_iters, momentum).cpu().numpy()
+    return [inv_preemphasis(wav[:(frames - 1) * hop_size], hparams.preemphasis, hparams.preemphasize)
+            for wav, frames in zip(wavs, n_frames)]
+
+def torch_griffin_lim(S, hparams, n_iters, momentum=0.99):
+    """Fast Griffin-Lim (Perraudin et al., 2013) on a batch of magnitude spectrograms in torch
+    
+    S has shape (batch, n_fft // 2 + 1, frames). The STFT matches _stft() with librosa's defaults.
+    """
+    hop_size = get_hop_size(hparams)
+    window = _hann_window_torch(hparams.win_size, S.device)
+    stft = lambda y: torch.stft(y, hparams.n_fft, hop_size, hparams.win_size, window, center=True,
+                                pad_mode="constant", return_complex=True)
+    istft = lambda D: torch.istft(D, hparams.n_fft, hop_size, hparams.win_size, window, center=True)
+    
+    angles = torch.polar(torch.ones_like(S), 2 * np.pi * torch.rand_like(S))
+    rebuilt_prev = torch.zeros_like(angles)
+    for i in range(n_iters):
+        rebuilt = stft(istft(S * angles))
+        # Extrapolate from the previous estimate, then keep the phase only
+        angles = rebuilt - (momentum / (1 + momentum)) * rebuilt_prev
+        angles = angles / (angles.abs() + 1e-16)
+        rebuilt_prev = rebuilt
+    return istft(S * angles)
+
 def _lws_processor(hparams):
     import lws
     return lws.lws(hparams.n_fft, get_hop_size(hparams), fftsize=hparams.win_size, mode="speech")
@@ -107,7 +158,7 @@ def _griffin_lim(S, hparams):
     Based on https://github.com/librosa/librosa/issues/434
     """
     angles = np.exp(2j * np.pi * np.random.rand(*S.shape))
-    S_complex = np.abs(S).astype(np.complex)
+    S_complex = np.abs(S).astype(np.complex128)
     y = _istft(S_complex * angles, hparams)
     for i in range(hparams.griffin_lim_iters):
         angles = np.exp(1j * np.angle(_stft(y, hparams)))
@@ -165,9 +216,26 @@ def _mel_to_linear(mel_spectrogram, hparams):
         _inv_mel_basis = np.linalg.pinv(_build_mel_basis(hparams))
     return np.maximum(1e-10, np.dot(_inv_mel_basis, mel_spectrogram))
 
+_inv_mel_bases_torch = {}
+_hann_windows_torch = {}
+
+def _inv_mel_basis_torch(hparams, device):
+    global _inv_mel_basis
+    if device not in _inv_mel_bases_torch:
+        if _inv_mel_basis is None:
+            _inv_mel_basis = np.linalg.pinv(_build_mel_basis(hparams))
+        _inv_mel_bases_torch[device] = torch.from_numpy(_inv_mel_basis.astype(np.float32)).to(device)
+    return _inv_mel_bases_torch[device]
+
+def _hann_window_torch(win_size, device):
+    key = (win_size, device)
+    if key not in _hann_windows_torch:
+        _hann_windows_torch[key] = torch.hann_window(win_size, device=device)
+    return _hann_windows_torch[key]
+
 def _build_mel_basis(hparams):
     assert hparams.fmax <= hparams.sample_rate // 2
-    return librosa.filters.mel(hparams.sample_rate, hparams.n_fft, n_mels=hparams.num_mels,
+    return librosa.filters.mel(sr=hparams.sample_rate, n_fft=hparams.n_fft, n_mels=hparams.num_mels,
                                fmin=hparams.fmin, fmax=hparams.fmax)
 
 def _amp_to_db(x, hparams):
@@ -0,0 +1,191 @@
+import torch
+import torch.nn.functional as F
+from synthesizer.models.tacotron import Tacotron
+
+
+class DecodeRequest:
+    """A single text waiting for, or in, the decoder batch of a ContinuousBatchDecoder"""
+
+    def __init__(self, chars: torch.Tensor, speaker_embedding: torch.Tensor):
+        """
+        :param chars: the character ids of the text, of shape (T,)
+        :param speaker_embedding: the speaker embedding, of shape (speaker_embedding_size,)
+        """
+        self.chars = chars
+        self.speaker_embedding = speaker_embedding
+        self.frames = []
+        self.steps = 0
+        self.mel = None
+        self.error = None
+
+
+class ContinuousBatchDecoder:
+    """
+    Runs the Tacotron decoder over a batch whose rows change between steps: new
+    requests join the batch at any step boundary and finished requests leave it as
+    soon as their stop token fires. Many concurrent texts thus share one batched
+    decoder loop instead of each running their own.
+
+    This class only holds the batch state and advances it step by step with step();
+    driving it (and locking the model) is up to the caller.
+    """
+
+    def __init__(self, model: Tacotron, max_batch_size=16, max_steps=2000):
+        """
+        :param model: the loaded Tacotron model
+        :param max_batch_size: maximum number of rows decoded together
+        :param max_steps: maximum number of frames decoded for a single request
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_steps = max_steps
+        self.device = next(model.parameters()).device
+        self.rows = []
+
+        # Batched decoder state, row i belongs to self.rows[i]
+        self.chars = None
+        self.encoder_seq = None
+        self.encoder_seq_proj = None
+        self.prenet_in = None
+        self.context_vec = None
+        self.hidden_states = None
+        self.cell_states = None
+        self.cumulative = None
+        self.attention = None
+
+    def free_slots(self):
+        return self.max_batch_size - len(self.rows)
+
+    def is_idle(self):
+        return len(self.rows) == 0
+
+    def step(self, joining=()):
+        """
+        Adds the joining requests to the batch, then runs one decoder step for all rows.
+
+        :param joining: new DecodeRequests, at most free_slots() of them
+        :return: the requests that finished in this step, with their mel set to the
+        postnet output of shape (n_mels, frames)
+        """
+        model = self.model
+        r = model.r
+        with torch.no_grad():
+            model.eval()
+            for request in joining:
+                self._join(request)
+            if not self.rows:
+                return []
+
+            # The LSA keeps its state on the module, swap ours in. Every row's attention
+            # was initialised when it joined, so the step index passed is never 0.
+            attn_net = model.decoder.attn_net
+            attn_net.cumulative, attn_net.attention = self.cumulative, self.attention
+            # Rows are padded to the longest text in the batch, which changes as texts join
+            # and leave: the padding must not take any attention, or a row's output would
+            # depend on the other rows
+            attn_net.exclude_padding = True
+            try:
+                mel_frames, _, self.hidden_states, self.cell_states, self.context_vec, stop_tokens = \
+                    model.decoder(self.encoder_seq, self.encoder_seq_proj, self.prenet_in,
+                                  self.hidden_states, self.cell_states, self.context_vec, 1, self.chars)
+            finally:
+                attn_net.exclude_padding = False
+            self.cumulative, self.attention = attn_net.cumulative, attn_net.attention
+            self.prenet_in = mel_frames[:, :, -1]
+
+            stop = (stop_tokens[:, 0] > 0.5).tolist()
+            finished = []
+            for i, request in enumerate(self.rows):
+                request.frames.append(mel_frames[i])
+                t = request.steps * r  # Step index in a standalone decoder loop
+                request.steps += 1
+                if (stop[i] and t > 10) or t + r >= self.max_steps:
+                    finished.append(i)
+
+            if not finished:
+                return []
+            done = [self.rows[i] for i in finished]
+            self._evict(finished)
+
+            for request in done:
+                mels = torch.cat(request.frames, dim=1).unsqueeze(0)
+                postnet_out = model.postnet(mels)
+                request.mel = model.post_proj(postnet_out).transpose(1, 2)[0].cpu().numpy()
+                request.frames = []
+        return done
+
+    def fail_all(self, error):
+        """Drops every row from the batch, e.g. after a failed step"""
+        failed = self.rows
+        for request in failed:
+            request.error = error
+            request.frames = []
+        self.rows = []
+        self.chars = None
+        return failed
+
+    def _join(self, request: DecodeRequest):
+        model = self.model
+        chars = request.chars.to(self.device).unsqueeze(0)
+        speaker_embedding = request.speaker_embedding.to(self.device).unsqueeze(0)
+        encoder_seq = model.encoder(chars, speaker_embedding)
+        encoder_seq_proj = model.encoder_proj(encoder_seq)
+
+        # Initial decoder state of the new row, as in Tacotron.generate
+        t = chars.size(1)
+        zeros = lambda *size: torch.zeros(*size, device=self.device)
+        state = {
+            "chars": chars,
+            "encoder_seq": encoder_seq,
+            "encoder_seq_proj": encoder_seq_proj,
+            "prenet_in": zeros(1, model.n_mels),
+            "context_vec": zeros(1, model.encoder_dims + model.speaker_embedding_size),
+            "cumulative": zeros(1, t),
+            "attention": zeros(1, t),
+        }
+        hidden_states = (zeros(1, model.decoder_dims), zeros(1, model.lstm_dims), zeros(1, model.lstm_dims))
+        cell_states = (zeros(1, model.lstm_dims), zeros(1, model.lstm_dims))
+
+        if self.chars is None:
+            for name, value in state.items():
+                setattr(self, name, value)
+            self.hidden_states, self.cell_states = hidden_states, cell_states
+        else:
+            # Texts of different lengths are zero padded along the character axis
+            max_len = max(self.chars.size(1), t)
+            for name, value in state.items():
+                current = getattr(self, name)
+                if name in ("prenet_in", "context_vec"):
+                    setattr(self, name, torch.cat([current, value]))
+                else:
+                    setattr(self, name, torch.cat([_pad_chars(current, max_len), _pad_chars(value, max_len)]))
+            self.hidden_states = tuple(torch.cat(pair) for pair in zip(self.hidden_states, hidden_states))
+            self.cell_states = tuple(torch.cat(pair) for pair in zip(self.cell_states, cell_states))
+        self.rows.append(request)
+
+    def _evict(self, indices):
+        keep = [i for i in range(len(self.rows)) if i not in set(indices)]
+        self.rows = [self.rows[i] for i in keep]
+        if not self.rows:
+            self.chars = None
+            return
+
+        # Drop the padding that only the evicted rows needed
+        max_len = max(request.chars.numel() for request in self.rows)
+        keep = torch.tensor(keep, device=self.device)
+        for name in ("chars", "encoder_seq", "encoder_seq_proj", "cumulative", "attention"):
+            setattr(self, name, getattr(self, name)[keep, :max_len])
+        self.prenet_in = self.prenet_in[keep]
+        self.context_vec = self.context_vec[keep]
+        self.hidden_states = tuple(h[keep] for h in self.hidden_states)
+        self.cell_states = tuple(c[keep] for c in self.cell_states)
+
+
+def _pad_chars(x, length):
+    """Zero pads dim 1 (the character axis) of a batched tensor to the given length"""
+    pad = length - x.size(1)
+    if pad == 0:
+        return x
+    if x.dim() == 3:
+        return F.pad(x, (0, 0, 0, pad))
+    return F.pad(x, (0, pad))
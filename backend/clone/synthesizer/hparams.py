@@ -68,10 +68,24 @@ hparams = HParams(
         rescaling_max = 0.9,
         synthesis_batch_size = 16,                  # For vocoder preprocessing and inference.
 
+        ### Long text inference
+        synthesis_max_segment_chars = 150,          # Longer texts are split at sentence/clause boundaries and
+                                                    # the segments are decoded as one batch
+        synthesis_min_segment_chars = 20,           # Shorter segments are merged with their neighbours
+        synthesis_crossfade = 0.02,                 # Duration in seconds of the crossfade between segments
+
+        ### Streaming inference
+        tts_stream_block_frames = 20,               # Mel frames per block yielded by the streaming decoder
+        tts_stream_context_frames = 10,             # Frames before a block that the postnet sees
+        tts_stream_lookahead_frames = 10,           # Frames after a block that the postnet sees; a block is
+                                                    # ready this many frames after its end was decoded
+
         ### Mel Visualization and Griffin-Lim
         signal_normalization = True,
         power = 1.5,
         griffin_lim_iters = 60,
+        griffin_lim_fast_iters = 32,                # Iterations of the batched torch Griffin-Lim (draft quality)
+        griffin_lim_momentum = 0.99,                # Momentum of the fast Griffin-Lim, 0 for plain Griffin-Lim
 
         ### Audio processing options
         fmax = 7600,                                # Should not exceed (sample_rate // 2)
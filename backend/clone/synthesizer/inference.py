@@ -2,28 +2,35 @@ import torch
 from synthesizer import audio
 from synthesizer.hparams import hparams
 from synthesizer.models.tacotron import Tacotron
+from synthesizer.continuous_batching import ContinuousBatchDecoder, DecodeRequest
 from synthesizer.utils.symbols import symbols
 from synthesizer.utils.text import text_to_sequence
 from vocoder.display import simple_table
 from pathlib import Path
+import model_export
 from typing import Union, List
 import numpy as np
 import librosa
+import re
 
 
 class Synthesizer:
     sample_rate = hparams.sample_rate
     hparams = hparams
 
-    def __init__(self, model_fpath: Path, verbose=True):
+    def __init__(self, model_fpath: Path, verbose=True, optimized=True):
         """
         The model isn't instantiated and loaded in memory until needed or until load() is called.
 
         :param model_fpath: path to the trained model file
         :param verbose: if False, prints less information when using the model
+        :param optimized: on the CPU, load the int8 weights exported next to the model file by
+        export_models.py, if there are any (see model_export.py). Otherwise the fp32 weights
+        are mapped from the weights file converted by convert_checkpoints.py, if there is one.
         """
         self.model_fpath = model_fpath
         self.verbose = verbose
+        self.optimized = optimized
 
         # Check for GPU
         if torch.cuda.is_available():
@@ -61,12 +68,43 @@ class Synthesizer:
                                stop_threshold=hparams.tts_stop_threshold,
                                speaker_embedding_size=hparams.speaker_embedding_size).to(self.device)
 
-        self._model.load(self.model_fpath)
-        self._model.eval()
+        artifact = None
+        if self.optimized and self.device.type == "cpu":
+            artifact = model_export.load_artifact(self.model_fpath, "synthesizer")
+        if artifact is not None:
+            self._model.eval()
+            model_export.quantize(self._model)
+            self._model.load_state_dict(artifact["model_state"])
+        else:
+            # The memory-mapped weights file converted by convert_checkpoints.py, if there is one
+            if model_export.load_weights(self._model, self.model_fpath) is None:
+                self._model.load(self.model_fpath)
+            self._model.eval()
 
         if self.verbose:
             model_name = Path(self.model_fpath).name
-            print("Loaded synthesizer \"%s\" trained to step %d" % (model_name, self._model.state_dict()["step"]))
+            print("Loaded %ssynthesizer \"%s\" trained to step %d"
+                  % ("optimized " if artifact is not None else "", model_name, self._model.get_step()))
+
+    def get_model(self):
+        """
+        The Tacotron model, or None if it isn't loaded.
+        """
+        return self._model
+
+    def unload(self):
+        """
+        Frees the model, it's loaded again on next use or by load().
+        """
+        self._model = None
+
+    def get_step(self):
+        """
+        The training step of the loaded checkpoint. Loads the model if needed.
+        """
+        if not self.is_loaded():
+            self.load()
+        return self._model.get_step()
 
     def synthesize_spectrograms(self, texts: List[str],
                                 embeddings: Union[np.ndarray, List[np.ndarray]],
@@ -116,18 +154,143 @@ class Synthesizer:
             speaker_embeddings = torch.tensor(speaker_embeds).float().to(self.device)
 
             # Inference
-            _, mels, alignments = self._model.generate(chars, speaker_embeddings)
+            _, mels, alignments, lengths = self._model.generate(chars, speaker_embeddings)
             mels = mels.detach().cpu().numpy()
-            for m in mels:
-                # Trim silence from end of each spectrogram
-                while np.max(m[:, -1]) < hparams.tts_stop_threshold:
-                    m = m[:, :-1]
-                specs.append(m)
+            for m, length in zip(mels, lengths.tolist()):
+                # Cut each spectrogram to its own length, then trim silence from its end
+                specs.append(self.trim_silence(m[:, :length]))
 
         if self.verbose:
             print("\n\nDone.\n")
         return (specs, alignments) if return_alignments else specs
 
+    def synthesize_spectrogram_stream(self, text: str, embedding: np.ndarray, block_frames=None,
+                                      context_frames=None, lookahead_frames=None):
+        """
+        Streaming version of synthesize_spectrograms() for a single text: mel blocks are
+        yielded while the decoder is still running, so that vocoding can start early.
+
+        :param text: the text prompt to be synthesized
+        :param embedding: the speaker embedding, of shape (256,)
+        :param block_frames: frames per block, defaults to hparams.tts_stream_block_frames
+        :param context_frames: frames before a block that the postnet sees, defaults to
+        hparams.tts_stream_context_frames
+        :param lookahead_frames: frames after a block that the postnet sees, defaults to
+        hparams.tts_stream_lookahead_frames
+        :return: a generator of mel spectrogram blocks of shape (80, Mi). Concatenated, they
+        form the spectrogram with its trailing silence trimmed.
+        """
+        if not self.is_loaded():
+            self.load()
+
+        chars = text_to_sequence(text.strip(), hparams.tts_cleaner_names)
+        chars = torch.tensor([chars]).long().to(self.device)
+        speaker_embedding = torch.tensor(np.asarray(embedding)[None, ...]).float().to(self.device)
+
+        blocks = self._model.generate_stream(
+            chars, speaker_embedding,
+            block_frames=block_frames or hparams.tts_stream_block_frames,
+            context_frames=context_frames or hparams.tts_stream_context_frames,
+            lookahead_frames=lookahead_frames or hparams.tts_stream_lookahead_frames)
+
+        # Silent frames are held back until more voice follows, so the trailing silence
+        # is never yielded
+        silence = []
+        for block in blocks:
+            block = block[0].cpu().numpy()
+            voiced = np.flatnonzero(block.max(axis=0) >= hparams.tts_stop_threshold)
+            if len(voiced) == 0:
+                silence.append(block)
+                continue
+            yield np.concatenate(silence + [block[:, :voiced[-1] + 1]], axis=1)
+            silence = [block[:, voiced[-1] + 1:]]
+
+    def batch_decoder(self, max_batch_size=None):
+        """
+        Creates a decoder that batches texts from many concurrent callers, see
+        ContinuousBatchDecoder. Loads the model if needed.
+
+        :param max_batch_size: defaults to hparams.synthesis_batch_size
+        """
+        if not self.is_loaded():
+            self.load()
+        return ContinuousBatchDecoder(self._model, max_batch_size or hparams.synthesis_batch_size)
+
+    @staticmethod
+    def decode_request(text: str, embedding: np.ndarray):
+        """
+        Prepares a text and speaker embedding for a batch_decoder(). Once decoded, the
+        spectrogram should be passed through trim_silence().
+        """
+        chars = text_to_sequence(text.strip(), hparams.tts_cleaner_names)
+        return DecodeRequest(torch.tensor(chars).long(), torch.tensor(np.asarray(embedding)).float())
+
+    @staticmethod
+    def trim_silence(mel: np.ndarray):
+        """
+        Trims the silent frames from the end of a spectrogram output by the decoder.
+        """
+        voiced = np.flatnonzero(mel.max(axis=0) >= hparams.tts_stop_threshold)
+        return mel[:, :voiced[-1] + 1] if len(voiced) else mel
+
+    @staticmethod
+    def split_text(text: str, max_chars=None, min_chars=None):
+        """
+        Splits a text into segments at sentence boundaries, and overlong sentences further at
+        clause boundaries (or, failing that, between words). Segments that are too short for
+        Tacotron to align well are merged with their neighbours.
+
+        :param text: the text to split
+        :param max_chars: maximum segment length, defaults to hparams.synthesis_max_segment_chars
+        :param min_chars: minimum segment length, defaults to hparams.synthesis_min_segment_chars
+        :return: a list of segments, in order
+        """
+        max_chars = max_chars or hparams.synthesis_max_segment_chars
+        min_chars = min_chars or hparams.synthesis_min_segment_chars
+
+        pieces = []
+        for sentence in _sentence_re.split(text.strip()):
+            pieces.extend(_split_long(sentence.strip(), max_chars))
+        pieces = [p for p in pieces if p]
+
+        segments = []
+        for piece in pieces:
+            if segments and (len(segments[-1]) < min_chars or len(piece) < min_chars) \
+                    and len(segments[-1]) + len(piece) + 1 <= max_chars:
+                segments[-1] = f"{segments[-1]} {piece}"
+            else:
+                segments.append(piece)
+        return segments or [text]
+
+    @staticmethod
+    def join_segments(wavs: List[np.ndarray], crossfade=None):
+        """
+        Joins the waveforms of consecutive text segments with a short linear crossfade.
+
+        :param wavs: list of waveforms, in order
+        :param crossfade: crossfade duration in seconds, defaults to hparams.synthesis_crossfade
+        :return: the joined waveform
+        """
+        if crossfade is None:
+            crossfade = hparams.synthesis_crossfade
+        n_fade = int(crossfade * hparams.sample_rate)
+
+        total = sum(len(w) for w in wavs)
+        overlaps = [min(n_fade, len(a), len(b)) for a, b in zip(wavs[:-1], wavs[1:])]
+        out = np.zeros(total - sum(overlaps), dtype=np.float32)
+
+        pos = 0
+        for i, wav in enumerate(wavs):
+            wav = wav.astype(np.float32, copy=True)
+            if i > 0 and overlaps[i - 1]:
+                wav[:overlaps[i - 1]] *= np.linspace(0, 1, overlaps[i - 1], dtype=np.float32)
+                pos -= overlaps[i - 1]
+            if i < len(overlaps) and overlaps[i]:
+                wav[-overlaps[i]:] *= np.linspace(1, 0, overlaps[i], dtype=np.float32)
+            out[pos:pos + len(wav)] += wav
+            pos += len(wav)
+        return out
+
     @staticmethod
     def load_preprocess_wav(fpath):
         """
@@ -161,6 +324,47 @@ class Synthesizer:
         """
         return audio.inv_mel_spectrogram(mel, hparams)
 
+    @staticmethod
+    def griffin_lim_batch(mels: List[np.ndarray], n_iters=None):
+        """
+        Batched, much faster version of griffin_lim(): all mel spectrograms are inverted
+        together by a fast Griffin-Lim in torch. Good enough for drafts.
+        """
+        return audio.inv_mel_spectrograms_fast(mels, hparams, n_iters)
+
+
+_sentence_re = re.compile(r"(?<=[.!?;])\s+|\n+")
+_clause_re = re.compile(r"(?<=[,:])\s+|\s+(?=[-\u2013\u2014]\s)")
+
+
+def _split_long(text, max_chars):
+    """Splits text longer than max_chars at clause boundaries, then between words"""
+    if len(text) <= max_chars:
+        return [text]
+
+    pieces = []
+    for clause in _clause_re.split(text):
+        if len(clause) <= max_chars:
+            pieces.append(clause)
+            continue
+        line = ""
+        for word in clause.split():
+            if line and len(line) + len(word) + 1 > max_chars:
+                pieces.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        pieces.append(line)
+
+    # Put clauses back together as long as they fit
+    segments = [pieces[0]]
+    for piece in pieces[1:]:
+        if len(segments[-1]) + len(piece) + 1 <= max_chars:
+            segments[-1] = f"{segments[-1]} {piece}"
+        else:
+            segments.append(piece)
+    return segments
+
 
 def pad1d(x, max_len, pad_value=0):
     return np.pad(x, (0, max_len - len(x)), mode="constant", constant_values=pad_value)
@@ -211,6 +211,9 @@ class LSA(nn.Module):
         self.v = nn.Linear(attn_dim, 1, bias=False)
         self.cumulative = None
         self.attention = None
+        # Give the zero padding chars no attention at all rather than a score of 0, so a
+        # row attends as it would decoded alone (used by the continuous batch decoder)
+        self.exclude_padding = False
 
     def init_attention(self, encoder_seq_proj):
         device = next(self.parameters()).device  # use same device as parameters
@@ -231,7 +234,10 @@ class LSA(nn.Module):
         u = u.squeeze(-1)
 
         # Mask zero padding chars
-        u = u * (chars != 0).float()
+        if self.exclude_padding:
+            u = u.masked_fill(chars == 0, float("-inf"))
+        else:
+            u = u * (chars != 0).float()
 
         # Smooth Attention
         # scores = torch.sigmoid(u) / torch.sigmoid(u).sum(dim=1, keepdim=True)
@@ -414,7 +420,17 @@ class Tacotron(nn.Module):
 
         return mel_outputs, linear, attn_scores, stop_outputs
 
-    def generate(self, x, speaker_embedding=None, steps=2000):
+    def generate(self, x, speaker_embedding=None, steps=2000, pad_value=-4.):
+        """
+        Decodes a batch of texts. Each item stops as soon as its own stop token fires;
+        finished items are dropped from the decoder state, so the batch shrinks as
+        items finish and short texts don't keep the decoder running.
+
+        :param pad_value: fills the outputs past the end of each item (silence in the
+        default symmetric mel range)
+        :return: (mel_outputs, linear, attn_scores, lengths) where lengths holds the number
+        of frames generated for each item
+        """
         self.eval()
         device = next(self.parameters()).device  # use same device as parameters
 
@@ -442,38 +458,137 @@ class Tacotron(nn.Module):
         encoder_seq = self.encoder(x, speaker_embedding)
         encoder_seq_proj = self.encoder_proj(encoder_seq)
 
-        # Need a couple of lists for outputs
-        mel_outputs, attn_scores, stop_outputs = [], [], []
+        # Need a couple of lists for outputs, and the batch rows each output belongs to
+        mel_outputs, attn_scores, output_rows = [], [], []
+
+        # Rows of the original batch that are still being decoded
+        active = torch.arange(batch_size, device=device)
+        lengths = torch.zeros(batch_size, dtype=torch.long, device=device)
+        chars = x
+        prenet_in = go_frame
 
         # Run the decoder loop
         for t in range(0, steps, self.r):
-            prenet_in = mel_outputs[-1][:, :, -1] if t > 0 else go_frame
             mel_frames, scores, hidden_states, cell_states, context_vec, stop_tokens = \
             self.decoder(encoder_seq, encoder_seq_proj, prenet_in,
-                         hidden_states, cell_states, context_vec, t, x)
+                         hidden_states, cell_states, context_vec, t, chars)
             mel_outputs.append(mel_frames)
             attn_scores.append(scores)
-            stop_outputs.extend([stop_tokens] * self.r)
-            # Stop the loop when all stop tokens in batch exceed threshold
-            if (stop_tokens > 0.5).all() and t > 10: break
+            output_rows.append(active)
+            prenet_in = mel_frames[:, :, -1]
+
+            if t <= 10:
+                continue
+            finished = (stop_tokens > 0.5).squeeze(1)
+            if not finished.any():
+                continue
+            lengths[active[finished]] = t + self.r
+            if finished.all():
+                break
+
+            # Compact the batch: drop the finished rows from the decoder state
+            keep = ~finished
+            active = active[keep]
+            chars = chars[keep]
+            encoder_seq = encoder_seq[keep]
+            encoder_seq_proj = encoder_seq_proj[keep]
+            prenet_in = prenet_in[keep]
+            context_vec = context_vec[keep]
+            hidden_states = tuple(h[keep] for h in hidden_states)
+            cell_states = tuple(c[keep] for c in cell_states)
+            attn_net = self.decoder.attn_net
+            attn_net.cumulative = attn_net.cumulative[keep]
+            attn_net.attention = attn_net.attention[keep]
+        else:
+            # Items that never stopped run to the step limit
+            lengths[active] = len(mel_outputs) * self.r
 
-        # Concat the mel outputs into sequence
-        mel_outputs = torch.cat(mel_outputs, dim=2)
+        # Scatter the outputs of each step back to their rows in the batch
+        n_frames = len(mel_outputs) * self.r
+        mels = torch.full((batch_size, self.n_mels, n_frames), pad_value, device=device)
+        alignments = torch.zeros(batch_size, len(attn_scores), x.size(1), device=device)
+        for i, (rows, mel_frames, scores) in enumerate(zip(output_rows, mel_outputs, attn_scores)):
+            mels[rows, :, i * self.r:(i + 1) * self.r] = mel_frames
+            alignments[rows, i] = scores.squeeze(1)
 
         # Post-Process for Linear Spectrograms
-        postnet_out = self.postnet(mel_outputs)
+        postnet_out = self.postnet(mels)
         linear = self.post_proj(postnet_out)
 
 
         linear = linear.transpose(1, 2)
 
-        # For easy visualisation
-        attn_scores = torch.cat(attn_scores, 1)
-        stop_outputs = torch.cat(stop_outputs, 1)
-
         self.train()
 
-        return mel_outputs, linear, attn_scores
+        return mels, linear, alignments, lengths.cpu()
+
+    def generate_stream(self, x, speaker_embedding=None, steps=2000, block_frames=20,
+                        context_frames=10, lookahead_frames=10):
+        """
+        Streaming version of generate() for a single text. The postnet is run over a
+        sliding window, so each block of <block_frames> frames is yielded as soon as
+        <lookahead_frames> more frames have been decoded after it (or the decoder stops).
+        Each window includes <context_frames> already yielded frames on the left.
+
+        The decoder state, including the LSA attention, is kept in the generator, so
+        other calls to the model may run between two blocks.
+
+        :return: a generator of linear blocks of shape (1, fft_bins, frames)
+        """
+        device = next(self.parameters()).device  # use same device as parameters
+        attn_net = self.decoder.attn_net
+
+        with torch.no_grad():
+            self.eval()
+            batch_size, _  = x.size()
+            attn_hidden = torch.zeros(batch_size, self.decoder_dims, device=device)
+            rnn1_hidden = torch.zeros(batch_size, self.lstm_dims, device=device)
+            rnn2_hidden = torch.zeros(batch_size, self.lstm_dims, device=device)
+            hidden_states = (attn_hidden, rnn1_hidden, rnn2_hidden)
+            rnn1_cell = torch.zeros(batch_size, self.lstm_dims, device=device)
+            rnn2_cell = torch.zeros(batch_size, self.lstm_dims, device=device)
+            cell_states = (rnn1_cell, rnn2_cell)
+            prenet_in = torch.zeros(batch_size, self.n_mels, device=device)
+            context_vec = torch.zeros(batch_size, self.encoder_dims + self.speaker_embedding_size, device=device)
+
+            encoder_seq = self.encoder(x, speaker_embedding)
+            encoder_seq_proj = self.encoder_proj(encoder_seq)
+
+        # Decoded frames that may still be needed by the postnet, starting at frame <offset>
+        mels = torch.zeros(batch_size, self.n_mels, 0, device=device)
+        offset, emitted = 0, 0
+        cumulative = attention = None
+
+        for t in range(0, steps, self.r):
+            with torch.no_grad():
+                self.eval()
+                if t > 0:
+                    attn_net.cumulative, attn_net.attention = cumulative, attention
+                mel_frames, _, hidden_states, cell_states, context_vec, stop_tokens = \
+                self.decoder(encoder_seq, encoder_seq_proj, prenet_in,
+                             hidden_states, cell_states, context_vec, t, x)
+                cumulative, attention = attn_net.cumulative, attn_net.attention
+                prenet_in = mel_frames[:, :, -1]
+                mels = torch.cat([mels, mel_frames], dim=2)
+
+            done = ((stop_tokens > 0.5).all() and t > 10) or t + self.r >= steps
+            n_frames = offset + mels.size(2)
+            while emitted < n_frames and (done or n_frames - emitted >= block_frames + lookahead_frames):
+                end = n_frames if done else emitted + block_frames
+                lo = max(offset, emitted - context_frames)
+                hi = min(n_frames, end + lookahead_frames)
+                with torch.no_grad():
+                    postnet_out = self.postnet(mels[:, :, lo - offset:hi - offset])
+                    linear = self.post_proj(postnet_out).transpose(1, 2)
+                yield linear[:, :, emitted - lo:end - lo]
+                emitted = end
+
+                # Forget the frames that are out of reach of the next window
+                drop = max(offset, emitted - context_frames) - offset
+                mels = mels[:, :, drop:]
+                offset += drop
+            if done:
+                return
 
     def init_model(self):
         for p in self.parameters():
@@ -0,0 +1,137 @@
+"""
+Picks the fold size of batched Wave-RNN generation (the target and overlap arguments of
+WaveRNN.generate) for each input instead of a fixed target=8000, overlap=800.
+
+The sample loop runs once per timestep of a fold and the cost of a step grows much
+slower than the number of folds in the batch, so a short input cut into one or two folds
+leaves most of the step's work on overhead, while a long one cut into 8000 sample folds
+takes longer than necessary. How the cost of a step grows with the batch size depends on
+the machine (cores, torch threads, worker processes), so it is measured once with
+calibrate() and cached on disk.
+"""
+from vocoder.models.fatchord_version import WaveRNN
+from pathlib import Path
+import numpy as np
+import torch
+import json
+import time
+import os
+
+
+class FoldTuner:
+    def __init__(self, sample_rate, target_rtf=0.5, overlap_ratio=0.1, min_overlap=200,
+                 max_overlap=800, min_target=1000, max_target=16000):
+        """
+        :param sample_rate: sample rate of the vocoder
+        :param target_rtf: latency target, as seconds of generation per second of audio.
+        Among the fold sizes that meet it the largest one is used, as every fold boundary
+        is a crossfade; when none does, the fastest one.
+        :param overlap_ratio: overlap of a fold, relative to its target...
+        :param min_overlap: ...but at least this many samples, to warm up the RNN...
+        :param max_overlap: ...and at most this many
+        :param min_target: smallest target tried
+        :param max_target: largest target tried
+        """
+        self.sample_rate = sample_rate
+        self.target_rtf = target_rtf
+        self.overlap_ratio = overlap_ratio
+        self.min_overlap = min_overlap
+        self.max_overlap = max_overlap
+        self.targets = np.unique(np.geomspace(min_target, max_target, 24).astype(int))
+        self.batch_sizes = None
+        self.step_times = None
+
+    def is_calibrated(self):
+        return self.step_times is not None
+
+    def overlap(self, target):
+        return int(np.clip(target * self.overlap_ratio, self.min_overlap, self.max_overlap))
+
+    def calibrate(self, sample_fn, feat_dims, aux_dims, cache_fpath=None, cache_key="",
+                  batch_sizes=(1, 2, 4, 8, 16, 32, 64), steps=256):
+        """
+        Measures the time of one sample step for several batch sizes, or loads the
+        measurements from the cache.
+
+        :param sample_fn: the sample loop, e.g. WaveRNN.generate_samples
+        :param feat_dims: number of mel channels of the upsampled mels
+        :param aux_dims: number of channels of the aux features
+        :param cache_fpath: optional json file the measurements are cached in
+        :param cache_key: identifies the configuration (model, device, threads...) in the
+        cache, measurements of other configurations are kept
+        :param batch_sizes: the batch sizes measured
+        :param steps: number of sample steps timed per batch size
+        """
+        cache = {}
+        if cache_fpath is not None and Path(cache_fpath).exists():
+            try:
+                with open(cache_fpath) as f:
+                    cache = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠ Ignoring the fold calibration cache {cache_fpath}: {e}")
+        if cache_key in cache:
+            self.batch_sizes = np.array(cache[cache_key]["batch_sizes"])
+            self.step_times = np.array(cache[cache_key]["step_times"])
+            return
+
+        step_times = []
+        quiet = lambda *args: None
+        for batch_size in batch_sizes:
+            mels = torch.rand(batch_size, steps, feat_dims)
+            aux = torch.rand(batch_size, steps, aux_dims)
+            sample_fn(mels[:, :8], aux[:, :8], quiet)  # Warm-up
+            start = time.perf_counter()
+            sample_fn(mels, aux, quiet)
+            step_times.append((time.perf_counter() - start) / steps)
+        # A larger batch never makes a step cheaper, smooth out measurement noise
+        self.batch_sizes = np.array(batch_sizes)
+        self.step_times = np.maximum.accumulate(step_times)
+
+        if cache_fpath is not None:
+            cache[cache_key] = {"batch_sizes": self.batch_sizes.tolist(),
+                                "step_times": self.step_times.tolist()}
+            try:
+                with open(cache_fpath, "w") as f:
+                    json.dump(cache, f, indent=2)
+            except OSError as e:
+                print(f"⚠ Could not cache the fold calibration in {cache_fpath}: {e}")
+
+    def step_time(self, batch_size):
+        """Estimated time of one sample step, extrapolated linearly past the largest batch"""
+        sizes, times = self.batch_sizes, self.step_times
+        if batch_size <= sizes[-1]:
+            return float(np.interp(batch_size, sizes, times))
+        slope = (times[-1] - times[-2]) / (sizes[-1] - sizes[-2])
+        return float(times[-1] + slope * (batch_size - sizes[-1]))
+
+    def choose(self, total_lens):
+        """
+        Picks the target and overlap for a batch of inputs.
+
+        :param total_lens: length of each upsampled input, in samples
+        :return: (target, overlap)
+        """
+        if not self.is_calibrated():
+            raise Exception("FoldTuner.calibrate() must be called first")
+        budget = self.target_rtf * sum(total_lens) / self.sample_rate
+
+        best, fastest = None, None
+        for target in self.targets.tolist():
+            overlap = self.overlap(target)
+            n_folds = sum(WaveRNN.num_folds(total_len, target, overlap) for total_len in total_lens)
+            estimate = (target + 2 * overlap) * self.step_time(n_folds)
+            if fastest is None or estimate < fastest[0]:
+                fastest = (estimate, target, overlap)
+            if estimate <= budget:
+                best = (target, overlap)
+            # Beyond a single fold per input, larger targets only add padding
+            if n_folds == len(total_lens):
+                break
+        return best if best is not None else fastest[1:]
+
+
+def cache_key(model, num_threads, pool_size):
+    """Identifies a vocoder configuration in the calibration cache"""
+    device = next(model.parameters()).device
+    return f"{model.mode}-rnn{model.rnn_dims}-fc{model.fc1.out_features}-{device}-" \
+           f"cpus{os.cpu_count()}-threads{num_threads}-workers{pool_size}"
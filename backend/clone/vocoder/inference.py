@@ -1,12 +1,27 @@
 from vocoder.models.fatchord_version import WaveRNN
 from vocoder import hparams as hp
+from contextlib import nullcontext
+from functools import partial
+import model_export
+import numpy as np
 import torch
 
 
 _model = None   # type: WaveRNN
+_sampler = None # Compiled WaveRNNSampler of the model, see model_export.py
+_weights_fpath = None
+_pool = None    # type: VocoderPool
+_fold_tuner = None  # type: FoldTuner
 
-def load_model(weights_fpath, verbose=True):
-    global _model, _device
+def load_model(weights_fpath, verbose=True, device=None, optimized=True):
+    """
+    :param optimized: on the CPU, sample with the compiled sample loop exported next to
+    the weights by export_models.py, if there is one (see model_export.py)
+
+    The weights are mapped from the weights file converted by convert_checkpoints.py if
+    there is one, rather than unpickled from the checkpoint.
+    """
+    global _model, _device, _weights_fpath, _sampler
     
     if verbose:
         print("Building Wave-RNN")
@@ -25,40 +40,272 @@ def load_model(weights_fpath, verbose=True):
         mode=hp.voc_mode
     )
 
-    if torch.cuda.is_available():
-        _model = _model.cuda()
+    if device is not None:
+        _device = device
+    elif torch.cuda.is_available():
         _device = torch.device('cuda')
     else:
         _device = torch.device('cpu')
+    _model = _model.to(_device)
     
     if verbose:
         print("Loading model weights at %s" % weights_fpath)
-    checkpoint = torch.load(weights_fpath, _device)
-    _model.load_state_dict(checkpoint['model_state'])
+    # The memory-mapped weights file converted by convert_checkpoints.py, if there is one
+    if model_export.load_weights(_model, weights_fpath) is None:
+        checkpoint = torch.load(weights_fpath, _device)
+        _model.load_state_dict(checkpoint['model_state'])
     _model.eval()
+    _weights_fpath = weights_fpath
+    
+    _sampler = None
+    if optimized and _device.type == 'cpu':
+        artifact = model_export.load_artifact(weights_fpath, "vocoder")
+        if artifact is not None:
+            _sampler = model_export.load_script(artifact)
+            if verbose:
+                print("Using the optimized sample loop of %s" % model_export.artifact_fpath(weights_fpath))
 
 
 def is_loaded():
     return _model is not None
 
 
-def infer_waveform(mel, normalize=True,  batched=True, target=8000, overlap=800, 
-                   progress_callback=None):
+def get_model():
+    return _model
+
+
+def get_sampler():
+    return _sampler
+
+
+def unload_model():
+    """Frees the model and stops the pool, load_model() must be called again before inference"""
+    global _model, _sampler
+    stop_pool()
+    _model = None
+    _sampler = None
+
+
+def get_sample_fn():
+    """
+    The sample loop of generation (see WaveRNN.generate_samples): the pool's if there is
+    one, otherwise the model's, with the compiled sampler if one was loaded.
+    """
+    if _pool is not None:
+        return _pool.generate_samples
+    return partial(_model.generate_samples, sampler=_sampler)
+
+
+def start_pool(num_workers, threads_per_worker=1):
+    """
+    Moves Wave-RNN sampling to a pool of worker processes (see vocoder.parallel), so that
+    a batch of folds is sampled on several cores. The model must be loaded first; each
+    worker loads its own copy from the same checkpoint.
+    
+    :param num_workers: number of worker processes, stop_pool() is called for fewer than 2
+    :param threads_per_worker: torch threads of each worker
+    """
+    global _pool
+    if _model is None:
+        raise Exception("Please load Wave-RNN in memory before using it")
+    stop_pool()
+    if num_workers < 2:
+        return
+    from vocoder.parallel import VocoderPool
+    _pool = VocoderPool(_weights_fpath, num_workers, threads_per_worker)
+
+
+def stop_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+
+def pool_size():
+    return _pool.num_workers if _pool is not None else 0
+
+
+def get_step():
+    if _model is None:
+        raise Exception("Please load Wave-RNN in memory before using it")
+    return _model.get_step()
+
+
+def calibrate_folds(cache_fpath=None, target_rtf=0.5):
+    """
+    Times the sample loop for several batch sizes (or loads the timings from the cache),
+    after which infer_waveform() and infer_waveforms() pick target and overlap for each
+    input when these are not given. Call it again after start_pool().
+    
+    :param cache_fpath: optional json file the timings are cached in
+    :param target_rtf: latency target, as seconds of generation per second of audio
+    """
+    global _fold_tuner
+    if _model is None:
+        raise Exception("Please load Wave-RNN in memory before using it")
+    from vocoder.fold_tuning import FoldTuner, cache_key
+    
+    if _pool is not None:
+        key = cache_key(_model, _pool.threads_per_worker, _pool.num_workers)
+    else:
+        key = cache_key(_model, torch.get_num_threads(), 0)
+    key += "-optimized" if _sampler is not None else ""
+    generate_samples = get_sample_fn()
+    sample_fn = lambda mels, aux, callback: generate_samples(mels.to(_device), aux.to(_device), callback)
+    
+    tuner = FoldTuner(hp.sample_rate, target_rtf)
+    with torch.no_grad():
+        tuner.calibrate(sample_fn, hp.num_mels, hp.voc_res_out_dims, cache_fpath, key)
+    _fold_tuner = tuner
+
+
+def fold_params(n_frames):
+    """
+    The target and overlap used for mel spectrograms of the given lengths: picked by
+    the calibrated tuner (see calibrate_folds()), or the defaults 8000 and 800.
+    
+    :param n_frames: list of the number of frames of each mel spectrogram
+    :return: (target, overlap)
+    """
+    if _fold_tuner is None:
+        return 8000, 800
+    return _fold_tuner.choose([frames * hp.hop_length for frames in n_frames])
+
+
+def infer_waveform(mel, normalize=True,  batched=True, target=None, overlap=None, 
+                   progress_callback=None, fade_out=True):
     """
     Infers the waveform of a mel spectrogram output by the synthesizer (the format must match 
     that of the synthesizer!)
     
     :param normalize:  
     :param batched: 
-    :param target: 
-    :param overlap: 
+    :param target: samples per fold, picked by fold_params() if None
+    :param overlap: overlap between folds, picked by fold_params() if None
+    :param fade_out: if True, the end of the waveform is faded out
     :return: 
     """
     if _model is None:
         raise Exception("Please load Wave-RNN in memory before using it")
     
+    if target is None or overlap is None:
+        target, overlap = fold_params([mel.shape[1]])
     if normalize:
         mel = mel / hp.mel_max_abs_value
     mel = torch.from_numpy(mel[None, ...])
-    wav = _model.generate(mel, batched, target, overlap, hp.mu_law, progress_callback)
+    if batched:
+        return _model.generate_batch([mel], target, overlap, hp.mu_law, progress_callback, fade_out,
+                                     sample_fn=get_sample_fn())[0]
+    wav = _model.generate(mel, batched, target, overlap, hp.mu_law, progress_callback, fade_out,
+                          sampler=_sampler)
     return wav
+
+
+def infer_waveforms(mels, normalize=True, target=None, overlap=None, progress_callback=None,
+                    fade_out=True):
+    """
+    Batched version of infer_waveform() for several mel spectrograms (e.g. a batch from the
+    synthesizer, or the requests of several users): all of them are vocoded in a single
+    sample loop, which costs about as much as vocoding the longest one.
+    
+    :param mels: list of mel spectrograms, each of shape (n_mels, n_frames)
+    :return: list of waveforms, in the order of mels
+    """
+    if _model is None:
+        raise Exception("Please load Wave-RNN in memory before using it")
+    if len(mels) == 0:
+        return []
+    
+    if target is None or overlap is None:
+        target, overlap = fold_params([mel.shape[1] for mel in mels])
+    if normalize:
+        mels = [mel / hp.mel_max_abs_value for mel in mels]
+    mels = [torch.from_numpy(mel[None, ...]) for mel in mels]
+    return _model.generate_batch(mels, target, overlap, hp.mu_law, progress_callback, fade_out,
+                                 get_sample_fn())
+
+
+def infer_waveform_sections(mel, section_frames=100, context_frames=8, **kwargs):
+    """
+    Generator version of infer_waveform() for streaming: the mel spectrogram is vocoded
+    section by section and each section of the waveform is yielded as soon as it is
+    ready. Concatenating the sections gives a waveform of the same length as
+    infer_waveform(mel).
+    
+    :param mel: the mel spectrogram, of shape (n_mels, n_frames)
+    :param section_frames: number of mel frames per section
+    :param context_frames: number of mel frames of context on each side of a section
+    :param kwargs: additional arguments to infer_waveform()
+    :return: a generator of waveform sections as numpy arrays
+    """
+    return infer_waveform_stream([mel], section_frames, context_frames, **kwargs)
+
+
+def infer_waveform_stream(mel_blocks, section_frames=100, context_frames=8, lock=None, **kwargs):
+    """
+    Vocodes a mel spectrogram that arrives in blocks (e.g. from a streaming synthesizer).
+    A section is vocoded as soon as enough frames have arrived for it and its right
+    context, and the waveform sections are yielded in order.
+    
+    Each section is vocoded with <context_frames> extra frames on both sides, which
+    warm up the RNN and the de-emphasis filter and are then discarded. Consecutive
+    sections are joined with a short equal-power crossfade.
+    
+    :param mel_blocks: an iterable of mel spectrogram blocks, of shape (n_mels, frames)
+    :param section_frames: number of mel frames per section
+    :param context_frames: number of mel frames of context on each side of a section
+    :param lock: optional lock held while a section is vocoded, but not while waiting for
+    the next mel block, so that it doesn't cover the synthesizer producing the blocks
+    :param kwargs: additional arguments to infer_waveform()
+    :return: a generator of waveform sections as numpy arrays
+    """
+    hop = hp.hop_length
+    xfade_len = hop
+    assert context_frames >= 2, "The context must be longer than the crossfade"
+    t = np.linspace(-1, 1, xfade_len)
+    fade_in, fade_out = np.sqrt(0.5 * (1 + t)), np.sqrt(0.5 * (1 - t))
+    
+    # A short remainder is merged into the last section rather than vocoding a sliver,
+    # so a section is only cut once enough frames follow it
+    min_last = max(2, section_frames // 4)
+    
+    mel_blocks = iter(mel_blocks)
+    buffer = None  # Frames received and still needed, starting at frame <offset>
+    offset, start = 0, 0
+    tail = None
+    done = False
+    while not done:
+        block = next(mel_blocks, None)
+        if block is None:
+            done = True
+        else:
+            buffer = block if buffer is None else np.concatenate([buffer, block], axis=1)
+        if buffer is None:
+            continue
+        n_frames = offset + buffer.shape[1]
+        
+        while start < n_frames:
+            is_last = done and n_frames - start < section_frames + min_last
+            if not done and n_frames < start + section_frames + max(context_frames, min_last):
+                break
+            end = n_frames if is_last else start + section_frames
+            lo, hi = max(0, start - context_frames), min(n_frames, end + context_frames)
+            with lock if lock is not None else nullcontext():
+                wav = infer_waveform(buffer[:, lo - offset:hi - offset], fade_out=is_last, **kwargs)
+            
+            # Keep the section itself, plus the crossfade into the next section
+            section = wav[(start - lo) * hop:(end - lo) * hop + (0 if is_last else xfade_len)]
+            if tail is not None:
+                section = section.copy()
+                section[:xfade_len] = section[:xfade_len] * fade_in + tail * fade_out
+            if not is_last:
+                tail = section[-xfade_len:]
+                section = section[:-xfade_len]
+            yield section
+            start = end
+            
+            # Drop the frames that are out of reach of the next section
+            drop = max(offset, start - context_frames) - offset
+            buffer = buffer[:, drop:]
+            offset += drop
@@ -57,6 +57,17 @@ class Stretch2d(nn.Module):
         return x.view(b, c, h * self.y_scale, w * self.x_scale)
 
 
+def _gru_step(gi, h, w_hh, b_hh):
+    """GRUCell update from a precomputed input projection gi (gates in r, z, n order)"""
+    gh = torch.addmm(b_hh, h, w_hh)
+    i_r, i_z, i_n = gi.chunk(3, 1)
+    h_r, h_z, h_n = gh.chunk(3, 1)
+    r = torch.sigmoid(i_r + h_r)
+    z = torch.sigmoid(i_z + h_z)
+    n = torch.tanh(i_n + r * h_n)
+    return n + z * (h - n)
+
+
 class UpsampleNetwork(nn.Module):
     def __init__(self, feat_dims, upsample_scales, compute_dims,
                  res_blocks, res_out_dims, pad):
@@ -85,6 +96,68 @@ class UpsampleNetwork(nn.Module):
         return m.transpose(1, 2), aux.transpose(1, 2)
 
 
+class WaveRNNSampler(nn.Module):
+    """
+    The per-sample recurrence of a WaveRNN, for WaveRNN.generate_samples(): the weights
+    acting on the previous sample and on the recurrent states, pre-arranged for the
+    step, and the sample loop over a block of RAW timesteps. It can be compiled with
+    torch.jit.script (see model_export.py) so that the loop runs without the Python
+    interpreter.
+    """
+    def __init__(self, model):
+        super().__init__()
+        rnn_dims, fc_dims = model.rnn_dims, model.fc1.out_features
+        weights = {
+            'w_x': model.I.weight[:, 0],
+            'w_x_ih1': model.rnn1.weight_ih_l0 @ model.I.weight[:, 0],
+            'w_hh1': model.rnn1.weight_hh_l0.t(),
+            'b_hh1': model.rnn1.bias_hh_l0,
+            'w_ih2': model.rnn2.weight_ih_l0[:, :rnn_dims].t(),
+            'w_hh2': model.rnn2.weight_hh_l0.t(),
+            'b_hh2': model.rnn2.bias_hh_l0,
+            'w_fc1': model.fc1.weight[:, :rnn_dims].t(),
+            'w_fc2': model.fc2.weight[:, :fc_dims].t(),
+            'w_fc3': model.fc3.weight,
+            'b_fc3': model.fc3.bias,
+        }
+        for name, weight in weights.items():
+            self.register_buffer(name, weight.detach().contiguous())
+        self.n_classes = model.n_classes
+
+    @torch.jit.export
+    def step(self, x, h1, h2, i_cond, gi1_cond, gi2_cond, fc1_cond, fc2_cond):
+        """One timestep: the logits of the next sample and the new GRU states"""
+        x_in = torch.addcmul(i_cond, x, self.w_x)
+        h1 = _gru_step(torch.addcmul(gi1_cond, x, self.w_x_ih1), h1, self.w_hh1, self.b_hh1)
+
+        x = x_in + h1
+        h2 = _gru_step(torch.addmm(gi2_cond, x, self.w_ih2), h2, self.w_hh2, self.b_hh2)
+
+        x = x + h2
+        x = F.relu(torch.addmm(fc1_cond, x, self.w_fc1))
+        x = F.relu(torch.addmm(fc2_cond, x, self.w_fc2))
+        return F.linear(x, self.w_fc3, self.b_fc3), h1, h2
+
+    def forward(self, x, h1, h2, i_cond, gi1_cond, gi2_cond, fc1_cond, fc2_cond, rand):
+        """
+        Samples a block of RAW timesteps. The conditioning terms and the uniform noise
+        of the inverse CDF sampling are time-major, shape=(timesteps, batch, ...).
+
+        :return: the samples as a (timesteps, batch) tensor, and the last sample and
+        GRU states to carry over to the next block
+        """
+        output = torch.empty(rand.size(0), rand.size(1), device=rand.device)
+        for j in range(rand.size(0)):
+            logits, h1, h2 = self.step(x, h1, h2, i_cond[j], gi1_cond[j], gi2_cond[j],
+                                       fc1_cond[j], fc2_cond[j])
+            # Inverse CDF sampling, several times faster than torch.multinomial here
+            cdf = F.softmax(logits, dim=1).cumsum_(dim=1)
+            sample = torch.searchsorted(cdf, rand[j]).clamp_(max=self.n_classes - 1).float()
+            x = 2 * sample / (self.n_classes - 1.) - 1.
+            output[j] = x[:, 0]
+        return output, x, h1, h2
+
+
 class WaveRNN(nn.Module):
     def __init__(self, rnn_dims, fc_dims, bits, pad, upsample_factors,
                  feat_dims, compute_dims, res_out_dims, res_blocks,
@@ -150,15 +223,12 @@ class WaveRNN(nn.Module):
         x = F.relu(self.fc2(x))
         return self.fc3(x)
 
-    def generate(self, mels, batched, target, overlap, mu_law, progress_callback=None):
+    def generate(self, mels, batched, target, overlap, mu_law, progress_callback=None, fade_out=True,
+                 sampler=None):
         mu_law = mu_law if self.mode == 'RAW' else False
         progress_callback = progress_callback or self.gen_display
 
         self.eval()
-        output = []
-        start = time.time()
-        rnn1 = self.get_gru_cell(self.rnn1)
-        rnn2 = self.get_gru_cell(self.rnn2)
 
         with torch.no_grad():
             if torch.cuda.is_available():
@@ -173,74 +243,62 @@ class WaveRNN(nn.Module):
                 mels = self.fold_with_overlap(mels, target, overlap)
                 aux = self.fold_with_overlap(aux, target, overlap)
 
-            b_size, seq_len, _ = mels.size()
+            output = self.generate_samples(mels, aux, progress_callback, sampler=sampler)
 
-            if torch.cuda.is_available():
-                h1 = torch.zeros(b_size, self.rnn_dims).cuda()
-                h2 = torch.zeros(b_size, self.rnn_dims).cuda()
-                x = torch.zeros(b_size, 1).cuda()
-            else:
-                h1 = torch.zeros(b_size, self.rnn_dims).cpu()
-                h2 = torch.zeros(b_size, self.rnn_dims).cpu()
-                x = torch.zeros(b_size, 1).cpu()
-
-            d = self.aux_dims
-            aux_split = [aux[:, :, d * i:d * (i + 1)] for i in range(4)]
+            if batched:
+                output = self.xfade_and_unfold(output, target, overlap)
 
-            for i in range(seq_len):
+        output = self.finish_waveform(output[0], wave_len, mu_law, fade_out)
+        
+        self.train()
 
-                m_t = mels[:, i, :]
+        return output
 
-                a1_t, a2_t, a3_t, a4_t = (a[:, i, :] for a in aux_split)
+    def generate_batch(self, mels, target, overlap, mu_law, progress_callback=None, fade_out=True,
+                       sample_fn=None):
+        """
+        Batched generate() for several utterances: the folds of all mel spectrograms go
+        through a single sample loop and are then unfolded per utterance.
+
+        :param mels: list of mel spectrogram tensors, each of shape (1, n_mels, frames)
+        :param sample_fn: replaces generate_samples() for the sample loop, e.g.
+        VocoderPool.generate_samples to spread the folds over several processes
+        :return: list of waveforms as numpy arrays, in the order of mels
+        """
+        mu_law = mu_law if self.mode == 'RAW' else False
 
-                x = torch.cat([x, m_t, a1_t], dim=1)
-                x = self.I(x)
-                h1 = rnn1(x, h1)
+        self.eval()
 
-                x = x + h1
-                inp = torch.cat([x, a2_t], dim=1)
-                h2 = rnn2(inp, h2)
+        with torch.no_grad():
+            mel_folds, aux_folds, wave_lens = [], [], []
+            for mel in mels:
+                if torch.cuda.is_available():
+                    mel = mel.cuda()
+                else:
+                    mel = mel.cpu()
+                wave_lens.append((mel.size(-1) - 1) * self.hop_length)
+                mel = self.pad_tensor(mel.transpose(1, 2), pad=self.pad, side='both')
+                mel, aux = self.upsample(mel.transpose(1, 2))
+                mel_folds.append(self.fold_with_overlap(mel, target, overlap))
+                aux_folds.append(self.fold_with_overlap(aux, target, overlap))
 
-                x = x + h2
-                x = torch.cat([x, a3_t], dim=1)
-                x = F.relu(self.fc1(x))
+            sample_fn = sample_fn or self.generate_samples
+            output = sample_fn(torch.cat(mel_folds), torch.cat(aux_folds), progress_callback)
 
-                x = torch.cat([x, a4_t], dim=1)
-                x = F.relu(self.fc2(x))
+            fold_counts = [folds.size(0) for folds in mel_folds]
+            outputs = [self.xfade_and_unfold(folds, target, overlap)[0] for folds in output.split(fold_counts)]
 
-                logits = self.fc3(x)
+        wavs = [self.finish_waveform(output, wave_len, mu_law, fade_out)
+                for output, wave_len in zip(outputs, wave_lens)]
 
-                if self.mode == 'MOL':
-                    sample = sample_from_discretized_mix_logistic(logits.unsqueeze(0).transpose(1, 2))
-                    output.append(sample.view(-1))
-                    if torch.cuda.is_available():
-                        # x = torch.FloatTensor([[sample]]).cuda()
-                        x = sample.transpose(0, 1).cuda()
-                    else:
-                        x = sample.transpose(0, 1)
-
-                elif self.mode == 'RAW' :
-                    posterior = F.softmax(logits, dim=1)
-                    distrib = torch.distributions.Categorical(posterior)
-
-                    sample = 2 * distrib.sample().float() / (self.n_classes - 1.) - 1.
-                    output.append(sample)
-                    x = sample.unsqueeze(-1)
-                else:
-                    raise RuntimeError("Unknown model mode value - ", self.mode)
+        self.train()
 
-                if i % 100 == 0:
-                    gen_rate = (i + 1) / (time.time() - start) * b_size / 1000
-                    progress_callback(i, seq_len, b_size, gen_rate)
+        return wavs
 
-        output = torch.stack(output).transpose(0, 1)
+    def finish_waveform(self, output, wave_len, mu_law, fade_out=True):
+        """Decodes generated samples into the final waveform (as float64 numpy)"""
         output = output.cpu().numpy()
         output = output.astype(np.float64)
-        
-        if batched:
-            output = self.xfade_and_unfold(output, target, overlap)
-        else:
-            output = output[0]
 
         if mu_law:
             output = decode_mu_law(output, self.n_classes, False)
@@ -248,15 +306,81 @@ class WaveRNN(nn.Module):
             output = de_emphasis(output)
 
         # Fade-out at the end to avoid signal cutting out suddenly
-        fade_out = np.linspace(1, 0, 20 * self.hop_length)
         output = output[:wave_len]
-        output[-20 * self.hop_length:] *= fade_out
-        
-        self.train()
-
+        if fade_out:
+            fade_len = min(20 * self.hop_length, len(output))
+            output[len(output) - fade_len:] *= np.linspace(1, 0, fade_len)
         return output
 
 
+    def generate_samples(self, mels, aux, progress_callback=None, block_len=128, sampler=None):
+        """
+        The autoregressive sampling loop of generate().
+
+        Only the previous sample differs from one step to the next, so everything that
+        depends on the conditioning features alone - their share of the input layer, of
+        the first GRU's input projection (through the input layer), of the second GRU's
+        input projection and of the two FC layers - is computed up front for a block of
+        <block_len> timesteps in batched matmuls. Per sample, the loop is left with a
+        rank-1 update for the previous sample and the recurrent matmuls (WaveRNNSampler).
+
+        Samples are drawn from the softmax by inverse CDF sampling.
+
+        :param mels: upsampled mels, shape=(batch, timesteps, feat_dims)
+        :param aux: aux features, shape=(batch, timesteps, res_out_dims)
+        :param sampler: a WaveRNNSampler of this model compiled with TorchScript (see
+        model_export.py), used in RAW mode instead of an eager one
+        :return: the samples as a (batch, timesteps) tensor
+        """
+        progress_callback = progress_callback or self.gen_display
+        b_size, seq_len, _ = mels.size()
+        device = mels.device
+        rnn_dims, d = self.rnn_dims, self.aux_dims
+        fc_dims = self.fc1.out_features
+        if sampler is None or self.mode != 'RAW':
+            sampler = WaveRNNSampler(self)
+
+        output = torch.empty(b_size, seq_len, device=device)
+        h1 = torch.zeros(b_size, rnn_dims, device=device)
+        h2 = torch.zeros(b_size, rnn_dims, device=device)
+        x = torch.zeros(b_size, 1, device=device)
+
+        start = time.time()
+        for block_start in range(0, seq_len, block_len):
+            block_end = min(block_start + block_len, seq_len)
+            # Time-major, so that each step reads contiguous rows
+            m = mels[:, block_start:block_end].transpose(0, 1)
+            a1, a2, a3, a4 = (aux[:, block_start:block_end, d * i:d * (i + 1)].transpose(0, 1)
+                              for i in range(4))
+
+            # Conditioning-only terms for the whole block, with the biases folded in
+            i_cond = F.linear(torch.cat([m, a1], dim=2), self.I.weight[:, 1:], self.I.bias)
+            gi1_cond = F.linear(i_cond, self.rnn1.weight_ih_l0, self.rnn1.bias_ih_l0)
+            gi2_cond = F.linear(a2, self.rnn2.weight_ih_l0[:, rnn_dims:], self.rnn2.bias_ih_l0)
+            fc1_cond = F.linear(a3, self.fc1.weight[:, rnn_dims:], self.fc1.bias)
+            fc2_cond = F.linear(a4, self.fc2.weight[:, fc_dims:], self.fc2.bias)
+
+            if self.mode == 'RAW':
+                rand = torch.rand(block_end - block_start, b_size, 1, device=device)
+                samples, x, h1, h2 = sampler(x, h1, h2, i_cond, gi1_cond, gi2_cond,
+                                             fc1_cond, fc2_cond, rand)
+                output[:, block_start:block_end] = samples.t()
+
+            elif self.mode == 'MOL':
+                for j in range(block_end - block_start):
+                    logits, h1, h2 = sampler.step(x, h1, h2, i_cond[j], gi1_cond[j], gi2_cond[j],
+                                                  fc1_cond[j], fc2_cond[j])
+                    sample = sample_from_discretized_mix_logistic(logits.unsqueeze(0).transpose(1, 2))
+                    output[:, block_start + j] = sample.view(-1)
+                    x = sample.transpose(0, 1).to(device)
+            else:
+                raise RuntimeError("Unknown model mode value - ", self.mode)
+
+            gen_rate = block_end / (time.time() - start) * b_size / 1000
+            progress_callback(block_end - 1, seq_len, b_size, gen_rate)
+
+        return output
+
     def gen_display(self, i, seq_len, b_size, gen_rate):
         pbar = progbar(i, seq_len)
         msg = f'| {pbar} {i*b_size}/{seq_len*b_size} | Batch Size: {b_size} | Gen Rate: {gen_rate:.1f}kHz | '
@@ -292,12 +416,13 @@ class WaveRNN(nn.Module):
 
         Args:
             x (tensor)    : Upsampled conditioning features.
-                            shape=(1, timesteps, features)
+                            shape=(batch, timesteps, features)
             target (int)  : Target timesteps for each index of batch
             overlap (int) : Timesteps for both xfade and rnn warmup
 
         Return:
-            (tensor) : shape=(num_folds, target + 2 * overlap, features)
+            (tensor) : shape=(batch * num_folds, target + 2 * overlap, features),
+                       the folds of each sequence of the batch one after the other
 
         Details:
             x = [[h1, h2, ... hn]]
@@ -311,46 +436,40 @@ class WaveRNN(nn.Module):
                       [h7, h8, h9, h10]]
         '''
 
-        _, total_len, features = x.size()
-
-        # Calculate variables needed
-        num_folds = (total_len - overlap) // (target + overlap)
-        extended_len = num_folds * (overlap + target) + overlap
-        remaining = total_len - extended_len
+        batch_size, total_len, features = x.size()
+        num_folds = self.num_folds(total_len, target, overlap)
+        fold_len = target + 2 * overlap
+        step = target + overlap
 
         # Pad if some time steps poking out
-        if remaining != 0:
-            num_folds += 1
-            padding = target + 2 * overlap - remaining
-            x = self.pad_tensor(x, padding, side='after')
-
-        if torch.cuda.is_available():
-            folded = torch.zeros(num_folds, target + 2 * overlap, features).cuda()
-        else:
-            folded = torch.zeros(num_folds, target + 2 * overlap, features).cpu()
+        padding = (num_folds - 1) * step + fold_len - total_len
+        if padding > 0:
+            x = F.pad(x, (0, 0, 0, padding))
 
-        # Get the values for the folded tensor
-        for i in range(num_folds):
-            start = i * (target + overlap)
-            end = start + target + 2 * overlap
-            folded[i] = x[:, start:end, :]
+        # Strided view of the folds: (batch, num_folds, features, fold_len)
+        folded = x.unfold(1, fold_len, step)
+        return folded.transpose(2, 3).reshape(batch_size * num_folds, fold_len, features)
 
-        return folded
+    @staticmethod
+    def num_folds(total_len, target, overlap):
+        ''' Number of folds fold_with_overlap() cuts a sequence of total_len timesteps into '''
+        num_folds = (total_len - overlap) // (target + overlap)
+        extended_len = num_folds * (overlap + target) + overlap
+        return num_folds + (1 if total_len != extended_len else 0)
 
-    def xfade_and_unfold(self, y, target, overlap):
+    def xfade_and_unfold(self, y, target, overlap, batch_size=1):
 
-        ''' Applies a crossfade and unfolds into a 1d array.
+        ''' Applies a crossfade and unfolds into a 1d array per sequence.
 
         Args:
-            y (ndarry)    : Batched sequences of audio samples
-                            shape=(num_folds, target + 2 * overlap)
-                            dtype=np.float64
-            overlap (int) : Timesteps for both xfade and rnn warmup
+            y (tensor)       : Batched sequences of audio samples
+                               shape=(batch_size * num_folds, target + 2 * overlap)
+            overlap (int)    : Timesteps for both xfade and rnn warmup
+            batch_size (int) : Number of sequences folded into y
 
         Return:
-            (ndarry) : audio samples in a 1d array
-                       shape=(total_len)
-                       dtype=np.float64
+            (tensor) : audio samples, on the device and with the dtype of y
+                       shape=(batch_size, total_len)
 
         Details:
             y = [[seq1],
@@ -370,34 +489,23 @@ class WaveRNN(nn.Module):
         '''
 
         num_folds, length = y.shape
+        num_folds //= batch_size
         target = length - 2 * overlap
         total_len = num_folds * (target + overlap) + overlap
 
-        # Need some silence for the rnn warmup
+        # Equal power crossfade, preceded (followed) by some silence for the rnn warmup
         silence_len = overlap // 2
         fade_len = overlap - silence_len
-        silence = np.zeros((silence_len), dtype=np.float64)
-
-        # Equal power crossfade
-        t = np.linspace(-1, 1, fade_len, dtype=np.float64)
-        fade_in = np.sqrt(0.5 * (1 + t))
-        fade_out = np.sqrt(0.5 * (1 - t))
-
-        # Concat the silence to the fades
-        fade_in = np.concatenate([silence, fade_in])
-        fade_out = np.concatenate([fade_out, silence])
-
-        # Apply the gain to the overlap samples
-        y[:, :overlap] *= fade_in
-        y[:, -overlap:] *= fade_out
-
-        unfolded = np.zeros((total_len), dtype=np.float64)
-
-        # Loop to add up all the samples
-        for i in range(num_folds):
-            start = i * (target + overlap)
-            end = start + target + 2 * overlap
-            unfolded[start:end] += y[i]
+        t = torch.linspace(-1, 1, fade_len, dtype=y.dtype, device=y.device)
+        gain = torch.ones(length, dtype=y.dtype, device=y.device)
+        gain[:overlap] = F.pad(torch.sqrt(0.5 * (1 + t)), (silence_len, 0))
+        gain[-overlap:] = F.pad(torch.sqrt(0.5 * (1 - t)), (0, silence_len))
+
+        # Add up the staggered folds of each sequence in one scatter-add
+        starts = torch.arange(num_folds, device=y.device) * (target + overlap)
+        index = (starts[:, None] + torch.arange(length, device=y.device)).flatten()
+        unfolded = torch.zeros(batch_size, total_len, dtype=y.dtype, device=y.device)
+        unfolded.index_add_(1, index, (y * gain).reshape(batch_size, num_folds * length))
 
         return unfolded
 
@@ -0,0 +1,163 @@
+"""
+Process-parallel Wave-RNN sampling.
+
+The Wave-RNN sample loop is a long chain of small matmuls, so a single process keeps
+only about one core busy however many threads torch is given. A VocoderPool instead
+spreads the folds of a batch (see WaveRNN.fold_with_overlap) over persistent worker
+processes, each holding its own copy of the model and running the sample loop for its
+share of the folds. The caller unfolds the result as usual.
+
+The workers are plain subprocesses running this module, connected by a pair of pipes
+each. Unlike multiprocessing's spawn/forkserver start methods this never re-imports the
+server's __main__ module in the workers, and it needs no helper threads in the server
+process (which runs under eventlet).
+"""
+from multiprocessing.connection import Connection
+from pathlib import Path
+import subprocess
+import sys
+import os
+import numpy as np
+import torch
+
+
+class VocoderPool:
+    def __init__(self, weights_fpath, num_workers, threads_per_worker=1):
+        """
+        Starts the worker processes and waits until they have loaded the model.
+
+        :param weights_fpath: path to the Wave-RNN checkpoint, loaded once by each worker
+        :param num_workers: number of worker processes
+        :param threads_per_worker: torch threads of each worker
+        """
+        self.weights_fpath = str(weights_fpath)
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+        self._workers = [self._start_worker() for _ in range(num_workers)]
+        for worker in self._workers:
+            self._receive(worker)
+
+    def _start_worker(self):
+        task_r, task_w = os.pipe()
+        result_r, result_w = os.pipe()
+        env = dict(os.environ)
+        clone_dir = str(Path(__file__).resolve().parents[1])
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [clone_dir, env.get("PYTHONPATH")]))
+        process = subprocess.Popen(
+            [sys.executable, "-m", "vocoder.parallel", str(task_r), str(result_w),
+             self.weights_fpath, str(self.threads_per_worker)],
+            pass_fds=(task_r, result_w), env=env)
+        os.close(task_r)
+        os.close(result_w)
+        return process, Connection(task_w, readable=False), Connection(result_r, writable=False)
+
+    @staticmethod
+    def _receive(worker):
+        process, _, results = worker
+        try:
+            status, value = results.recv()
+        except EOFError:
+            raise RuntimeError(f"Vocoder worker {process.pid} exited with code {process.wait()}")
+        if status != "ok":
+            raise RuntimeError(f"Vocoder worker {process.pid} failed: {value}")
+        return value
+
+    def generate_samples(self, mels, aux, progress_callback=None):
+        """
+        Drop-in for WaveRNN.generate_samples(): the folds are split into contiguous
+        chunks, one per worker, and sampled concurrently. Not thread-safe, calls must
+        be serialised (e.g. by the model lock).
+
+        :param mels: upsampled mels, shape=(batch, timesteps, feat_dims)
+        :param aux: aux features, shape=(batch, timesteps, res_out_dims)
+        :param progress_callback: called once, when all workers are done
+        :return: the samples as a (batch, timesteps) tensor
+        """
+        self._restart_dead_workers()
+        chunks = list(zip(torch.tensor_split(mels.cpu(), self.num_workers),
+                          torch.tensor_split(aux.cpu(), self.num_workers)))
+        busy = []
+        for worker, (mel_chunk, aux_chunk) in zip(self._workers, chunks):
+            if mel_chunk.size(0) == 0:
+                break
+            worker[1].send((mel_chunk.numpy(), aux_chunk.numpy()))
+            busy.append(worker)
+
+        # Collect every result before raising, so that no reply is left in a pipe
+        outputs, error = [], None
+        for worker in busy:
+            try:
+                outputs.append(torch.from_numpy(self._receive(worker)))
+            except RuntimeError as e:
+                error = error or e
+        if error is not None:
+            raise error
+
+        if progress_callback is not None:
+            b_size, seq_len = mels.size(0), mels.size(1)
+            progress_callback(seq_len - 1, seq_len, b_size, 0.)
+        return torch.cat(outputs).to(mels.device)
+
+    def _restart_dead_workers(self):
+        for i, worker in enumerate(self._workers):
+            if worker[0].poll() is not None:
+                print(f"⚠ Vocoder worker {worker[0].pid} died, restarting it")
+                self._close_worker(worker)
+                self._workers[i] = self._start_worker()
+                self._receive(self._workers[i])
+
+    @staticmethod
+    def _close_worker(worker):
+        process, tasks, results = worker
+        try:
+            tasks.send(None)
+        except OSError:
+            pass
+        tasks.close()
+        results.close()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    def close(self):
+        """Stops the worker processes"""
+        for worker in self._workers:
+            self._close_worker(worker)
+        self._workers = []
+
+
+def _worker_main(task_fd, result_fd, weights_fpath, num_threads):
+    from vocoder import inference
+
+    results = Connection(result_fd, readable=False)
+    tasks = Connection(task_fd, writable=False)
+    try:
+        torch.set_num_threads(num_threads)
+        # Each worker needs its own random stream, torch's default seed is fixed
+        torch.manual_seed(int.from_bytes(os.urandom(8), "little") >> 1)
+        inference.load_model(weights_fpath, verbose=False, device=torch.device("cpu"))
+        generate_samples = inference.get_sample_fn()
+    except Exception as e:
+        results.send(("error", repr(e)))
+        return
+    results.send(("ok", None))
+
+    while True:
+        try:
+            task = tasks.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        try:
+            mels, aux = (torch.from_numpy(np.ascontiguousarray(x)) for x in task)
+            with torch.no_grad():
+                output = generate_samples(mels, aux, progress_callback=lambda *args: None)
+            results.send(("ok", output.numpy()))
+        except Exception as e:
+            results.send(("error", repr(e)))
+
+
+if __name__ == "__main__":
+    _worker_main(int(sys.argv[1]), int(sys.argv[2]), sys.argv[3], int(sys.argv[4]))
@@ -1,12 +1,16 @@
 
 import os
+import time
 import numpy as np
-import threading
 from pathlib import Path
 
+from tts.model_registry import ModelRegistry, module_nbytes
+from tts.speech_models import SpeechModels
+
 # Try imports, handle if components are missing
 try:
     from encoder import inference as encoder
+    from encoder.enrollment import StreamingEnrollment
     from synthesizer.inference import Synthesizer
     from vocoder import inference as vocoder
     MODULES_AVAILABLE = True
@@ -15,13 +19,29 @@ except ImportError as e:
     MODULES_AVAILABLE = False
 
 class VoiceCloningManager:
-    def __init__(self, models_dir="saved_models"):
+    def __init__(self, models_dir="saved_models", registry=None, models=None):
+        """
+        Args:
+            models_dir: Directory with encoder.pt, synthesizer.pt and vocoder.pt
+            registry: ModelRegistry the models are registered in (as 'encoder',
+                'synthesizer' and 'vocoder'), to be shared with other users of the models
+            models: SpeechModels running the synthesizer and vocoder, shared with the
+                other users of the models (its registry is then the one used)
+        """
         self.models_dir = Path(models_dir)
+        # Whether each model is available: registered, and loaded once successfully.
+        # The registry may unload it while idle and reloads it on demand.
         self.encoder_loaded = False
         self.synthesizer_loaded = False
         self.vocoder_loaded = False
         self.synthesizer = None
-        self.lock = threading.Lock()
+        if models is not None:
+            registry = models.registry
+        self.registry = registry if registry is not None else ModelRegistry()
+        # Runs the synthesizer and vocoder, through the server's schedulers and vocoder
+        # backends once it sets them up on it
+        self.models = models if models is not None else SpeechModels(self.registry)
+        self._model_versions = {}
         
         # New: Cloned voices persistence
         self.embeddings_dir = self.models_dir.parent / "saved_embeddings"
@@ -44,46 +64,47 @@ class VoiceCloningManager:
         self._load_models()
 
     def _load_models(self):
-        """Load all three models required for voice cloning"""
+        """
+        Register the three models required for voice cloning and load them concurrently.
+        Blocks until they're loaded, so under eventlet construct the manager on a native thread.
+        """
         try:
+            loaders = {}
+
             # Encoder
             enc_path = self.models_dir / "encoder.pt"
-            if enc_path.exists() and enc_path.stat().st_size > 1000:
-                print(f"Loading encoder from {enc_path}...")
-                encoder.load_model(enc_path)
-                self.encoder_loaded = True
-                print("✓ Encoder loaded successfully.")
-            else:
-                if enc_path.exists():
-                    print(f"⚠ Encoder file exists but is too small ({enc_path.stat().st_size} bytes)")
-                else:
-                    print(f"⚠ Encoder model not found at {enc_path}")
+            if self._check_model_file("Encoder", enc_path):
+                self.registry.register('encoder', lambda: self._load_module(encoder, enc_path),
+                                       unload_fn=lambda module: module.unload_model(),
+                                       size_fn=lambda module: module_nbytes(module.get_model()))
+                loaders['encoder'] = ("Encoder", enc_path)
             
             # Synthesizer
             syn_path = self.models_dir / "synthesizer.pt"
-            if syn_path.exists() and syn_path.stat().st_size > 1000:
-                print(f"Loading synthesizer from {syn_path}...")
+            if self._check_model_file("Synthesizer", syn_path):
                 self.synthesizer = Synthesizer(syn_path)
-                self.synthesizer_loaded = True
-                print("✓ Synthesizer loaded successfully.")
-            else:
-                if syn_path.exists():
-                    print(f"⚠ Synthesizer file exists but is too small ({syn_path.stat().st_size} bytes)")
-                else:
-                    print(f"⚠ Synthesizer model not found at {syn_path}")
+                self.registry.register('synthesizer', self._load_synthesizer,
+                                       unload_fn=lambda synthesizer: synthesizer.unload(),
+                                       size_fn=lambda synthesizer: module_nbytes(synthesizer.get_model()))
+                loaders['synthesizer'] = ("Synthesizer", syn_path)
 
             # Vocoder
             voc_path = self.models_dir / "vocoder.pt"
-            if voc_path.exists() and voc_path.stat().st_size > 1000:
-                print(f"Loading vocoder from {voc_path}...")
-                vocoder.load_model(voc_path)
-                self.vocoder_loaded = True
-                print("✓ Vocoder loaded successfully.")
-            else:
-                if voc_path.exists():
-                    print(f"⚠ Vocoder file exists but is too small ({voc_path.stat().st_size} bytes)")
-                else:
-                    print(f"⚠ Vocoder model not found at {voc_path}")
+            if self._check_model_file("Vocoder", voc_path):
+                self.registry.register('vocoder', lambda: self._load_module(vocoder, voc_path),
+                                       unload_fn=lambda module: module.unload_model(),
+                                       size_fn=lambda module: module_nbytes(module.get_model(), module.get_sampler()))
+                loaders['vocoder'] = ("Vocoder", voc_path)
+
+            for label, path in loaders.values():
+                print(f"Loading {label.lower()} from {path}...")
+            errors = self.registry.load_concurrently(list(loaders))
+            for name, (label, path) in loaders.items():
+                if name in errors:
+                    print(f"✗ {label} failed to load: {errors[name]}")
+                    continue
+                setattr(self, f"{name}_loaded", True)
+                print(f"✓ {label} loaded successfully.")
             
             # Summary
             if self.encoder_loaded and self.synthesizer_loaded and self.vocoder_loaded:
@@ -97,6 +118,27 @@ class VoiceCloningManager:
             import traceback
             traceback.print_exc()
 
+    @staticmethod
+    def _check_model_file(label, path):
+        """Whether a checkpoint exists and isn't a placeholder"""
+        if path.exists() and path.stat().st_size > 1000:
+            return True
+        if path.exists():
+            print(f"⚠ {label} file exists but is too small ({path.stat().st_size} bytes)")
+        else:
+            print(f"⚠ {label} model not found at {path}")
+        return False
+
+    @staticmethod
+    def _load_module(module, weights_fpath):
+        """Registry loader for the encoder and vocoder, which keep their model in the module"""
+        module.load_model(weights_fpath)
+        return module
+
+    def _load_synthesizer(self):
+        self.synthesizer.load()
+        return self.synthesizer
+
     def clone_voice(self, audio_data, sample_rate=16000):
         """
         Process audio data to create a speaker embedding.
@@ -124,7 +166,8 @@ class VoiceCloningManager:
                 preprocessed_wav = encoder.preprocess_wav(audio_data, source_sr=sample_rate)
             
             # Generate embedding
-            embed = encoder.embed_utterance(preprocessed_wav)
+            with self.registry.use('encoder'):
+                embed = encoder.embed_utterance(preprocessed_wav)
             
             return {
                 "embedding": embed.tolist(), 
@@ -137,13 +180,75 @@ class VoiceCloningManager:
             traceback.print_exc()
             return {"error": str(e), "success": False}
 
-    def synthesize(self, text, embedding_list):
+    def clone_speaker(self, audio_list, sample_rate=16000):
+        """
+        Create a speaker embedding from several recordings of the same voice. Their
+        partial utterances are embedded in one batch, see encoder.embed_speaker.
+        
+        Args:
+            audio_list: List of numpy arrays of audio samples, or of file paths
+            sample_rate: Sample rate of the numpy arrays
+            
+        Returns:
+            dict with 'embedding' (the speaker centroid), 'utterance_embeddings',
+            'utterance_similarity' (cosine similarity of each recording to the centroid,
+            low for a recording of someone else or of noise), 'success', and optionally
+            'is_mock' keys
+        """
+        if not self.encoder_loaded or not MODULES_AVAILABLE:
+            print("⚠ Encoder model not loaded. Returning MOCK embedding for demonstration.")
+            mock_embedding = np.random.uniform(-0.1, 0.1, 256).tolist()
+            return {"embedding": mock_embedding, "utterance_embeddings": [mock_embedding] * len(audio_list),
+                    "utterance_similarity": [1.0] * len(audio_list), "success": True, "is_mock": True}
+        
+        try:
+            wavs = [encoder.preprocess_wav(audio) if isinstance(audio, (str, Path))
+                    else encoder.preprocess_wav(audio, source_sr=sample_rate)
+                    for audio in audio_list]
+            
+            with self.registry.use('encoder'):
+                embed, utterance_embeds = encoder.embed_speaker(wavs)
+            
+            return {
+                "embedding": embed.tolist(),
+                "utterance_embeddings": utterance_embeds.tolist(),
+                "utterance_similarity": (utterance_embeds @ embed).tolist(),
+                "success": True,
+                "is_mock": False
+            }
+        except Exception as e:
+            print(f"✗ Error in clone_speaker: {e}")
+            import traceback
+            traceback.print_exc()
+            return {"error": str(e), "success": False}
+
+    def start_enrollment(self, sample_rate=16000, **kwargs):
+        """
+        Start enrolling a voice from live audio, see encoder.enrollment.
+        
+        Args:
+            sample_rate: Sample rate of the audio that will be added
+            kwargs: Convergence settings of encoder.enrollment.StreamingEnrollment
+            
+        Returns:
+            StreamingEnrollment, or None when the encoder isn't loaded
+        """
+        if not self.encoder_loaded or not MODULES_AVAILABLE:
+            return None
+        
+        def embed_frames(frames):
+            with self.registry.use('encoder'):
+                return encoder.embed_frames_batch(frames)
+        return StreamingEnrollment(embed_frames, source_sr=sample_rate, **kwargs)
+
+    def synthesize(self, text, embedding_list, vocoder_name=None):
         """
         Synthesize speech from text and embedding.
         
         Args:
             text: Text to synthesize
             embedding_list: Speaker embedding as a list/array
+            vocoder_name: Name of the vocoder backend, None for the default
             
         Returns:
             tuple: (generated_wav, error_message)
@@ -165,14 +270,18 @@ class VoiceCloningManager:
         try:
             embed = np.array(embedding_list)
             
-            # Synthesizer - generate mel spectrogram
-            print(f"Synthesizing text: '{text[:50]}...'")
-            specs = self.synthesizer.synthesize_spectrograms([text], [embed])
-            spec = specs[0]
+            # Synthesizer - generate mel spectrograms. Long texts are split into
+            # sentences that are decoded as one batch.
+            segments = Synthesizer.split_text(text)
+            print(f"Synthesizing text: '{text[:50]}...' ({len(segments)} segment(s))")
+            with self.models.using(vocoder_name):
+                specs = self.models.synthesize_spectrograms(segments, [embed] * len(segments))
+                
+                # Vocoder - convert spectrograms to waveform, all segments in one batch
+                print(f"Generating waveform...")
+                wavs = self.models.infer_waveforms(specs, vocoder_name)
             
-            # Vocoder - convert spectrogram to waveform
-            print(f"Generating waveform...")
-            generated_wav = vocoder.infer_waveform(spec)
+            generated_wav = Synthesizer.join_segments(wavs)
             
             # Normalize
             generated_wav = generated_wav / (np.abs(generated_wav).max() + 1e-8) * 0.95
@@ -186,6 +295,142 @@ class VoiceCloningManager:
             traceback.print_exc()
             return None, str(e)
 
+    def synthesize_stream(self, text, embedding_list, section_frames=100, context_frames=8,
+                          vocoder_name=None):
+        """
+        Synthesize speech section by section, for streaming playback. Vocoders that
+        can't vocode the decoder's mel blocks as they arrive stream sentence by sentence.
+        
+        Args:
+            text: Text to synthesize
+            embedding_list: Speaker embedding as a list/array
+            section_frames: Mel frames vocoded per section
+            context_frames: Mel frames of context vocoded around each section
+            vocoder_name: Name of the vocoder backend, None for the default
+            
+        Yields:
+            numpy arrays of audio samples, in order. Unlike synthesize(), the audio
+            can't be peak-normalized as a whole and is only scaled and clipped.
+        """
+        if not (self.synthesizer_loaded and self.vocoder_loaded) or not MODULES_AVAILABLE:
+            raise RuntimeError("Synthesizer/Vocoder models not loaded")
+        
+        embed = np.array(embedding_list)
+        sections = self.models.synthesize_stream(Synthesizer.split_text(text), embed, section_frames,
+                                                 context_frames, vocoder_name)
+        for section in sections:
+            yield np.clip(section * 0.95, -1, 1)
+
+    def synthesize_batch(self, texts, embedding_list, vocoder_name=None):
+        """
+        Synthesize several texts with the same voice. The texts are decoded by the
+        synthesizer as one batch, then vocoded one by one.
+        
+        Args:
+            texts: List of texts to synthesize
+            embedding_list: Speaker embedding as a list/array
+            vocoder_name: Name of the vocoder backend, None for the default
+            
+        Returns:
+            tuple: (list of generated_wavs, error_message)
+        """
+        if not (self.synthesizer_loaded and self.vocoder_loaded) or not MODULES_AVAILABLE:
+            return None, "Synthesizer/Vocoder models not loaded"
+        
+        try:
+            embed = np.array(embedding_list)
+            
+            with self.models.using(vocoder_name):
+                specs = self.models.synthesize_spectrograms(texts, [embed] * len(texts))
+                
+                # Vocoding the batch together takes about as long as its longest utterance
+                wavs = self.models.infer_waveforms(specs, vocoder_name)
+            generated_wavs = [wav / (np.abs(wav).max() + 1e-8) * 0.95 for wav in wavs]
+            
+            return generated_wavs, None
+        except Exception as e:
+            print(f"✗ Error in synthesize_batch: {e}")
+            import traceback
+            traceback.print_exc()
+            return None, str(e)
+
+    def warm_up(self, texts, utterance_seconds=()):
+        """
+        Run synthetic inputs through the loaded models, so the first requests don't pay for
+        memory allocation and kernel selection. Each vocoder backend vocodes the
+        spectrograms of the texts, through the same schedulers as the requests.
+        
+        Args:
+            texts: Texts synthesized with a random voice, of the lengths requests have
+            utterance_seconds: Lengths of the random audio embedded by the encoder
+            
+        Returns:
+            dict of model name -> {'inputs': [...], 'seconds': [...]}, one entry per input
+        """
+        timings = {}
+        
+        def timed(name, label, fn):
+            start = time.perf_counter()
+            result = fn()
+            timing = timings.setdefault(name, {'inputs': [], 'seconds': []})
+            timing['inputs'].append(label)
+            timing['seconds'].append(time.perf_counter() - start)
+            return result
+        
+        embed = None
+        if self.encoder_loaded:
+            with self.registry.use('encoder'):
+                for seconds in utterance_seconds:
+                    wav = np.random.uniform(-0.5, 0.5, int(seconds * encoder.sampling_rate)).astype(np.float32)
+                    embed = timed('encoder', f"{seconds}s", lambda: encoder.embed_utterance(wav))
+        
+        if not (self.synthesizer_loaded and self.vocoder_loaded):
+            return timings
+        if embed is None:
+            embed = np.random.uniform(-1, 1, Synthesizer.hparams.speaker_embedding_size).astype(np.float32)
+            embed /= np.linalg.norm(embed)
+        
+        specs = []
+        with self.registry.use('synthesizer'):
+            for text in texts:
+                specs += timed('synthesizer', text, lambda: self.models.synthesize_spectrograms([text], [embed]))
+        
+        vocoders = self.models.vocoders
+        for name in (vocoders.available() if vocoders is not None else [None]):
+            with self.models.using(name):
+                for text, spec in zip(texts, specs):
+                    timed(name or 'wavernn', text, lambda: self.models.infer_waveforms([spec], name))
+            # Also caches the model version the audio cache keys on
+            self.get_model_version(name)
+        return timings
+
+    def get_model_version(self, vocoder_name=None):
+        """
+        Identify the synthesizer/vocoder checkpoints, e.g. to key cached audio.
+        
+        Args:
+            vocoder_name: Name of the vocoder backend, None for the default
+            
+        Returns:
+            str like 'syn295000-voc1159000' (WaveRNN) or 'syn295000-griffinlim', or None
+            when running on mock audio
+        """
+        if not (self.synthesizer_loaded and self.vocoder_loaded) or not MODULES_AVAILABLE:
+            return None
+        backend = self.models.backend(vocoder_name)
+        name = backend.name if backend is not None else 'wavernn'
+        # The checkpoints don't change while the server runs: once known, the version
+        # can be given without reloading models the registry unloaded
+        if name not in self._model_versions:
+            with self.models.using(vocoder_name), self.models.lock, self.models.vocoder_lock:
+                if name == 'wavernn':
+                    version = f"syn{self.synthesizer.get_step()}-voc{vocoder.get_step()}"
+                else:
+                    step = backend.get_step()
+                    version = f"syn{self.synthesizer.get_step()}-{name}" + (f"{step}" if step is not None else "")
+            self._model_versions[name] = version
+        return self._model_versions[name]
+
     def save_embedding(self, name, embedding_list):
         """Save a clone embedding to disk"""
         try:
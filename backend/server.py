@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 # Standard library imports
+import atexit
 import copy
 import csv
 import itertools
@@ -10,6 +11,9 @@ import os
 import sys
 import io
 import base64
+import struct
+import time
+from functools import wraps
 
 # Third-party imports
 import cv2 as cv
@@ -18,35 +22,47 @@ import eventlet
 eventlet.monkey_patch()
 
 # Flask imports
-from flask import Flask, Response, request, jsonify
+from flask import Flask, Request, Response, request, jsonify
 from flask_socketio import SocketIO
 from flask_cors import CORS
 
 # Audio processing imports
 import soundfile as sf
 
-# MediaPipe imports
-import mediapipe as mp
-try:
-    import mediapipe.solutions.holistic as mp_holistic
-    import mediapipe.solutions.drawing_utils as mp_drawing
-except ImportError:
-    # Fallback for some non-standard 0.10.x builds
-    import mediapipe.python.solutions.holistic as mp_holistic
-    import mediapipe.python.solutions.drawing_utils as mp_drawing
 from collections import deque
 
-# Local imports - Video
-from video.model.keypoint_classifier.keypoint_classifier import KeyPointClassifier
-from video.model.keypoint_classifier.sequence_classifier import SequenceClassifier
+# Heavy imports (torch, TensorFlow, MediaPipe, librosa) are deferred to where they're
+# used, so the server can answer while the models load in the background
 
 # Local imports - Voice Cloning
 sys.path.append(os.path.join(os.path.dirname(__file__), 'clone'))
-from clone.voice_cloning import VoiceCloningManager
-from tts.tts_manager import TTSManager
+from tts.synthesis_scheduler import (SynthesisScheduler, QueueFullError, native_lock, native_threading,
+                                     run_native, iterate_native)
+from tts.audio_cache import AudioCache
+from tts.decoder_scheduler import DecoderScheduler
+from tts.vocoder_scheduler import VocoderScheduler
+from tts.vocoder_backends import (VocoderBackends, WaveRNNBackend, HiFiGANBackend, GriffinLimBackend,
+                                  VOCODER_NAMES)
+from tts.prewarm import VocabularyPrewarmer
+from tts.model_registry import ModelRegistry, module_nbytes
+from tts.speech_models import SpeechModels
+from tts import config as tts_config
+
+
+class InMemoryRequest(Request):
+    """
+    Keeps uploaded files in memory. Werkzeug spools uploads larger than 500 KB to
+    temporary files, which voice enrollment would write and read back under load;
+    MAX_CONTENT_LENGTH bounds the memory an upload can take instead.
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
 
 # Flask app initialization
 app = Flask(__name__)
+app.request_class = InMemoryRequest
+app.config['MAX_CONTENT_LENGTH'] = tts_config.MAX_UPLOAD_SIZE_MB * 1024 * 1024
 CORS(app)
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet', logger=False, engineio_logger=False)
 
@@ -55,17 +71,244 @@ camera = None
 is_processing = False
 backend_dir = os.path.dirname(os.path.abspath(__file__))
 
-# Initialize Voice Cloning Manager
-vc_manager = VoiceCloningManager(models_dir=os.path.join(backend_dir, "clone", "saved_models"))
+# Every model is owned by the registry: loaded on demand, unloaded while idle when
+# the loaded models exceed the memory budget, and reported in the status
+model_registry = ModelRegistry(budget_mb=tts_config.MODEL_MEMORY_BUDGET_MB,
+                               idle_timeout=tts_config.MODEL_IDLE_UNLOAD_SECONDS)
+# Synthesis runs on native worker threads, so the model locks must be native locks.
+# Both managers run the same models, which keep per-call state and must not run two
+# jobs at once: the Tacotron its attention state (model_lock, held per decoder call or
+# step), the WaveRNN its sample loop (vocoder_lock, held per vocoder batch). With a lock
+# each, decoding and vocoding overlap.
+model_lock = native_lock()
+vocoder_lock = native_lock()
+# Both managers decode and vocode through this, with the schedulers and vocoder backends
+# set on it by _start_speech_stack()
+speech_models = SpeechModels(model_registry, model_lock, vocoder_lock)
+
+# The speech stack (voice cloning and TTS managers, schedulers, vocoders) is built by
+# _start_speech_stack() on a background thread; until speech_ready is set these are None
+vc_manager = None
+tts_manager = None
+decoder_scheduler = None  # Concurrent synthesis jobs share one continuously batched decoder loop
+vocoder_inference = None  # WaveRNN sampling can be spread over several processes...
+vocoder_scheduler = None  # ... and concurrent jobs share one WaveRNN batch
+vocoder_backends = None  # Vocoder backends, selectable per request
+
+# Startup progress, reported by /health/ready. speech_ready is a native event, so the
+# synthesis workers can wait on it; green threads poll it instead (see requires_speech_stack).
+startup_state = {
+    'stage': 'starting',  # starting, loading, warming_up, ready or failed
+    'started_at': time.time(),
+    'speech_ready_at': None,
+    'ready_at': None,
+    'error': None,
+    'warmup': {}  # Model name -> {'inputs', 'seconds'}, see VoiceCloningManager.warm_up
+}
+speech_ready = native_threading().Event()
+
+
+def _setup_vocoder(vocoder):
+    """Starts the vocoder pool and calibrates the fold size, again whenever the registry reloads the vocoder"""
+    if tts_config.VOCODER_PROCESSES > 1:
+        try:
+            vocoder.start_pool(tts_config.VOCODER_PROCESSES, tts_config.VOCODER_THREADS_PER_PROCESS)
+            print(f"✓ Vocoder pool started ({tts_config.VOCODER_PROCESSES} processes)")
+        except Exception as e:
+            print(f"⚠ Could not start the vocoder pool, vocoding in-process: {e}")
+    if tts_config.VOCODER_AUTO_FOLDS:
+        try:
+            vocoder.calibrate_folds(tts_config.VOCODER_FOLD_CALIBRATION_PATH, tts_config.VOCODER_TARGET_RTF)
+            print("✓ Vocoder fold size calibrated")
+        except Exception as e:
+            print(f"⚠ Could not calibrate the vocoder fold size, using the defaults: {e}")
+
+
+def _start_speech_stack():
+    """
+    Load the voice cloning models (concurrently, see VoiceCloningManager) and build the
+    speech stack around them. Runs on a native thread, the globals are published at the end.
+    """
+    global vc_manager, tts_manager, decoder_scheduler, vocoder_inference, vocoder_scheduler, vocoder_backends
+    from clone.voice_cloning import VoiceCloningManager
+    from tts.tts_manager import TTSManager
+
+    vc = VoiceCloningManager(models_dir=os.path.join(backend_dir, "clone", "saved_models"),
+                             models=speech_models)
+
+    # The TTS manager shares the voice cloning models through the registry
+    tts = TTSManager(models=speech_models)
+
+    if tts_config.ENABLE_DECODER_BATCHING and vc.synthesizer_loaded:
+        decoder_scheduler = DecoderScheduler(vc.synthesizer, model_lock,
+                                             max_batch_size=tts_config.DECODER_MAX_BATCH_SIZE)
+        decoder_scheduler.start()
+        speech_models.decoder_scheduler = decoder_scheduler
+
+    # The vocoder's pool and fold size are set up again by the registry on every reload
+    if vc.vocoder_loaded:
+        from vocoder import inference as vocoder_inference
+        with model_registry.use('vocoder') as vocoder:
+            _setup_vocoder(vocoder)
+        model_registry.add_load_hook('vocoder', _setup_vocoder)
+        atexit.register(vocoder_inference.stop_pool)
+
+    if tts_config.ENABLE_VOCODER_BATCHING and vc.vocoder_loaded:
+        vocoder_scheduler = VocoderScheduler(vocoder_inference.infer_waveforms, vocoder_lock,
+                                             max_batch_mels=tts_config.VOCODER_MAX_BATCH_MELS)
+        vocoder_scheduler.start()
+        speech_models.vocoder_scheduler = vocoder_scheduler
+
+    if vc.synthesizer_loaded:
+        from synthesizer.inference import Synthesizer
+        from synthesizer.hparams import hparams as synthesizer_hparams
+        backends = VocoderBackends(default=tts_config.DEFAULT_VOCODER)
+        if vc.vocoder_loaded:
+            backends.register(WaveRNNBackend(vocoder_inference, vocoder_lock, vocoder_scheduler))
+        if os.path.exists(tts_config.HIFIGAN_MODEL_PATH):
+            try:
+                # The backend holds the generator, so it's registered as loaded for good
+                model_registry.register('hifigan', lambda: HiFiGANBackend(tts_config.HIFIGAN_MODEL_PATH,
+                                                                          tts_config.HIFIGAN_CONFIG_PATH,
+                                                                          synthesizer_hparams),
+                                        size_fn=lambda backend: module_nbytes(backend.generator), pinned=True)
+                with model_registry.use('hifigan') as hifigan_backend:
+                    backends.register(hifigan_backend)
+                print("✓ HiFi-GAN vocoder loaded")
+            except Exception as e:
+                print(f"⚠ Could not load the HiFi-GAN vocoder: {e}")
+        backends.register(GriffinLimBackend(Synthesizer))
+        speech_models.vocoders = backends
+        vocoder_backends = backends
+        print(f"✓ Vocoders available: {', '.join(backends.available())} (default {backends.default})")
+
+    vc_manager, tts_manager = vc, tts
+
+
+# TFLite sign classifiers. The size of an interpreter is about that of its model file.
+KEYPOINT_CLASSIFIER_PATH = os.path.join(backend_dir, 'video', 'model', 'keypoint_classifier', 'keypoint_classifier.tflite')
+SEQUENCE_CLASSIFIER_PATH = os.path.join(backend_dir, 'video', 'model', 'sequence_classifier.tflite')
+
+
+def _load_keypoint_classifier():
+    from video.model.keypoint_classifier.keypoint_classifier import KeyPointClassifier
+    return KeyPointClassifier(model_path=KEYPOINT_CLASSIFIER_PATH)
+
+
+def _load_sequence_classifier():
+    from video.model.keypoint_classifier.sequence_classifier import SequenceClassifier
+    return SequenceClassifier(model_path=SEQUENCE_CLASSIFIER_PATH)
+
+
+# Pinned: the cameras use the classifiers on every frame from green threads, where a
+# reload (or waiting for one) would block the event loop. They're small.
+model_registry.register('keypoint_classifier', _load_keypoint_classifier,
+                        size_fn=lambda classifier: os.path.getsize(KEYPOINT_CLASSIFIER_PATH), pinned=True)
+if os.path.exists(SEQUENCE_CLASSIFIER_PATH):
+    model_registry.register('sequence_classifier', _load_sequence_classifier,
+                            size_fn=lambda classifier: os.path.getsize(SEQUENCE_CLASSIFIER_PATH), pinned=True)
+
+
+def _start_sign_classifiers():
+    """Load the TFLite classifiers ahead of the camera, and warm them up. Runs on a native thread."""
+    names = [name for name in ('keypoint_classifier', 'sequence_classifier') if name in model_registry]
+    errors = model_registry.load_concurrently(names)
+    for name, error in errors.items():
+        print(f"⚠ Could not load the {name.replace('_', ' ')}: {error}")
+    if not tts_config.ENABLE_WARMUP:
+        return
+    for name in names:
+        if name in errors:
+            continue
+        with model_registry.use(name) as classifier:
+            # An empty frame (keypoints) or sequence of frames, the shape the model takes
+            shape = classifier.input_details[0]['shape'][1:]
+            start = time.perf_counter()
+            classifier(np.zeros(shape, dtype=np.float32))
+            startup_state['warmup'][name] = {'inputs': [list(map(int, shape))],
+                                             'seconds': [time.perf_counter() - start]}
+
+
+def _warm_up_speech_stack():
+    """Run synthetic inputs through the speech models before they're reported ready"""
+    if not tts_config.ENABLE_WARMUP:
+        return
+    start = time.perf_counter()
+    try:
+        timings = vc_manager.warm_up(tts_config.WARMUP_TEXTS, tts_config.WARMUP_UTTERANCE_SECONDS)
+    except Exception as e:
+        # The models are loaded, the first requests will just be slower
+        print(f"⚠ Warm-up failed: {e}")
+        return
+    startup_state['warmup'].update(timings)
+    summary = ', '.join(f"{name} {sum(timing['seconds']):.2f}s" for name, timing in timings.items())
+    print(f"✓ Speech models warmed up in {time.perf_counter() - start:.1f}s ({summary or 'no models'})")
+
+
+def _background_startup():
+    """
+    Load every model in the background: the sign classifiers and the speech stack
+    concurrently, on native threads, then warm them up. Sets speech_ready once the
+    speech stack is warmed up, and the readiness stage once every model is.
+    """
+    startup_state['stage'] = 'loading'
+    classifiers = native_threading().Thread(target=_start_sign_classifiers, name="load-sign-classifiers",
+                                            daemon=True)
+    classifiers.start()
+    try:
+        _start_speech_stack()
+    except Exception as e:
+        startup_state['stage'], startup_state['error'] = 'failed', str(e)
+        print(f"✗ Could not start the speech models: {e}")
+        import traceback
+        traceback.print_exc()
+        return
+    startup_state['stage'] = 'warming_up'
+    _warm_up_speech_stack()
+    startup_state['speech_ready_at'] = time.time()
+    speech_ready.set()
+    classifiers.join()
+
+    startup_state['ready_at'] = time.time()
+    startup_state['stage'] = 'ready'
+    print(f"✓ Startup complete in {startup_state['ready_at'] - startup_state['started_at']:.1f}s")
+
+
+def start_background_startup():
+    native_threading().Thread(target=_background_startup, name="startup", daemon=True).start()
+
+
+def wait_for_speech_stack(timeout=None):
+    """
+    Wait for the speech stack from a native thread (synthesis workers, prewarm batches).
+
+    Raises:
+        RuntimeError: if it isn't loaded within the timeout or failed to load
+    """
+    timeout = tts_config.STARTUP_WAIT_SECONDS if timeout is None else timeout
+    if not speech_ready.wait(timeout) or vc_manager is None:
+        raise RuntimeError(startup_state['error'] or "The speech models are still loading")
+
 
-# Initialize TTS Manager (Share resources with VC Manager)
-tts_manager = TTSManager()
-# Hook tts_manager to use vc_manager's models to save RAM
-if vc_manager.synthesizer_loaded:
-    tts_manager.synthesizer = vc_manager.synthesizer
-    tts_manager.vocoder_loaded = vc_manager.vocoder_loaded
-    # Regenerate embeddings with the real model
-    tts_manager._generate_default_embeddings()
+def requires_speech_stack(route):
+    """
+    Route decorator: wait for the speech stack while it loads, then answer 503 with a
+    Retry-After header. Green threads can't block on the native event, so it's polled.
+    """
+    @wraps(route)
+    def wrapper(*args, **kwargs):
+        deadline = time.time() + tts_config.STARTUP_WAIT_SECONDS
+        while not speech_ready.is_set() and startup_state['stage'] != 'failed' and time.time() < deadline:
+            eventlet.sleep(0.1)
+        if not speech_ready.is_set():
+            response = jsonify({
+                "error": startup_state['error'] or "The speech models are still loading",
+                "stage": startup_state['stage']
+            })
+            response.headers['Retry-After'] = str(tts_config.STARTUP_RETRY_AFTER_SECONDS)
+            return response, 503
+        return route(*args, **kwargs)
+    return wrapper
 
 
 # Voice profile storage
@@ -77,6 +320,25 @@ active_voice_profile = {
 voice_profiles_lock = threading.Lock()
 
 
+def load_sign_labels():
+    """Load the sign vocabulary, one label per row of keypoint_classifier_label.csv"""
+    labels_path = os.path.join(backend_dir, 'video', 'model', 'keypoint_classifier', 'keypoint_classifier_label.csv')
+    with open(labels_path, encoding="utf-8-sig") as f:
+        return [row[0] for row in csv.reader(f)]
+
+
+def _import_mediapipe():
+    """MediaPipe's holistic and drawing solutions, imported when the camera starts"""
+    try:
+        import mediapipe.solutions.holistic as mp_holistic
+        import mediapipe.solutions.drawing_utils as mp_drawing
+    except ImportError:
+        # Fallback for some non-standard 0.10.x builds
+        import mediapipe.python.solutions.holistic as mp_holistic
+        import mediapipe.python.solutions.drawing_utils as mp_drawing
+    return mp_holistic, mp_drawing
+
+
 class VideoCamera(object):
     def __init__(self):
         # Open camera with multiple backend attempts for Windows
@@ -114,22 +376,18 @@ class VideoCamera(object):
             self.cap.set(cv.CAP_PROP_FRAME_HEIGHT, 480)
             self.cap.set(cv.CAP_PROP_FPS, 30)
         
-        # Paths
-        # Use existing backend_dir
-        
-        # Load Keypoint Classifier (Static Signs)
-        kf_model_path = os.path.join(backend_dir, 'video', 'model', 'keypoint_classifier', 'keypoint_classifier.tflite')
-        self.keypoint_classifier = KeyPointClassifier(model_path=kf_model_path)
-        
-        # Load Sequence Classifier (Temporal Signs/Sentences)
-        seq_model_path = os.path.join(backend_dir, 'video', 'model', 'sequence_classifier.tflite')
-        if os.path.exists(seq_model_path):
-            self.sequence_classifier = SequenceClassifier(model_path=seq_model_path)
+        # Keypoint (static signs) and sequence (temporal signs/sentences) classifiers,
+        # held in the model registry while a frame is classified
+        # They're loaded at startup; wait for them off the event loop if that's still going on
+        run_native(model_registry.load, 'keypoint_classifier')
+        self.has_sequence_classifier = 'sequence_classifier' in model_registry
+        if self.has_sequence_classifier:
+            run_native(model_registry.load, 'sequence_classifier')
         else:
-            self.sequence_classifier = None
             print("⚠ Sequence classifier model not found. Run training first.")
         
         # Initialize Holistic
+        mp_holistic, mp_drawing = _import_mediapipe()
         self.mp_holistic = mp_holistic
         self.holistic = self.mp_holistic.Holistic(
             min_detection_confidence=0.7,
@@ -142,10 +400,7 @@ class VideoCamera(object):
         self.show_overlay = True # Default to showing skeleton
         
         # Load Labels
-        labels_path = os.path.join(backend_dir, 'video', 'model', 'keypoint_classifier', 'keypoint_classifier_label.csv')
-        with open(labels_path, encoding="utf-8-sig") as f:
-            keypoint_classifier_labels = csv.reader(f)
-            self.keypoint_classifier_labels = [row[0] for row in keypoint_classifier_labels]
+        self.keypoint_classifier_labels = load_sign_labels()
 
         # Threading and State
         self.lock = threading.Lock()
@@ -216,9 +471,10 @@ class VideoCamera(object):
                 detected_text = ""
                 
                 # Sequence Prediction with Defensive Handling (Point 4)
-                if self.sequence_classifier and len(buffer_copy) == 30:
+                if self.has_sequence_classifier and len(buffer_copy) == 30:
                     try:
-                        res_id, confidence = self.sequence_classifier(buffer_copy)
+                        with model_registry.use('sequence_classifier') as sequence_classifier:
+                            res_id, confidence = sequence_classifier(buffer_copy)
                         if confidence > 0.85:
                             label = self.keypoint_classifier_labels[res_id]
                             
@@ -263,7 +519,7 @@ class VideoCamera(object):
                         
                         # Auto-speak if enabled
                         if active_voice_profile['auto_speak']:
-                            eventlet.spawn(self._async_speak, detected_text)
+                            self._async_speak(detected_text)
                         
             except Exception as e:
                 print(f"Detection worker Error: {e}")
@@ -276,7 +532,8 @@ class VideoCamera(object):
         
         # Static classifier fallback
         pre_processed_landmark_list = pre_process_landmark(landmark_list)
-        hand_sign_id = self.keypoint_classifier(pre_processed_landmark_list)
+        with model_registry.use('keypoint_classifier') as keypoint_classifier:
+            hand_sign_id = keypoint_classifier(pre_processed_landmark_list)
         
         label = "Unknown"
         if 0 <= hand_sign_id < len(self.keypoint_classifier_labels):
@@ -296,9 +553,9 @@ class VideoCamera(object):
         })
 
     def _async_speak(self, text):
-        """Asynchronously synthesize and emit audio without blocking detection"""
+        """Queue the text for synthesis; audio is emitted by a synthesis worker"""
         try:
-            synthesize_and_emit_audio(text)
+            queue_speech(text, client_id='auto_speak')
         except Exception as e:
             print(f"Auto-speak error: {e}")
 
@@ -688,15 +945,32 @@ def test_connect():
 
 @socketio.on('disconnect')
 def test_disconnect():
+    enrollment_sessions.pop(request.sid, None)
     print('Client disconnected')
 
 @socketio.on('request_speech')
 def handle_speech_request(data):
-    """Handle real-time speech synthesis request from client"""
+    """
+    Handle real-time speech synthesis request from client.
+    Set 'stream' to receive the audio as audio_chunk events while it is synthesized,
+    and 'vocoder' to pick the vocoder backend (see tts.vocoder_backends).
+    With 'quality': 'draft' the audio is vocoded by Griffin-Lim, which is near instant;
+    add 'refine' to get the full quality audio as a second audio_ready afterwards.
+    """
     text = data.get('text', '')
     if text:
         try:
-            synthesize_and_emit_audio(text)
+            vocoder = _request_vocoder(data)
+            refine = data.get('quality') == 'draft' and data.get('refine')
+            # Check the refine job's vocoder before queueing either job, rather than
+            # failing in the worker after the draft was delivered
+            refine_vocoder = _request_vocoder({**data, 'quality': 'full'}) if refine else None
+            stream = bool(data.get('stream', False))
+            queue_speech(text, client_id=request.sid, stream=stream, vocoder=vocoder)
+            if refine:
+                queue_speech(text, client_id=request.sid, stream=stream, vocoder=refine_vocoder)
+        except QueueFullError as e:
+            socketio.emit('speech_error', {'error': str(e), 'text': text})
         except Exception as e:
             socketio.emit('speech_error', {'error': str(e)})
 
@@ -719,108 +993,375 @@ def handle_toggle_overlay(data):
 
 # --- Helper Functions ---
 
-def synthesize_and_emit_audio(text):
+def _check_vocoder(name):
+    """Raises ValueError for a vocoder name that isn't known (None is the default)"""
+    if name is not None and name not in VOCODER_NAMES:
+        raise ValueError(f"Unknown vocoder: {name} (expected one of {', '.join(VOCODER_NAMES)})")
+
+
+def _request_vocoder(data):
     """
-    Synthesize speech and emit audio via SocketIO.
+    The vocoder a request asks for, either by name ("vocoder") or by quality ("quality":
+    "draft" is Griffin-Lim, "full" the requested or default vocoder).
+    
+    Raises:
+        ValueError: for an unknown vocoder or quality
+    """
+    quality = data.get('quality', 'full')
+    if quality not in ('draft', 'full'):
+        raise ValueError(f"Unknown quality: {quality} (expected draft or full)")
+    vocoder = 'griffinlim' if quality == 'draft' else data.get('vocoder')
+    _check_vocoder(vocoder)
+    return vocoder
+
+
+def _vocoder_label(vocoder):
+    """Name of the backend that serves a requested vocoder, for the clients"""
+    if vocoder_backends is None:
+        return None
+    return vocoder_backends.resolve(vocoder)
+
+
+def synthesize_speech(text, embedding, voice_type, vocoder=None):
+    """
+    Synthesize speech with the given voice. This runs the full Tacotron + WaveRNN
+    pipeline, so it is only ever called from a synthesis worker.
     
     Priority:
     1. Cloned voice (if embedding available)
     2. Voice profile with voice cloning models
     3. Mock audio
+    
+    Returns:
+        tuple: (wav, sample_rate, synthesis_method), wav is None if synthesis failed
     """
-    try:
-        with voice_profiles_lock:
-            embedding = active_voice_profile['embedding']
-            voice_type = active_voice_profile['type']
-        
-        wav = None
-        synthesis_method = 'unknown'
-        
-        # Priority 1: Try cloned voice if embedding is available
-        if embedding:
-            print(f"Synthesizing with cloned voice: '{text}'")
-            try:
-                wav, error = vc_manager.synthesize(text, embedding)
-                if wav is not None and error is None:
-                    synthesis_method = 'cloned_voice'
-                    print(f"✓ Used cloned voice")
-                else:
-                    print(f"⚠ Cloned voice failed: {error}")
-            except Exception as e:
-                print(f"⚠ Cloned voice error: {e}")
-        
-        # Priority 2: Try voice profile with TTS manager
-        if wav is None:
-            print(f"Synthesizing with {voice_type} profile: '{text}'")
-            try:
-                speaker_id = {'Natural': 0, 'Professional': 1, 'Warm': 2}.get(voice_type, 0)
-                
-                # TTS manager will use voice cloning models with profile embeddings
-                # or fall back to mock audio if models not available
-                wav = tts_manager.synthesize(text, speaker_id=speaker_id)
-                
-                if wav is not None:
-                    # Check if it's mock audio or real synthesis
-                    if tts_manager.is_ready():
-                        synthesis_method = f'profile_{voice_type.lower()}'
-                        print(f"✓ Used {voice_type} profile with voice cloning")
-                    else:
-                        synthesis_method = 'mock_audio'
-                        print(f"⚠ Using mock audio (models not loaded)")
-                    
-                    # Convert int16 to float32 if needed
-                    if wav.dtype == np.int16:
-                        wav = wav.astype(np.float32) / 32768.0
+    wav = None
+    synthesis_method = 'unknown'
+    
+    # Priority 1: Try cloned voice if embedding is available
+    if embedding:
+        print(f"Synthesizing with cloned voice: '{text}'")
+        try:
+            wav, error = vc_manager.synthesize(text, embedding, vocoder_name=vocoder)
+            if wav is not None and error is None:
+                synthesis_method = 'cloned_voice'
+                print(f"✓ Used cloned voice")
+            else:
+                print(f"⚠ Cloned voice failed: {error}")
+        except Exception as e:
+            print(f"⚠ Cloned voice error: {e}")
+    
+    # Priority 2: Try voice profile with TTS manager
+    if wav is None:
+        print(f"Synthesizing with {voice_type} profile: '{text}'")
+        try:
+            speaker_id = {'Natural': 0, 'Professional': 1, 'Warm': 2}.get(voice_type, 0)
+            
+            # TTS manager will use voice cloning models with profile embeddings
+            # or fall back to mock audio if models not available
+            wav = tts_manager.synthesize(text, speaker_id=speaker_id, vocoder_name=vocoder)
+            
+            if wav is not None:
+                # Check if it's mock audio or real synthesis
+                if tts_manager.is_ready():
+                    synthesis_method = f'profile_{voice_type.lower()}'
+                    print(f"✓ Used {voice_type} profile with voice cloning")
                 else:
-                    print(f"✗ TTS manager returned None")
-                    
-            except Exception as e:
-                print(f"✗ TTS synthesis error: {e}")
-                import traceback
-                traceback.print_exc()
-        
-        # Emit audio if we have it
-        if wav is not None:
-            try:
-                # Convert to bytes
-                buffer = io.BytesIO()
-                sr = 22050 if embedding else 24000
-                sf.write(buffer, wav, samplerate=sr, format='WAV')
-                buffer.seek(0)
-                audio_bytes = buffer.read()
+                    synthesis_method = 'mock_audio'
+                    print(f"⚠ Using mock audio (models not loaded)")
                 
-                # Emit audio via SocketIO
-                audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
-                socketio.emit('audio_ready', {
-                    'audio': audio_base64,
-                    'text': text,
-                    'voice_type': voice_type,
-                    'synthesis_method': synthesis_method,
-                    'sample_rate': sr
-                })
-                print(f"✓ Audio emitted: '{text}' ({synthesis_method})")
+                # Convert int16 to float32 if needed
+                if wav.dtype == np.int16:
+                    wav = wav.astype(np.float32) / 32768.0
+            else:
+                print(f"✗ TTS manager returned None")
                 
-            except Exception as e:
-                print(f"✗ Error encoding/emitting audio: {e}")
-                socketio.emit('speech_error', {
-                    'error': f'Audio encoding failed: {str(e)}',
-                    'text': text
-                })
-        else:
-            print(f"✗ No audio generated for: '{text}'")
-            socketio.emit('speech_error', {
-                'error': 'Synthesis failed - no audio generated',
-                'text': text
-            })
-            
-    except Exception as e:
-        print(f"✗ Critical error in synthesize_and_emit_audio: {e}")
-        import traceback
-        traceback.print_exc()
-        socketio.emit('speech_error', {
-            'error': f'Synthesis failed: {str(e)}',
-            'text': text
+        except Exception as e:
+            print(f"✗ TTS synthesis error: {e}")
+            import traceback
+            traceback.print_exc()
+    
+    sr = 22050 if embedding else 24000
+    return wav, sr, synthesis_method
+
+
+def get_speech_audio(text, embedding, voice_type, vocoder=None):
+    """
+    Cached front of synthesize_speech(). Repeated texts (e.g. sign labels) with the
+    same voice and models are served from the audio cache instead of re-synthesized.
+    
+    Returns:
+        tuple: (wav, sample_rate, synthesis_method, cached)
+    """
+    model_version = vc_manager.get_model_version(vocoder) if audio_cache else None
+    
+    # Nothing worth caching when the models aren't loaded (mock audio)
+    if model_version is None:
+        return (*synthesize_speech(text, embedding, voice_type, vocoder), False)
+    
+    key = _speech_cache_key(text, embedding, voice_type, model_version)
+    entry = audio_cache.get(key)
+    if entry is not None:
+        print(f"✓ Audio cache hit: '{text}'")
+        return entry.wav, entry.sample_rate, entry.synthesis_method, True
+    
+    wav, sr, synthesis_method = synthesize_speech(text, embedding, voice_type, vocoder)
+    
+    # Only cache audio produced by the requested voice, not a fallback
+    if wav is not None and synthesis_method == _expected_synthesis_method(embedding, voice_type):
+        audio_cache.put(key, wav, sr, synthesis_method)
+    return wav, sr, synthesis_method, False
+
+
+def _speech_cache_key(text, embedding, voice_type, model_version):
+    sr = 22050 if embedding else 24000
+    return AudioCache.make_key(text, AudioCache.voice_id(embedding, voice_type), sr, model_version)
+
+
+def _expected_synthesis_method(embedding, voice_type):
+    return 'cloned_voice' if embedding else f'profile_{voice_type.lower()}'
+
+
+def _voice_embedding(embedding, voice_type):
+    """The speaker embedding to synthesize a voice with, None if there is none (mock audio)"""
+    if embedding:
+        return embedding
+    # Profile voices are the TTS manager's preset embeddings on the same models
+    profile = voice_type if voice_type in tts_manager.speaker_profiles else 'Natural'
+    return tts_manager.speaker_profiles[profile]
+
+
+def _prewarm_batch(texts, params):
+    """
+    Synthesize the texts of a prewarm batch that aren't cached yet into the audio
+    cache. Runs on a native thread.
+    
+    Returns:
+        int: number of texts that were synthesized
+    """
+    wait_for_speech_stack()
+    embedding, voice_type = params['embedding'], params['voice_type']
+    model_version = vc_manager.get_model_version()
+    if model_version is None:
+        return 0
+    
+    missing = [(text, _speech_cache_key(text, embedding, voice_type, model_version)) for text in texts]
+    missing = [(text, key) for text, key in missing if not audio_cache.contains(key)]
+    if not missing:
+        return 0
+    
+    voice_embedding = _voice_embedding(embedding, voice_type)
+    if voice_embedding is None:
+        return 0
+    
+    wavs, error = vc_manager.synthesize_batch([text for text, _ in missing], voice_embedding)
+    if wavs is None:
+        raise RuntimeError(error)
+    
+    sr = 22050 if embedding else 24000
+    synthesis_method = _expected_synthesis_method(embedding, voice_type)
+    for (text, key), wav in zip(missing, wavs):
+        audio_cache.put(key, wav, sr, synthesis_method)
+    return len(wavs)
+
+
+def prewarm_active_voice():
+    """
+    Pre-synthesize the sign vocabulary with the active voice, cancelling the
+    prewarm of the previous voice.
+    
+    Returns:
+        PrewarmJob or None if prewarming is disabled
+    """
+    if vocabulary_prewarmer is None:
+        return None
+    
+    with voice_profiles_lock:
+        embedding = active_voice_profile['embedding']
+        voice_type = active_voice_profile['type']
+    
+    return vocabulary_prewarmer.start(sign_labels, embedding=embedding, voice_type=voice_type)
+
+
+def queue_speech(text, client_id=None, stream=False, vocoder=None):
+    """
+    Queue text for synthesis with the currently active voice profile.
+    The voice is captured now, so a later profile switch doesn't affect queued jobs.
+    
+    With stream=True the audio is sent as a series of audio_chunk events while it
+    is being vocoded, followed by audio_end, instead of a single audio_ready.
+    vocoder picks the vocoder backend, None for the default.
+    
+    Raises:
+        QueueFullError: if the synthesis queue is full
+    """
+    with voice_profiles_lock:
+        embedding = active_voice_profile['embedding']
+        voice_type = active_voice_profile['type']
+    
+    return synthesis_scheduler.submit(text, client_id=client_id, stream=stream,
+                                      embedding=embedding, voice_type=voice_type, vocoder=vocoder)
+
+
+def _run_speech_job(job):
+    """Synthesis worker entry point - runs on a native thread, off the event loop"""
+    wait_for_speech_stack()
+    if job.params.get('stream'):
+        return _stream_speech_job(job)
+    
+    wav, sr, synthesis_method, cached = get_speech_audio(job.text, job.params['embedding'],
+                                                         job.params['voice_type'], job.params.get('vocoder'))
+    if wav is None:
+        print(f"✗ No audio generated for: '{job.text}'")
+        raise RuntimeError('Synthesis failed - no audio generated')
+    
+    # Convert to bytes
+    buffer = io.BytesIO()
+    sf.write(buffer, wav, samplerate=sr, format='WAV')
+    buffer.seek(0)
+    return {
+        'audio': base64.b64encode(buffer.read()).decode('utf-8'),
+        'sample_rate': sr,
+        'synthesis_method': synthesis_method,
+        'cached': cached
+    }
+
+
+def _to_pcm16(wav):
+    return (np.clip(wav, -1, 1) * 32767).astype('<i2').tobytes()
+
+
+def _stream_speech_job(job):
+    """
+    Streaming variant of _run_speech_job. The scheduler runs each step on a native
+    thread and emits the sections as audio_chunk events.
+    """
+    wait_for_speech_stack()
+    return stream_speech_audio(job.text, job.params['embedding'], job.params['voice_type'],
+                               job.params.get('vocoder'))
+
+
+def stream_speech_audio(text, embedding, voice_type, vocoder=None):
+    """
+    Generator that yields the audio in sections as raw PCM16 while it is being
+    vocoded. Each step runs the models, so it must be driven from a native thread
+    (see iterate_native).
+    
+    Yields:
+        dict with 'audio' (PCM16 bytes) and 'sample_rate'
+    Returns:
+        dict with 'sample_rate', 'synthesis_method' and 'cached'
+    """
+    sr = 22050 if embedding else 24000
+    model_version = vc_manager.get_model_version(vocoder)
+    voice_embedding = _voice_embedding(embedding, voice_type) if model_version else None
+    key = _speech_cache_key(text, embedding, voice_type, model_version) if model_version else None
+    
+    # Cached audio and mock audio are available at once, just send them in pieces
+    if voice_embedding is None or (audio_cache and audio_cache.contains(key)):
+        wav, sr, synthesis_method, cached = get_speech_audio(text, embedding, voice_type, vocoder)
+        if wav is None:
+            raise RuntimeError('Synthesis failed - no audio generated')
+        chunk_len = sr // 2
+        for i in range(0, len(wav), chunk_len):
+            yield {'audio': _to_pcm16(wav[i:i + chunk_len]), 'sample_rate': sr}
+        return {'sample_rate': sr, 'synthesis_method': synthesis_method, 'cached': cached}
+    
+    sections = []
+    for section in vc_manager.synthesize_stream(text, voice_embedding,
+                                                section_frames=tts_config.STREAM_SECTION_FRAMES,
+                                                context_frames=tts_config.STREAM_CONTEXT_FRAMES,
+                                                vocoder_name=vocoder):
+        sections.append(section)
+        yield {'audio': _to_pcm16(section), 'sample_rate': sr}
+    
+    synthesis_method = _expected_synthesis_method(embedding, voice_type)
+    if audio_cache and sections:
+        wav = np.concatenate(sections)
+        audio_cache.put(key, wav / (np.abs(wav).max() + 1e-8) * 0.95, sr, synthesis_method)
+    return {'sample_rate': sr, 'synthesis_method': synthesis_method, 'cached': False}
+
+
+def _emit_speech_job_chunk(job, chunk, seq):
+    """Emit one section of a streaming job. The PCM16 bytes go out as a binary attachment."""
+    socketio.emit('audio_chunk', {
+        'job_id': job.id,
+        'seq': seq,
+        'audio': chunk['audio'],
+        'format': 'pcm_s16le',
+        'sample_rate': chunk['sample_rate'],
+        'text': job.text
+    })
+
+
+def _emit_speech_job_audio(job, result):
+    """Emit the synthesized audio of a finished job via SocketIO"""
+    if job.params.get('stream'):
+        socketio.emit('audio_end', {
+            'job_id': job.id,
+            'text': job.text,
+            'voice_type': job.params['voice_type'],
+            'synthesis_method': result['synthesis_method'],
+            'vocoder': _vocoder_label(job.params.get('vocoder')),
+            'sample_rate': result['sample_rate'],
+            'cached': result['cached']
         })
+        return
+    
+    socketio.emit('audio_ready', {
+        'job_id': job.id,
+        'audio': result['audio'],
+        'text': job.text,
+        'voice_type': job.params['voice_type'],
+        'synthesis_method': result['synthesis_method'],
+        'vocoder': _vocoder_label(job.params.get('vocoder')),
+        'sample_rate': result['sample_rate'],
+        'cached': result['cached']
+    })
+    print(f"✓ Audio emitted: '{job.text}' ({result['synthesis_method']})")
+
+
+def _emit_speech_job_error(job, error):
+    socketio.emit('speech_error', {
+        'job_id': job.id,
+        'error': str(error),
+        'text': job.text
+    })
+
+
+audio_cache = None
+if tts_config.ENABLE_AUDIO_CACHE:
+    audio_cache = AudioCache(
+        max_bytes=tts_config.MAX_CACHE_SIZE_MB * 1024 * 1024,
+        cache_dir=tts_config.CACHE_DIR,
+        max_disk_bytes=tts_config.MAX_DISK_CACHE_SIZE_MB * 1024 * 1024
+    )
+
+# Sign labels worth pre-synthesizing ("_" marks the no-sign class)
+sign_labels = [label for label in load_sign_labels() if label and label != "_"]
+
+vocabulary_prewarmer = None
+if audio_cache and tts_config.ENABLE_VOICE_PREWARM:
+    vocabulary_prewarmer = VocabularyPrewarmer(
+        synthesize_batch_fn=_prewarm_batch,
+        emit_fn=socketio.emit,
+        batch_size=tts_config.PREWARM_BATCH_SIZE
+    )
+
+synthesis_scheduler = SynthesisScheduler(
+    process_fn=_run_speech_job,
+    complete_fn=_emit_speech_job_audio,
+    error_fn=_emit_speech_job_error,
+    chunk_fn=_emit_speech_job_chunk,
+    emit_fn=socketio.emit,
+    num_workers=tts_config.SYNTHESIS_WORKERS,
+    max_queue_size=tts_config.SYNTHESIS_QUEUE_SIZE,
+    max_jobs_per_client=tts_config.SYNTHESIS_MAX_JOBS_PER_CLIENT
+)
+synthesis_scheduler.start()
+
+# The models load in the background while the server answers, see /health/ready
+start_background_startup()
 
 
 # ... (existing code for socketio setup)
@@ -828,34 +1369,96 @@ def synthesize_and_emit_audio(text):
 
 # --- Voice Cloning Routes ---
 
+def decode_upload(audio_file):
+    """
+    Decode an uploaded audio file in memory, resampled for the speaker encoder.
+    
+    Returns:
+        tuple: (wav, sample_rate)
+    Raises:
+        ValueError: if the upload is empty or not a readable audio file
+    """
+    from encoder.audio import decode_audio
+    data = audio_file.read()
+    if not data:
+        raise ValueError("Empty audio file")
+    return decode_audio(data)
+
+
+def clone_uploads(audio_files):
+    """
+    Clone a voice from one or several uploaded recordings of it. Several recordings are
+    embedded together into one speaker embedding, see VoiceCloningManager.clone_speaker.
+    
+    Decoding (possibly through ffmpeg), resampling and the speaker encoder take a while:
+    call it through run_native() from request handlers, not on the event loop.
+    
+    Raises:
+        ValueError: if an upload can't be decoded
+    """
+    wavs = [decode_upload(audio_file) for audio_file in audio_files]
+    if len(wavs) == 1:
+        wav, sr = wavs[0]
+        return vc_manager.clone_voice(wav, sample_rate=sr)
+    return vc_manager.clone_speaker([wav for wav, _ in wavs], sample_rate=wavs[0][1])
+
+
 @app.route('/clone_voice', methods=['POST'])
+@requires_speech_stack
 def clone_voice():
+    """
+    Clone a voice from a recording, or from several recordings of the same voice sent
+    as repeated 'audio' files. With several, the response also has the embedding of each
+    recording and its similarity to the voice ('utterance_similarity').
+    """
     if 'audio' not in request.files:
         return jsonify({"error": "No audio file provided"}), 400
     
-    audio_file = request.files['audio']
-    
-    # Preserve original extension to help librosa/audioread identify format
-    filename = audio_file.filename
-    ext = os.path.splitext(filename)[1] if filename else ".wav"
-    if not ext: ext = ".wav"
-    
     try:
-        temp_path = f"temp_voice_{os.urandom(4).hex()}{ext}"
-        audio_file.save(temp_path)
-        
-        result = vc_manager.clone_voice(temp_path)
-        
-        # Cleanup
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-            
+        result = run_native(clone_uploads, request.files.getlist('audio'))
         return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _wav_stream_header(sample_rate, channels=1, bits_per_sample=16):
+    """
+    WAV header for a stream of unknown length. The RIFF and data sizes are set to
+    the maximum, which players treat as "read until the end of the stream".
+    """
+    byte_rate = sample_rate * channels * bits_per_sample // 8
+    block_align = channels * bits_per_sample // 8
+    return (b'RIFF' + struct.pack('<I', 0xFFFFFFFF) + b'WAVE' +
+            b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, sample_rate, byte_rate,
+                                  block_align, bits_per_sample) +
+            b'data' + struct.pack('<I', 0xFFFFFFFF))
+
+
+def _generate_speech_stream(text, embedding, voice_type, sample_rate, audio_format, vocoder=None):
+    """Body of a streaming /synthesize response"""
+    if audio_format == 'wav':
+        yield _wav_stream_header(sample_rate)
+    try:
+        for chunk in iterate_native(stream_speech_audio(text, embedding, voice_type, vocoder)):
+            yield chunk['audio']
+    except Exception as e:
+        # The response has already started, all we can do is end it early
+        print(f"✗ Streaming synthesis failed for '{text}': {e}")
+
+
 @app.route('/synthesize', methods=['POST'])
+@requires_speech_stack
 def synthesize():
+    """
+    Synthesize text to a WAV file.
+    
+    With "stream": true the audio is sent with chunked transfer encoding as it is
+    synthesized, either as a WAV stream ("format": "wav", the default) or as raw
+    PCM16 ("format": "pcm"); the sample rate is in the X-Sample-Rate header.
+    "vocoder" picks the vocoder backend: "wavernn", "hifigan" or "griffinlim", and
+    "quality": "draft" is a shorthand for the near instant Griffin-Lim.
+    """
     data = request.json
     text = data.get("text")
     embedding = data.get("embedding")
@@ -863,36 +1466,30 @@ def synthesize():
     
     if not text:
         return jsonify({"error": "Missing text"}), 400
+    try:
+        vocoder = _request_vocoder(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    wav = None
-    error = None
+    if data.get("stream"):
+        audio_format = data.get("format", "wav")
+        if audio_format not in ("wav", "pcm"):
+            return jsonify({"error": f"Unsupported stream format: {audio_format}"}), 400
+        
+        sr = 22050 if embedding else 24000
+        print(f"Streaming synthesis for profile: {voice_profile}...")
+        mimetype = "audio/wav" if audio_format == "wav" else f"audio/L16; rate={sr}; channels=1"
+        return Response(_generate_speech_stream(text, embedding, voice_profile, sr, audio_format, vocoder),
+                        mimetype=mimetype, headers={'X-Sample-Rate': str(sr)})
     
-    if embedding:
-        print(f"Synthesizing with Voice Cloning (RTVC) for profile: {voice_profile}...")
-        wav, error = vc_manager.synthesize(text, embedding)
+    print(f"Synthesizing for profile: {voice_profile}...")
+    # Synthesis waits on the schedulers' native events, run it off the event loop
+    wav, sr, _, _ = run_native(get_speech_audio, text, embedding, voice_profile, vocoder)
     
-    if wav is None:
-        print(f"Synthesizing with Profile-based TTS: {voice_profile}...")
-        
-        # In a real system, voice_profile would map to a specific speaker_id or model
-        # For demo purposes, we'll vary the pitch of the mock audio based on profile
-        
-        speaker_id = 0
-        if voice_profile == "Professional": speaker_id = 1
-        elif voice_profile == "Warm": speaker_id = 2
-        
-        # If models are loaded, use speaker_id. If missing, manager returns mock.
-        wav = tts_manager.synthesize(text, speaker_id=speaker_id)
-            
-        if wav.dtype == np.int16:
-            wav = wav.astype(np.float32) / 32768.0
-            
     if wav is None:
         return jsonify({"error": "Synthesis failed"}), 500
-        
-    buffer = io.BytesIO()
-    sr = 22050 if embedding else 24000
     
+    buffer = io.BytesIO()
     sf.write(buffer, wav, samplerate=sr, format='WAV')
     buffer.seek(0)
     
@@ -913,16 +1510,20 @@ def set_voice_profile():
         active_voice_profile['embedding'] = embedding
         active_voice_profile['auto_speak'] = auto_speak
     
+    prewarm_job = prewarm_active_voice()
+    
     return jsonify({
         'success': True,
         'active_profile': {
             'type': voice_type,
             'has_cloned_voice': embedding is not None,
             'auto_speak': auto_speak
-        }
+        },
+        'prewarm': prewarm_job.to_dict() if prewarm_job else None
     })
 
 @app.route('/clone_and_activate_voice', methods=['POST'])
+@requires_speech_stack
 def clone_and_activate_voice():
     """Clone voice and immediately set it as active for sign language TTS"""
     global active_voice_profile
@@ -930,30 +1531,21 @@ def clone_and_activate_voice():
     if 'audio' not in request.files:
         return jsonify({"error": "No audio file provided"}), 400
     
-    audio_file = request.files['audio']
+    try:
+        # Clone the voice, from every recording sent
+        result = run_native(clone_uploads, request.files.getlist('audio'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     try:
-        # Preserve original extension
-        filename = audio_file.filename
-        ext = os.path.splitext(filename)[1] if filename else ".wav"
-        if not ext: ext = ".wav"
-        
-        temp_path = f"temp_active_voice_{os.urandom(4).hex()}{ext}"
-        audio_file.save(temp_path)
-        
-        # Clone the voice
-        result = vc_manager.clone_voice(temp_path)
-        
-        # Cleanup
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-            
         if result.get('success'):
             # Set as active voice
             with voice_profiles_lock:
                 active_voice_profile['embedding'] = result['embedding']
                 active_voice_profile['type'] = 'Cloned'
             
+            prewarm_job = prewarm_active_voice()
+            
             # Auto-save if name provided (optional)
             name = request.form.get('name') or f"Cloned_{os.urandom(2).hex()}"
             vc_manager.save_embedding(name, result['embedding'])
@@ -968,7 +1560,8 @@ def clone_and_activate_voice():
                     'type': 'Cloned',
                     'has_cloned_voice': True,
                     'auto_speak': active_voice_profile['auto_speak']
-                }
+                },
+                'prewarm': prewarm_job.to_dict() if prewarm_job else None
             })
         else:
             return jsonify(result), 500
@@ -978,7 +1571,122 @@ def clone_and_activate_voice():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# --- Streaming Enrollment ---
+
+# Voice enrollments from live audio, by Socket.IO sid. Each has a (green) lock, as the
+# events of a client are handled concurrently and its audio must be added in order.
+enrollment_sessions = {}
+
+
+def _decode_pcm(data, audio_format):
+    if audio_format == 'f32le':
+        return np.frombuffer(data, dtype='<f4').astype(np.float32)
+    return np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768.0
+
+
+@socketio.on('enrollment_start')
+def handle_enrollment_start(data=None):
+    """
+    Start enrolling a voice from live audio. Send the audio as it is recorded as
+    'enrollment_audio' events, then 'enrollment_stop'. After each 0.8s of speech an
+    'enrollment_progress' event reports the enrollment's stability; once 'converged' is
+    set the voice is known well enough and recording can stop.
+    
+    'sample_rate' is the rate of the audio (16000 by default), 'format' either
+    'pcm_s16le' (the default) or 'f32le'.
+    """
+    data = data or {}
+    sid = request.sid
+    audio_format = data.get('format', 'pcm_s16le')
+    if audio_format not in ('pcm_s16le', 'f32le'):
+        socketio.emit('enrollment_error', {'error': f"Unsupported audio format: {audio_format}"}, to=sid)
+        return
+    if not speech_ready.is_set():
+        socketio.emit('enrollment_error', {'error': "The speech models are still loading"}, to=sid)
+        return
+    
+    try:
+        enrollment = vc_manager.start_enrollment(
+            sample_rate=int(data.get('sample_rate', 16000)),
+            stability_lag=tts_config.ENROLLMENT_STABILITY_LAG,
+            stability_threshold=tts_config.ENROLLMENT_STABILITY_THRESHOLD,
+            min_voiced_seconds=tts_config.ENROLLMENT_MIN_VOICED_SECONDS
+        )
+    except (TypeError, ValueError) as e:
+        socketio.emit('enrollment_error', {'error': str(e)}, to=sid)
+        return
+    if enrollment is None:
+        socketio.emit('enrollment_error', {'error': "The speaker encoder is not loaded"}, to=sid)
+        return
+    
+    enrollment_sessions[sid] = {'enrollment': enrollment, 'format': audio_format, 'lock': threading.Lock()}
+    socketio.emit('enrollment_started', {'sample_rate': int(data.get('sample_rate', 16000)),
+                                         'format': audio_format}, to=sid)
+
+
+@socketio.on('enrollment_audio')
+def handle_enrollment_audio(data):
+    """The next chunk of enrollment audio, as a binary attachment (or under 'audio')"""
+    sid = request.sid
+    session = enrollment_sessions.get(sid)
+    if session is None:
+        socketio.emit('enrollment_error', {'error': "No enrollment in progress"}, to=sid)
+        return
+    
+    audio = data.get('audio') if isinstance(data, dict) else data
+    try:
+        with session['lock']:
+            # Resampling, VAD and the encoder run off the event loop
+            status = run_native(session['enrollment'].add_audio, _decode_pcm(audio, session['format']))
+    except Exception as e:
+        enrollment_sessions.pop(sid, None)
+        socketio.emit('enrollment_error', {'error': str(e)}, to=sid)
+        return
+    
+    socketio.emit('enrollment_progress', status, to=sid)
+    if status['received_seconds'] >= tts_config.ENROLLMENT_MAX_SECONDS:
+        _finish_enrollment(sid, {'reason': 'max_duration'})
+
+
+@socketio.on('enrollment_stop')
+def handle_enrollment_stop(data=None):
+    """
+    End the enrollment. 'enrollment_done' has the voice embedding; with 'activate' it
+    becomes the active voice, and with a 'name' it is saved.
+    """
+    _finish_enrollment(request.sid, data or {})
+
+
+def _finish_enrollment(sid, options):
+    session = enrollment_sessions.pop(sid, None)
+    if session is None:
+        socketio.emit('enrollment_error', {'error': "No enrollment in progress"}, to=sid)
+        return
+    
+    try:
+        with session['lock']:
+            result = run_native(session['enrollment'].finish)
+    except Exception as e:
+        socketio.emit('enrollment_error', {'error': str(e)}, to=sid)
+        return
+    
+    if options.get('activate'):
+        with voice_profiles_lock:
+            active_voice_profile['embedding'] = result['embedding']
+            active_voice_profile['type'] = 'Cloned'
+        prewarm_active_voice()
+    if options.get('name'):
+        vc_manager.save_embedding(options['name'], result['embedding'])
+    
+    socketio.emit('enrollment_done', {**result, 'reason': options.get('reason', 'stopped'),
+                                      'name': options.get('name'),
+                                      'activated': bool(options.get('activate'))}, to=sid)
+    print(f"✓ Enrolled a voice from {result['voiced_seconds']:.1f}s of speech "
+          f"({result['partials']} partials, stability {result['stability']})")
+
+
 @app.route('/save_voice', methods=['POST'])
+@requires_speech_stack
 def save_voice():
     """Save a voice embedding with a name"""
     data = request.json
@@ -992,6 +1700,7 @@ def save_voice():
     return jsonify({"success": success, "message": message})
 
 @app.route('/list_voices', methods=['GET'])
+@requires_speech_stack
 def list_voices():
     """List all saved voice clones"""
     voices = vc_manager.list_saved_embeddings()
@@ -1014,6 +1723,15 @@ def get_voice_status():
 @app.route('/get_tts_status', methods=['GET'])
 def get_tts_status():
     """Get TTS system status"""
+    if not speech_ready.is_set():
+        return jsonify({
+            'startup': startup_state,
+            'voice_cloning': {'ready': False},
+            'tts_manager': {'ready': False},
+            'synthesis_queue': synthesis_scheduler.get_status(),
+            'models': model_registry.get_status(),
+            'overall_ready': False
+        })
     try:
         vc_status = {
             'encoder_loaded': vc_manager.encoder_loaded,
@@ -1027,6 +1745,15 @@ def get_tts_status():
         return jsonify({
             'voice_cloning': vc_status,
             'tts_manager': tts_status,
+            'synthesis_queue': synthesis_scheduler.get_status(),
+            'decoder_batching': decoder_scheduler.get_status() if decoder_scheduler else {'running': False},
+            'vocoder_batching': vocoder_scheduler.get_status() if vocoder_scheduler else {'running': False},
+            'vocoder_processes': vocoder_inference.pool_size() if vocoder_inference else 0,
+            'vocoders': vocoder_backends.get_status() if vocoder_backends else {'available': []},
+            'audio_cache': audio_cache.get_status() if audio_cache else {'enabled': False},
+            'prewarm': vocabulary_prewarmer.get_status() if vocabulary_prewarmer else None,
+            'models': model_registry.get_status(),
+            'startup': startup_state,
             'overall_ready': vc_status['ready'] or tts_status['ready']
         })
     except Exception as e:
@@ -1038,6 +1765,32 @@ def get_tts_status():
         })
 
 
+# --- Health Checks ---
+
+@app.route('/health/live', methods=['GET'])
+def health_live():
+    """Liveness: the server is up and answering, whether or not the models are loaded"""
+    return jsonify({'status': 'alive', 'uptime': time.time() - startup_state['started_at']})
+
+
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    """
+    Readiness: 200 once every model is loaded and warmed up, 503 meanwhile or if loading
+    failed. Reports the startup stage, the warm-up timings and the state of each model
+    in the registry.
+    """
+    ready = startup_state['stage'] == 'ready'
+    models = model_registry.get_status()['models']
+    return jsonify({
+        'ready': ready,
+        'speech_ready': speech_ready.is_set(),
+        **startup_state,
+        'models': {name: {key: model[key] for key in ('state', 'error', 'load_time')}
+                   for name, model in models.items()}
+    }), 200 if ready else 503
+
+
 # ... (existing routes)
 
 if __name__ == '__main__':
@@ -0,0 +1,243 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from tts.synthesis_scheduler import native_lock
+
+
+class CachedAudio(object):
+    """A synthesized waveform stored in the audio cache"""
+
+    def __init__(self, wav, sample_rate, synthesis_method):
+        self.wav = wav
+        self.sample_rate = sample_rate
+        self.synthesis_method = synthesis_method
+
+    @property
+    def nbytes(self):
+        return self.wav.nbytes
+
+
+class AudioCache(object):
+    """
+    Content-addressed cache for synthesized audio.
+
+    Entries are keyed by (normalized text, voice, sample rate, model version), so the
+    same sign label spoken with the same voice is only synthesized once. Recently used
+    entries are kept in memory up to a byte budget; every entry is also written to
+    the cache directory (if given), so entries evicted from memory and entries from
+    previous runs are still served from disk instead of being re-synthesized.
+    """
+
+    def __init__(self, max_bytes, cache_dir=None, max_disk_bytes=None):
+        """
+        :param max_bytes: memory budget for cached waveforms
+        :param cache_dir: directory for the on-disk tier, None to keep the cache in memory only
+        :param max_disk_bytes: size budget for the cache directory, None for unbounded
+        """
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()  # key -> CachedAudio, least recently used first
+        self._bytes = 0
+        # The files of the cache directory, tracked as they're written, read and deleted
+        # so that keeping to the disk budget doesn't need a directory scan per write
+        self._disk_entries = OrderedDict()  # key -> file size, least recently used first
+        self._disk_bytes = 0
+        self._lock = native_lock()  # Used from synthesis worker threads
+
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._scan_disk()
+            if self.max_disk_bytes:
+                self._trim_disk()
+
+    @staticmethod
+    def normalize_text(text):
+        """Collapse case and whitespace, which the synthesizer's text cleaners ignore anyway"""
+        return " ".join(text.lower().split())
+
+    @staticmethod
+    def voice_id(embedding=None, profile=None):
+        """Identify a voice by a hash of its speaker embedding, or by its profile name"""
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            return "embed-" + hashlib.sha1(embedding.tobytes()).hexdigest()[:16]
+        return f"profile-{profile}"
+
+    @classmethod
+    def make_key(cls, text, voice, sample_rate, model_version):
+        """
+        :param text: the text that was synthesized
+        :param voice: a voice identifier, see voice_id()
+        :param sample_rate: sample rate of the audio
+        :param model_version: identifies the checkpoints that produced the audio
+        :return: the cache key as a hex string
+        """
+        raw = "\x1f".join([cls.normalize_text(text), str(voice), str(sample_rate), str(model_version)])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        :return: the CachedAudio for this key, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry
+
+        entry = self._load_from_disk(key)
+        with self._lock:
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            self._insert(key, entry)
+        return entry
+
+    def contains(self, key):
+        """Whether the key is cached in memory or on disk. Doesn't count as a lookup."""
+        with self._lock:
+            if key in self._entries:
+                return True
+        return bool(self.cache_dir) and os.path.exists(self._path(key))
+
+    def put(self, key, wav, sample_rate, synthesis_method):
+        """Store a waveform in memory and, if enabled, on disk"""
+        entry = CachedAudio(np.asarray(wav, dtype=np.float32), sample_rate, synthesis_method)
+        with self._lock:
+            self._insert(key, entry)
+        self._save_to_disk(key, entry)
+        return entry
+
+    def clear(self):
+        """Drop all in-memory entries. The on-disk tier is left untouched."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_status(self):
+        """Get cache size and hit/miss counters"""
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['disk_hits'] + self.stats['misses']
+            return {
+                'enabled': True,
+                'entries': len(self._entries),
+                'memory_bytes': self._bytes,
+                'max_memory_bytes': self.max_bytes,
+                'disk_enabled': bool(self.cache_dir),
+                'disk_entries': len(self._disk_entries),
+                'disk_bytes': self._disk_bytes,
+                'max_disk_bytes': self.max_disk_bytes,
+                'hit_rate': (self.stats['hits'] + self.stats['disk_hits']) / lookups if lookups else 0.0,
+                **self.stats
+            }
+
+    def _insert(self, key, entry):
+        # Entries larger than the whole budget are only kept on disk
+        if entry.nbytes > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+        self._entries[key] = entry
+        self._bytes += entry.nbytes
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.stats['evictions'] += 1
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _load_from_disk(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            with self._lock:
+                self._forget_file(key)
+            return None
+        try:
+            with np.load(path) as data:
+                entry = CachedAudio(data['wav'], int(data['sample_rate']), str(data['synthesis_method']))
+            # Keep recently used files when trimming the directory, also after a restart
+            os.utime(path)
+            with self._lock:
+                if key in self._disk_entries:
+                    self._disk_entries.move_to_end(key)
+            return entry
+        except Exception as e:
+            print(f"⚠ Dropping unreadable cache file {path}: {e}")
+            with self._lock:
+                self._forget_file(key)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def _save_to_disk(self, key, entry):
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, wav=entry.wav, sample_rate=entry.sample_rate,
+                         synthesis_method=entry.synthesis_method)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠ Failed to write cache file {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            self._forget_file(key)
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+        if self.max_disk_bytes and self._disk_bytes > self.max_disk_bytes:
+            self._trim_disk()
+
+    def _scan_disk(self):
+        """Index the files already in the cache directory, once at startup"""
+        try:
+            files = []
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.npz'):
+                    st = os.stat(os.path.join(self.cache_dir, name))
+                    files.append((st.st_mtime, name[:-len('.npz')], st.st_size))
+        except OSError as e:
+            print(f"⚠ Could not scan the audio cache directory {self.cache_dir}: {e}")
+            return
+        for _, key, size in sorted(files):
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+
+    def _forget_file(self, key):
+        """Drop a file from the index. The caller holds the lock."""
+        size = self._disk_entries.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+    def _trim_disk(self):
+        """Delete the least recently used files until the directory fits its budget"""
+        with self._lock:
+            evicted = []
+            while self._disk_entries and self._disk_bytes > self.max_disk_bytes:
+                key, size = self._disk_entries.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(key)
+        for key in evicted:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
@@ -61,11 +61,90 @@ LOG_SYNTHESIS_TIME = True
 MAX_SYNTHESIS_RETRIES = 2
 SYNTHESIS_TIMEOUT = 30  # seconds
 
+# Synthesis scheduler
+SYNTHESIS_WORKERS = 4  # Concurrent synthesis jobs (each runs on a native thread)
+SYNTHESIS_QUEUE_SIZE = 32  # Maximum pending jobs across all clients
+SYNTHESIS_MAX_JOBS_PER_CLIENT = 8  # Maximum pending jobs for a single client
+
+# Continuous batching: concurrent jobs share one Tacotron decoder batch.
+# Only useful with more than one synthesis worker.
+ENABLE_DECODER_BATCHING = True
+DECODER_MAX_BATCH_SIZE = 16  # Texts decoded together
+
+# Concurrent jobs vocode their spectrograms in one WaveRNN batch
+ENABLE_VOCODER_BATCHING = True
+VOCODER_MAX_BATCH_MELS = 8  # Spectrograms vocoded together
+
+# WaveRNN sampling spread over worker processes, one fold chunk per process.
+# 0 or 1 samples in the server process. Each process loads its own copy of the vocoder.
+VOCODER_PROCESSES = 0
+VOCODER_THREADS_PER_PROCESS = 1
+
+# WaveRNN fold size (target/overlap) picked per input from a calibration of the sample
+# loop at startup, cached in VOCODER_FOLD_CALIBRATION_PATH. The latency target is in
+# seconds of generation per second of audio; larger folds are used while it is met.
+VOCODER_AUTO_FOLDS = True
+VOCODER_TARGET_RTF = 0.5
+VOCODER_FOLD_CALIBRATION_PATH = os.path.join(VOICE_CLONING_MODELS_DIR, 'vocoder_folds.json')
+
+# Vocoder backends: 'wavernn' (best quality), 'hifigan' (much faster on CPU, needs a
+# generator trained on the synthesizer's mels) or 'griffinlim' (draft quality, no model).
+# Requests can pick one with "vocoder"; this is the default.
+DEFAULT_VOCODER = 'wavernn'
+HIFIGAN_MODEL_PATH = os.path.join(VOICE_CLONING_MODELS_DIR, 'hifigan.pt')
+HIFIGAN_CONFIG_PATH = os.path.join(BASE_DIR, 'utils', 'vocoder', 'config_mel.json')
+
+# Model registry: idle models (not running a job) are unloaded, least recently used
+# first, while the loaded models take more than MODEL_MEMORY_BUDGET_MB, and reloaded on
+# their next use. None for no budget. Models idle for MODEL_IDLE_UNLOAD_SECONDS are
+# unloaded as well, None to keep them.
+MODEL_MEMORY_BUDGET_MB = None
+MODEL_IDLE_UNLOAD_SECONDS = None
+
+# Staged startup: the server answers at once while the models load in the background
+# (see /health/ready). Requests that need the speech models wait up to
+# STARTUP_WAIT_SECONDS for them, then get a 503 with Retry-After STARTUP_RETRY_AFTER_SECONDS.
+STARTUP_WAIT_SECONDS = 30
+STARTUP_RETRY_AFTER_SECONDS = 5
+
+# Warm-up at startup: synthetic inputs of representative lengths are run through every
+# model (encoder, synthesizer, each vocoder backend, sign classifiers) before the
+# server reports ready, so the first requests aren't slower than the rest. The timings
+# are reported by /health/ready.
+ENABLE_WARMUP = True
+WARMUP_TEXTS = [
+    "Hello",  # A sign label
+    "Thank you very much",  # A short phrase
+    "Nice to meet you, how are you doing today?"  # A sentence
+]
+WARMUP_UTTERANCE_SECONDS = [3, 10]  # Lengths of the audio embedded by the encoder
+
 # Model validation
 MIN_MODEL_SIZE_BYTES = 1000  # Minimum file size to consider model valid
 VALIDATE_MODELS_ON_STARTUP = True
 
-# Cache settings (future enhancement)
-ENABLE_AUDIO_CACHE = False
-CACHE_DIR = os.path.join(BASE_DIR, 'cache')
-MAX_CACHE_SIZE_MB = 100
+# Streaming synthesis
+STREAM_SECTION_FRAMES = 100  # Mel frames vocoded per streamed section (~1.25s)
+STREAM_CONTEXT_FRAMES = 8  # Mel frames of context vocoded around each section
+
+# Audio cache settings
+ENABLE_AUDIO_CACHE = True
+CACHE_DIR = os.path.join(BASE_DIR, 'cache')  # Set to None to keep the cache in memory only
+MAX_CACHE_SIZE_MB = 100  # In-memory budget
+MAX_DISK_CACHE_SIZE_MB = 1000  # Budget for CACHE_DIR
+
+# Uploads (voice samples for cloning) are kept in memory, up to this size
+MAX_UPLOAD_SIZE_MB = 20
+
+# Streaming enrollment (Socket.IO): the voice embedding has converged once it's within
+# ENROLLMENT_STABILITY_THRESHOLD (cosine similarity) of the embedding
+# ENROLLMENT_STABILITY_LAG partial utterances (0.8s of speech each) earlier, with at
+# least ENROLLMENT_MIN_VOICED_SECONDS of speech. Sessions end after ENROLLMENT_MAX_SECONDS.
+ENROLLMENT_STABILITY_THRESHOLD = 0.98
+ENROLLMENT_STABILITY_LAG = 4
+ENROLLMENT_MIN_VOICED_SECONDS = 3.0
+ENROLLMENT_MAX_SECONDS = 60
+
+# Pre-synthesize the sign label vocabulary whenever the active voice changes
+ENABLE_VOICE_PREWARM = True
+PREWARM_BATCH_SIZE = 4  # Labels decoded per synthesizer batch
@@ -0,0 +1,139 @@
+import time
+
+from tts.synthesis_scheduler import native_threading
+
+
+class DecoderScheduler(object):
+    """
+    Owns the Tacotron decoder and runs it as one continuously batched loop on a
+    native thread. Callers hand in texts with synthesize_spectrograms() and block
+    until their spectrograms are done; in the meantime their texts join the running
+    batch at the next step boundary and leave it as soon as they finish. Concurrent
+    synthesis jobs thus share decoder steps instead of each running a batch of one.
+    """
+
+    def __init__(self, synthesizer, lock, max_batch_size=16):
+        """
+        :param synthesizer: the Synthesizer whose model is decoded
+        :param lock: the model lock, held for every decoder step so that other users of
+        the synthesizer can run in between. The vocoder has a lock of its own.
+        :param max_batch_size: maximum number of texts decoded together
+        """
+        self.synthesizer = synthesizer
+        self.lock = lock
+        self.max_batch_size = max_batch_size
+        self.decoder = None
+
+        threading = native_threading()
+        self._threading = threading
+        self._cond = threading.Condition()
+        self._pending = []  # (request, event) waiting to join the batch
+        self._in_batch = {}  # id(request) -> (request, event), for requests in the batch
+        self.running = False
+
+        self.stats = {'requests': 0, 'steps': 0, 'row_steps': 0, 'max_batch': 0}
+
+    def start(self):
+        """Start the decoder thread"""
+        with self._cond:
+            if self.running:
+                return
+            self.running = True
+        worker = self._threading.Thread(target=self._loop, name="decoder-scheduler")
+        worker.daemon = True
+        worker.start()
+        print(f"✓ Decoder scheduler started (batch size {self.max_batch_size})")
+
+    def stop(self):
+        """Stop the decoder thread. Waiting callers get an error."""
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+
+    def synthesize_spectrograms(self, texts, embeddings):
+        """
+        Same as Synthesizer.synthesize_spectrograms, but decoded in the shared batch.
+        Blocks until all texts are decoded, so it must not be called with the model
+        lock held.
+
+        :param texts: a list of N text prompts
+        :param embeddings: a list of N speaker embeddings
+        :return: a list of N mel spectrograms of shape (80, Mi)
+        """
+        waiting = [(self.synthesizer.decode_request(text, embedding), self._threading.Event())
+                   for text, embedding in zip(texts, embeddings)]
+        with self._cond:
+            if not self.running:
+                raise RuntimeError("Decoder scheduler is not running")
+            self._pending.extend(waiting)
+            self.stats['requests'] += len(waiting)
+            self._cond.notify()
+
+        specs = []
+        for request, event in waiting:
+            event.wait()
+            if request.error is not None:
+                raise RuntimeError(f"Decoding failed: {request.error}")
+            specs.append(self.synthesizer.trim_silence(request.mel))
+        return specs
+
+    def get_status(self):
+        with self._cond:
+            return {
+                'running': self.running,
+                'max_batch_size': self.max_batch_size,
+                'pending': len(self._pending),
+                'in_batch': len(self._in_batch),
+                'mean_batch': self.stats['row_steps'] / self.stats['steps'] if self.stats['steps'] else 0.0,
+                **self.stats
+            }
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self.running and not self._pending and not self._in_batch:
+                    self._cond.wait()
+                if not self.running:
+                    self._fail(self._pending + list(self._in_batch.values()), "stopped")
+                    return
+                free = self.max_batch_size - len(self._in_batch)
+                joining, self._pending = self._pending[:free], self._pending[free:]
+                for request, event in joining:
+                    self._in_batch[id(request)] = (request, event)
+
+            try:
+                with self.lock:
+                    if self.decoder is None:
+                        self.decoder = self.synthesizer.batch_decoder(self.max_batch_size)
+                    finished = self.decoder.step([request for request, _ in joining])
+                    batch_size = len(self.decoder.rows) + len(finished)
+                    if not self.decoder.rows:
+                        # Don't keep the model alive while idle, the registry may unload it
+                        self.decoder = None
+            except Exception as e:
+                print(f"✗ Decoder step failed: {e}")
+                if self.decoder is not None:
+                    self.decoder.fail_all(str(e))
+                    # Start the next requests on a fresh decoder, and let go of the model
+                    self.decoder = None
+                with self._cond:
+                    # Whatever was in the batch, or about to join it, is lost
+                    failed = list(self._in_batch.values())
+                    self._in_batch.clear()
+                self._fail(failed, str(e))
+                time.sleep(0.1)
+                continue
+
+            with self._cond:
+                self.stats['steps'] += 1
+                self.stats['row_steps'] += batch_size
+                self.stats['max_batch'] = max(self.stats['max_batch'], batch_size)
+                for request in finished:
+                    self._in_batch.pop(id(request))[1].set()
+
+    @staticmethod
+    def _fail(waiting, error):
+        for request, event in waiting:
+            if request.error is None:
+                request.error = error
+            event.set()
@@ -0,0 +1,323 @@
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from tts.synthesis_scheduler import native_threading
+
+
+def module_nbytes(*modules):
+    """Memory taken by the parameters and buffers of torch modules (None counts as 0)"""
+    total = 0
+    for module in modules:
+        if module is None:
+            continue
+        for value in module.state_dict().values():
+            total += _tensor_nbytes(value)
+    return total
+
+
+def _tensor_nbytes(value):
+    # Dynamically quantized layers keep their packed weights as (weight, bias) tuples
+    if isinstance(value, (tuple, list)):
+        return sum(_tensor_nbytes(v) for v in value)
+    if hasattr(value, 'element_size') and hasattr(value, 'numel'):
+        return value.element_size() * value.numel()
+    return 0
+
+
+class ModelEntry(object):
+    """A model known to the registry, loaded or not"""
+
+    def __init__(self, name, load_fn, unload_fn=None, size_fn=None, pinned=False):
+        self.name = name
+        self.load_fn = load_fn
+        self.unload_fn = unload_fn
+        self.size_fn = size_fn
+        self.pinned = pinned
+        self.load_hooks = []
+
+        self.model = None
+        self.state = 'registered'  # registered, loading, loaded, failed or unloaded
+        self.error = None  # Error of the last failed load
+        self.loading = False
+        self.unloading = False  # unload_fn is running, without the registry lock
+        self.refs = 0
+        self.nbytes = 0  # Measured at the last load, kept to make room before a reload
+        self.last_used = None
+        self.loads = 0
+        self.load_time = None
+
+    @property
+    def loaded(self):
+        return self.model is not None
+
+
+class ModelRegistry(object):
+    """
+    Owns the server's models. Each model is registered with a function that loads it;
+    users hold a reference to a model while they run it (acquire()/release(), or
+    use() as a context manager), and the model is loaded on first use.
+
+    Models nobody holds are idle and may be unloaded: least recently used first while
+    the loaded models take more than the memory budget, and after idle_timeout
+    seconds without use. An unloaded model is loaded again the next time it's used.
+    """
+
+    def __init__(self, budget_mb=None, idle_timeout=None):
+        """
+        :param budget_mb: memory budget of the loaded models, None for no budget. A model
+        in use is never unloaded, so the budget can be exceeded while models are in use.
+        :param idle_timeout: seconds after which an idle model is unloaded, None for never
+        """
+        self.budget_bytes = budget_mb * 2 ** 20 if budget_mb is not None else None
+        self.idle_timeout = idle_timeout
+        # Used from synthesis worker threads, and loads can wait for another thread's load
+        self._cond = native_threading().Condition()
+        self._entries = OrderedDict()  # name -> ModelEntry, least recently used first
+        self.stats = {'loads': 0, 'unloads': 0}
+        if idle_timeout is not None:
+            # Models also time out while nobody calls the registry
+            sweeper = native_threading().Thread(target=self._sweep, name="model-registry-sweep", daemon=True)
+            sweeper.start()
+
+    def register(self, name, load_fn, unload_fn=None, size_fn=None, pinned=False):
+        """
+        Register a model. It isn't loaded until used, or until load() is called.
+
+        :param load_fn: loads the model and returns it, i.e. what acquire() returns
+        :param unload_fn: called with the model to unload it. Models kept in module
+        globals need one; otherwise dropping the registry's reference frees the model.
+        :param size_fn: called with the model, returns its memory in bytes. Defaults to
+        module_nbytes() for torch modules, 0 for anything else.
+        :param pinned: never unload the model (it's still reported in the status)
+        """
+        with self._cond:
+            if name in self._entries:
+                raise ValueError(f"Model '{name}' is already registered")
+            self._entries[name] = ModelEntry(name, load_fn, unload_fn, size_fn, pinned)
+
+    def add_load_hook(self, name, hook):
+        """Call hook(model) every time the model is loaded, e.g. to start helpers that depend on it"""
+        with self._cond:
+            self._entries[name].load_hooks.append(hook)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def is_loaded(self, name):
+        entry = self._entries.get(name)
+        return entry is not None and entry.loaded
+
+    def acquire(self, name):
+        """
+        Take a reference to a model, loading it if needed. The model isn't unloaded
+        until every reference is released.
+
+        Raises:
+            KeyError: if no model is registered under that name
+        """
+        with self._cond:
+            entry = self._entries[name]
+            entry.refs += 1
+            while entry.loading or entry.unloading:
+                self._cond.wait()
+            if entry.loaded:
+                self._touch(entry)
+                return entry.model
+            entry.loading = True
+            entry.state = 'loading'
+            # Unload idle models before loading, so the peak stays within the budget
+            unloaded = self._enforce_budget(extra_bytes=entry.nbytes)
+        self._finish_unloads(unloaded)
+
+        try:
+            model, nbytes, load_time = self._load(entry)
+        except BaseException as e:
+            with self._cond:
+                entry.loading = False
+                entry.state, entry.error = 'failed', str(e)
+                entry.refs -= 1
+                self._cond.notify_all()
+            raise
+
+        with self._cond:
+            entry.model, entry.nbytes, entry.load_time = model, nbytes, load_time
+            entry.loading = False
+            entry.state, entry.error = 'loaded', None
+            entry.loads += 1
+            self.stats['loads'] += 1
+            self._touch(entry)
+            unloaded = self._enforce_budget()
+            self._cond.notify_all()
+        self._finish_unloads(unloaded)
+        return model
+
+    def release(self, name):
+        """Give back a reference taken with acquire()"""
+        with self._cond:
+            entry = self._entries[name]
+            entry.refs -= 1
+            self._touch(entry)
+            unloaded = self._enforce_budget()
+        self._finish_unloads(unloaded)
+
+    @contextmanager
+    def use(self, name):
+        """Holds a reference to a model for the duration of a with block, yields the model"""
+        model = self.acquire(name)
+        try:
+            yield model
+        finally:
+            self.release(name)
+
+    def load(self, name):
+        """Load a model now rather than on its first use"""
+        self.acquire(name)
+        self.release(name)
+
+    def load_concurrently(self, names):
+        """
+        Load several models at once, each on its own native thread, and wait for all of
+        them. The waiting blocks the calling thread, so under eventlet call this from a
+        native thread rather than a green one.
+
+        :return: the models that failed to load, as a dict of name -> exception
+        """
+        threading = native_threading()
+        errors = {}
+
+        def load(name):
+            try:
+                self.load(name)
+            except Exception as e:
+                errors[name] = e
+
+        threads = [threading.Thread(target=load, args=(name,), name=f"load-{name}", daemon=True)
+                   for name in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def unload(self, name):
+        """Unload a model, unless it's in use. Returns whether it was unloaded."""
+        with self._cond:
+            entry = self._entries[name]
+            if not entry.loaded or entry.refs > 0:
+                return False
+            unloaded = [self._unload(entry)]
+        self._finish_unloads(unloaded)
+        return True
+
+    def get_status(self):
+        with self._cond:
+            unloaded = self._enforce_budget()
+            now = time.time()
+            status = {
+                'budget_mb': self.budget_bytes / 2 ** 20 if self.budget_bytes is not None else None,
+                'used_mb': self._used_bytes() / 2 ** 20,
+                'idle_timeout': self.idle_timeout,
+                'models': {name: {
+                    'state': entry.state,
+                    'error': entry.error,
+                    'loaded': entry.loaded,
+                    'refs': entry.refs,
+                    'pinned': entry.pinned,
+                    'memory_mb': entry.nbytes / 2 ** 20 if entry.loaded else 0.0,
+                    'idle_seconds': now - entry.last_used if entry.last_used is not None and entry.refs == 0 else None,
+                    'loads': entry.loads,
+                    'load_time': entry.load_time
+                } for name, entry in self._entries.items()},
+                **self.stats
+            }
+        self._finish_unloads(unloaded)
+        return status
+
+    def _load(self, entry):
+        """Runs without the registry lock, other models stay usable meanwhile"""
+        start = time.time()
+        model = entry.load_fn()
+        for hook in entry.load_hooks:
+            hook(model)
+        if entry.size_fn is not None:
+            nbytes = entry.size_fn(model)
+        elif hasattr(model, 'state_dict'):
+            nbytes = module_nbytes(model)
+        else:
+            nbytes = 0
+        load_time = time.time() - start
+        if entry.loads > 0:
+            print(f"✓ Reloaded model '{entry.name}' ({nbytes / 2 ** 20:.1f} MB) in {load_time:.1f}s")
+        return model, nbytes, load_time
+
+    def _unload(self, entry):
+        """
+        Marks a model unloaded, under the registry lock. Returns (entry, model) for
+        _finish_unloads(), which runs unload_fn once the lock is released.
+        """
+        model, entry.model = entry.model, None
+        entry.state = 'unloaded'
+        entry.unloading = True
+        self.stats['unloads'] += 1
+        return entry, model
+
+    def _finish_unloads(self, unloaded):
+        """
+        Runs the unload_fn of the models _unload() marked, without the registry lock:
+        unload_fn can block (the vocoder's waits for its worker processes to exit), and
+        other models stay usable meanwhile. A model is reloaded once its unload_fn is done.
+        """
+        for entry, model in unloaded:
+            if entry.unload_fn is not None:
+                try:
+                    entry.unload_fn(model)
+                except Exception as e:
+                    print(f"⚠ Error unloading model '{entry.name}': {e}")
+            print(f"✓ Unloaded idle model '{entry.name}' ({entry.nbytes / 2 ** 20:.1f} MB)")
+        if unloaded:
+            with self._cond:
+                for entry, _ in unloaded:
+                    entry.unloading = False
+                self._cond.notify_all()
+
+    def _sweep(self):
+        """Unloads the models that time out, checking every half idle_timeout"""
+        while True:
+            with self._cond:
+                # The native condition's wait, time.sleep() may be monkey patched
+                self._cond.wait(self.idle_timeout / 2)
+                unloaded = self._enforce_budget()
+            self._finish_unloads(unloaded)
+
+    def _touch(self, entry):
+        entry.last_used = time.time()
+        self._entries.move_to_end(entry.name)
+
+    def _used_bytes(self):
+        return sum(entry.nbytes for entry in self._entries.values() if entry.loaded)
+
+    def _idle(self, entry):
+        return entry.loaded and entry.refs == 0 and not entry.pinned
+
+    def _enforce_budget(self, extra_bytes=0):
+        """
+        Unload idle models that timed out, then least recently used ones down to the
+        budget. Returns the unloaded models, to pass to _finish_unloads() after the
+        registry lock is released.
+        """
+        unloaded = []
+        if self.idle_timeout is not None:
+            deadline = time.time() - self.idle_timeout
+            for entry in list(self._entries.values()):
+                if self._idle(entry) and entry.last_used < deadline:
+                    unloaded.append(self._unload(entry))
+
+        if self.budget_bytes is None:
+            return unloaded
+        for entry in list(self._entries.values()):
+            if self._used_bytes() + extra_bytes <= self.budget_bytes:
+                break
+            if self._idle(entry):
+                unloaded.append(self._unload(entry))
+        return unloaded
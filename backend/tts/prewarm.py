@@ -0,0 +1,116 @@
+import time
+import uuid
+import threading
+
+from tts.synthesis_scheduler import run_native
+
+
+class PrewarmJob(object):
+    """Pre-synthesis of a vocabulary for one voice"""
+
+    def __init__(self, texts, params=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.texts = texts
+        self.params = params or {}
+        self.done = 0
+        self.synthesized = 0
+        self.status = 'running'  # running, done, cancelled, failed
+        self.started_at = time.time()
+        self.finished_at = None
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def to_dict(self):
+        return {
+            'prewarm_id': self.id,
+            'status': self.status,
+            'done': self.done,
+            'synthesized': self.synthesized,
+            'total': len(self.texts)
+        }
+
+
+class VocabularyPrewarmer(object):
+    """
+    Synthesizes a fixed vocabulary (e.g. the sign labels) in the background so that
+    the first utterance of every word is served from the audio cache.
+
+    Only one job runs at a time: starting a new job (because the active voice
+    changed) cancels the previous one at its next batch boundary.
+    """
+
+    def __init__(self, synthesize_batch_fn, emit_fn=None, batch_size=4):
+        """
+        :param synthesize_batch_fn: called as synthesize_batch_fn(texts, params) on a native
+        thread; synthesizes and caches the texts, returns how many were actually synthesized
+        :param emit_fn: Socket.IO style emit(event, payload) for progress events
+        :param batch_size: number of texts synthesized per batch
+        """
+        self.synthesize_batch_fn = synthesize_batch_fn
+        self.emit_fn = emit_fn
+        self.batch_size = max(1, batch_size)
+        self.current_job = None
+        self._lock = threading.Lock()
+
+    def start(self, texts, **params):
+        """
+        Cancel the running job, if any, and start pre-synthesizing texts.
+
+        :param texts: the vocabulary to synthesize
+        :param params: passed on to synthesize_batch_fn (e.g. the voice)
+        :return: the new PrewarmJob
+        """
+        job = PrewarmJob(list(texts), params=params)
+        with self._lock:
+            if self.current_job is not None:
+                self.current_job.cancel()
+            self.current_job = job
+
+        worker = threading.Thread(target=self._run, args=(job,), name=f"prewarm-{job.id}")
+        worker.daemon = True
+        worker.start()
+        return job
+
+    def cancel(self):
+        """Cancel the running job, if any"""
+        with self._lock:
+            if self.current_job is not None:
+                self.current_job.cancel()
+
+    def get_status(self):
+        with self._lock:
+            return self.current_job.to_dict() if self.current_job else None
+
+    def _run(self, job):
+        self._emit('prewarm_started', job)
+        try:
+            for i in range(0, len(job.texts), self.batch_size):
+                if job.is_cancelled():
+                    break
+                batch = job.texts[i:i + self.batch_size]
+                job.synthesized += run_native(self.synthesize_batch_fn, batch, job.params)
+                job.done += len(batch)
+                self._emit('prewarm_progress', job)
+        except Exception as e:
+            job.status = 'failed'
+            print(f"✗ Prewarm {job.id} failed: {e}")
+        else:
+            job.status = 'cancelled' if job.is_cancelled() else 'done'
+        job.finished_at = time.time()
+
+        print(f"Prewarm {job.id} {job.status}: {job.done}/{len(job.texts)} texts, "
+              f"{job.synthesized} synthesized in {job.finished_at - job.started_at:.1f}s")
+        self._emit('prewarm_done', job)
+
+    def _emit(self, event, job):
+        if self.emit_fn is None:
+            return
+        try:
+            self.emit_fn(event, job.to_dict())
+        except Exception as e:
+            print(f"⚠ Failed to emit {event}: {e}")
@@ -0,0 +1,129 @@
+from contextlib import ExitStack
+
+from tts.synthesis_scheduler import native_lock
+
+
+class SpeechModels(object):
+    """
+    Runs the synthesizer and the vocoder for the speech managers, which share one
+    instance. Spectrograms are decoded in the shared decoder batch and vocoded by the
+    requested vocoder backend or in the shared vocoder batch when the server set those
+    up, otherwise directly, under the model's lock.
+
+    The models keep per-call state and must not run two jobs at once, each has a lock:
+    the Tacotron its attention state (lock, held per decoder call, block or step), the
+    WaveRNN its sample loop (vocoder_lock, held per vocoder batch or section). A lock is
+    never held across both, so decoding and vocoding overlap.
+
+    The models are taken from the registry ('synthesizer' is the Synthesizer, 'vocoder'
+    the vocoder.inference module); callers hold them there with using() while they run.
+    """
+
+    def __init__(self, registry, lock=None, vocoder_lock=None):
+        """
+        :param registry: the ModelRegistry the models are registered in
+        :param lock: the synthesizer's lock, a native lock by default
+        :param vocoder_lock: the vocoder's lock, a native lock by default
+        """
+        self.registry = registry
+        self.lock = lock if lock is not None else native_lock()
+        self.vocoder_lock = vocoder_lock if vocoder_lock is not None else native_lock()
+        # Optional shared decoder and vocoder batches (see tts.decoder_scheduler and
+        # tts.vocoder_scheduler), set by the server
+        self.decoder_scheduler = None
+        self.vocoder_scheduler = None
+        # Optional tts.vocoder_backends.VocoderBackends, set by the server, to pick the
+        # vocoder per request. Without it, the WaveRNN is used.
+        self.vocoders = None
+
+    def backend(self, vocoder_name=None):
+        """The vocoder backend serving a request for vocoder_name, None without backends (WaveRNN)"""
+        return self.vocoders.get(vocoder_name) if self.vocoders is not None else None
+
+    def using(self, vocoder_name=None):
+        """
+        Hold the synthesizer, and the WaveRNN if it's the vocoder used, in the registry
+        for the duration of a with block
+        """
+        backend = self.backend(vocoder_name)
+        names = ['synthesizer'] + (['vocoder'] if backend is None or backend.name == 'wavernn' else [])
+        stack = ExitStack()
+        for name in names:
+            stack.enter_context(self.registry.use(name))
+        return stack
+
+    def synthesize_spectrograms(self, texts, embeddings):
+        """
+        Decode texts, in the shared decoder batch if there is one, otherwise directly
+        while holding the synthesizer's lock.
+
+        :param texts: a list of N text prompts
+        :param embeddings: a list of N speaker embeddings
+        :return: a list of N mel spectrograms
+        """
+        if self.decoder_scheduler is not None:
+            return self.decoder_scheduler.synthesize_spectrograms(texts, embeddings)
+        with self.registry.use('synthesizer') as synthesizer, self.lock:
+            return synthesizer.synthesize_spectrograms(texts, embeddings)
+
+    def infer_waveforms(self, specs, vocoder_name=None):
+        """
+        Vocode spectrograms in one batch, with the requested vocoder backend if there
+        are several, shared with other callers if there is a vocoder scheduler,
+        otherwise directly while holding the vocoder's lock.
+
+        :return: a list of waveforms, in the order of specs
+        """
+        if self.vocoders is not None:
+            return self.vocoders.get(vocoder_name).infer_waveforms(specs)
+        if self.vocoder_scheduler is not None:
+            return self.vocoder_scheduler.infer_waveforms(specs)
+        with self.registry.use('vocoder') as vocoder, self.vocoder_lock:
+            return vocoder.infer_waveforms(specs)
+
+    def synthesize_stream(self, texts, embedding, section_frames=100, context_frames=8, vocoder_name=None):
+        """
+        Decode and vocode texts section by section, for streaming playback. The vocoder
+        starts on a text's first section while the decoder is still running. Vocoders
+        that can't vocode the decoder's mel blocks as they arrive stream text by text.
+
+        :param texts: the texts, e.g. the sentences of a longer text, decoded one by one
+        :param embedding: the speaker embedding
+        :param section_frames: mel frames vocoded per section
+        :param context_frames: mel frames of context vocoded around each section
+        :return: a generator of waveform sections, in order
+        """
+        backend = self.backend(vocoder_name)
+        with self.using(vocoder_name):
+            if backend is not None and not backend.supports_streaming:
+                # This vocoder needs whole spectrograms, the texts are the sections
+                for text in texts:
+                    spec = self.synthesize_spectrograms([text], [embedding])[0]
+                    yield backend.infer_waveforms([spec])[0]
+                return
+
+            if backend is not None:
+                sections = backend.infer_waveform_stream(self._mel_blocks(texts, embedding),
+                                                         section_frames, context_frames)
+            else:
+                with self.registry.use('vocoder') as vocoder:
+                    stream_fn = vocoder.infer_waveform_stream
+                sections = stream_fn(self._mel_blocks(texts, embedding), section_frames, context_frames,
+                                     lock=self.vocoder_lock)
+            yield from sections
+
+    def _mel_blocks(self, texts, embedding):
+        """
+        The mel blocks of the texts, decoded one after the other. The decoder keeps its
+        state in the generator, so the synthesizer's lock is only held while a block is
+        decoded; it's never held by the vocoder pulling the blocks.
+        """
+        with self.registry.use('synthesizer') as synthesizer:
+            for text in texts:
+                blocks = synthesizer.synthesize_spectrogram_stream(text, embedding)
+                while True:
+                    with self.lock:
+                        block = next(blocks, None)
+                    if block is None:
+                        break
+                    yield block
@@ -0,0 +1,259 @@
+import time
+import uuid
+import inspect
+import threading
+from collections import deque, OrderedDict
+
+# Model inference has to run on native OS threads: under eventlet the
+# `threading` module is monkey patched into green threads, and a green thread
+# running Tacotron/WaveRNN would stall the hub (and every socket) for seconds.
+try:
+    from eventlet import patcher, tpool
+except ImportError:
+    patcher = tpool = None
+
+
+def native_threading():
+    """The unpatched threading module, for primitives shared with native threads"""
+    if patcher is not None and patcher.is_monkey_patched('thread'):
+        return patcher.original('threading')
+    return threading
+
+
+def native_lock():
+    """
+    A lock that works across native threads. Under eventlet monkey patching
+    threading.Lock is a green lock, which cannot be shared between tpool threads.
+    """
+    return native_threading().Lock()
+
+
+def run_native(fn, *args):
+    """Run fn on a native thread when running under eventlet, otherwise inline"""
+    if tpool is not None and patcher.is_monkey_patched('thread'):
+        return tpool.execute(fn, *args)
+    return fn(*args)
+
+
+def _next_chunk(generator):
+    try:
+        return False, next(generator)
+    except StopIteration as stop:
+        return True, stop.value
+
+
+def iterate_native(generator):
+    """
+    Iterate over a generator, running each of its steps on a native thread.
+    Returns the generator's return value (when used with `yield from`).
+    """
+    while True:
+        done, value = run_native(_next_chunk, generator)
+        if done:
+            return value
+        yield value
+
+
+class QueueFullError(Exception):
+    """Raised when the synthesis queue cannot accept another job"""
+    pass
+
+
+class SynthesisJob(object):
+    """A single queued speech synthesis request"""
+
+    def __init__(self, text, client_id=None, params=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.text = text
+        self.client_id = client_id
+        self.params = params or {}
+        self.status = 'queued'  # queued, running, done, failed
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'text': self.text,
+            'status': self.status
+        }
+
+
+class SynthesisScheduler(object):
+    """
+    Bounded job queue with a pool of synthesis workers.
+
+    Jobs are queued per client and dispatched round-robin, so a client that submits
+    many requests cannot starve the others. Each worker picks up a job, emits
+    `speech_started`, runs `process_fn(job)` on a native thread and hands the result
+    to `complete_fn(job, result)` back on the event loop.
+
+    For streaming, process_fn may return a generator instead. Each step of the
+    generator then runs on a native thread and every yielded chunk is handed to
+    `chunk_fn(job, chunk, seq)` on the event loop as soon as it is produced; the
+    generator's return value is passed to complete_fn.
+    """
+
+    def __init__(self, process_fn, complete_fn, error_fn=None, emit_fn=None, chunk_fn=None,
+                 num_workers=1, max_queue_size=32, max_jobs_per_client=8):
+        """
+        :param process_fn: heavy work, called as process_fn(job) on a native thread
+        :param complete_fn: called as complete_fn(job, result) once process_fn returns
+        :param error_fn: called as error_fn(job, exception) if process_fn raises
+        :param chunk_fn: called as chunk_fn(job, chunk, seq) for each chunk of a streaming job
+        :param emit_fn: Socket.IO style emit(event, payload) for queue events
+        :param num_workers: number of jobs that may be processed concurrently
+        :param max_queue_size: maximum number of jobs waiting across all clients
+        :param max_jobs_per_client: maximum number of jobs waiting for a single client
+        """
+        self.process_fn = process_fn
+        self.complete_fn = complete_fn
+        self.error_fn = error_fn
+        self.emit_fn = emit_fn
+        self.chunk_fn = chunk_fn
+        self.num_workers = max(1, int(num_workers))
+        self.max_queue_size = max_queue_size
+        self.max_jobs_per_client = max_jobs_per_client
+
+        self._queues = OrderedDict()  # client_id -> deque of pending jobs
+        self._pending = 0
+        self._running = {}  # job_id -> job
+        self._cond = threading.Condition()
+        self._workers = []
+        self.running = False
+
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+
+    def start(self):
+        """Start the worker pool"""
+        with self._cond:
+            if self.running:
+                return
+            self.running = True
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"synthesis-worker-{i}")
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+        print(f"✓ Synthesis scheduler started ({self.num_workers} worker(s), queue size {self.max_queue_size})")
+
+    def stop(self):
+        """Stop the workers once their current job is finished. Pending jobs are dropped."""
+        with self._cond:
+            self.running = False
+            self._queues.clear()
+            self._pending = 0
+            self._cond.notify_all()
+
+    def submit(self, text, client_id=None, **params):
+        """
+        Queue a synthesis job.
+
+        :param text: text to synthesize
+        :param client_id: key used for fair scheduling (e.g. the Socket.IO sid)
+        :param params: extra values made available to process_fn as job.params
+        :return: the queued SynthesisJob
+        :raises QueueFullError: if the queue or the client's share of it is full
+        """
+        with self._cond:
+            client_queue = self._queues.get(client_id)
+            if self._pending >= self.max_queue_size:
+                self.stats['rejected'] += 1
+                raise QueueFullError(f"Synthesis queue is full ({self.max_queue_size} jobs pending)")
+            if (self.max_jobs_per_client and client_queue is not None
+                    and len(client_queue) >= self.max_jobs_per_client):
+                self.stats['rejected'] += 1
+                raise QueueFullError(f"Too many pending synthesis jobs for this client "
+                                     f"({self.max_jobs_per_client})")
+
+            job = SynthesisJob(text, client_id=client_id, params=params)
+            if client_queue is None:
+                client_queue = self._queues[client_id] = deque()
+            client_queue.append(job)
+            self._pending += 1
+            self.stats['submitted'] += 1
+            position = self._pending
+            self._cond.notify()
+
+        self._emit('speech_queued', job, position=position)
+        return job
+
+    def get_status(self):
+        """Get queue depth, running jobs and counters"""
+        with self._cond:
+            return {
+                'running': self.running,
+                'workers': self.num_workers,
+                'max_queue_size': self.max_queue_size,
+                'pending': self._pending,
+                'in_progress': [job.to_dict() for job in self._running.values()],
+                **self.stats
+            }
+
+    def _next_job(self):
+        """Round-robin over clients: take the head job of the first client, then rotate it to the back"""
+        client_id, client_queue = next(iter(self._queues.items()))
+        job = client_queue.popleft()
+        del self._queues[client_id]
+        if client_queue:
+            self._queues[client_id] = client_queue
+        self._pending -= 1
+        return job
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while self.running and self._pending == 0:
+                    self._cond.wait()
+                if not self.running:
+                    return
+                job = self._next_job()
+                job.status = 'running'
+                job.started_at = time.time()
+                self._running[job.id] = job
+
+            self._emit('speech_started', job)
+            try:
+                result = run_native(self.process_fn, job)
+                if inspect.isgenerator(result):
+                    result = self._drain(job, result)
+            except Exception as e:
+                job.status = 'failed'
+                job.error = str(e)
+                job.finished_at = time.time()
+                self.stats['failed'] += 1
+                print(f"✗ Synthesis job {job.id} failed: {e}")
+                if self.error_fn:
+                    self.error_fn(job, e)
+            else:
+                job.status = 'done'
+                job.finished_at = time.time()
+                self.stats['completed'] += 1
+                try:
+                    self.complete_fn(job, result)
+                except Exception as e:
+                    print(f"✗ Error delivering synthesis job {job.id}: {e}")
+            finally:
+                with self._cond:
+                    self._running.pop(job.id, None)
+
+    def _drain(self, job, generator):
+        """Step a streaming job's generator on native threads, delivering chunks in between"""
+        seq = 0
+        while True:
+            done, value = run_native(_next_chunk, generator)
+            if done:
+                return value
+            if self.chunk_fn:
+                self.chunk_fn(job, value, seq)
+            seq += 1
+
+    def _emit(self, event, job, **extra):
+        if self.emit_fn is None:
+            return
+        try:
+            self.emit_fn(event, {**job.to_dict(), **extra})
+        except Exception as e:
+            print(f"⚠ Failed to emit {event}: {e}")
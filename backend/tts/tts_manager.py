@@ -4,6 +4,9 @@ import torch
 import numpy as np
 from pathlib import Path
 
+from tts.model_registry import ModelRegistry, module_nbytes
+from tts.speech_models import SpeechModels
+
 # Add clone path for voice cloning TTS
 current_dir = os.path.dirname(os.path.abspath(__file__))
 clone_dir = os.path.join(os.path.dirname(current_dir), 'clone')
@@ -18,7 +21,17 @@ class TTSManager:
     def __init__(self, 
                  parrot_checkpoint_path=None, 
                  vocoder_checkpoint_path=None,
-                 device=None):
+                 device=None,
+                 registry=None,
+                 models=None):
+        """
+        Args:
+            registry: ModelRegistry holding the models. A synthesizer and vocoder already
+                registered there (e.g. by the VoiceCloningManager) are shared rather than
+                loaded again.
+            models: SpeechModels running the synthesizer and vocoder, shared with the
+                other users of the models (its registry is then the one used)
+        """
         
         self.device = device if device else torch.device("cuda" if torch.cuda.is_available() else "cpu")
         print(f"TTSManager initializing on {self.device}...")
@@ -38,6 +51,12 @@ class TTSManager:
         # Initialize voice cloning models for profile-based TTS
         self.synthesizer = None
         self.vocoder_loaded = False
+        if models is not None:
+            registry = models.registry
+        self.registry = registry if registry is not None else ModelRegistry()
+        # Runs the synthesizer and vocoder, through the server's schedulers and vocoder
+        # backends once it sets them up on it
+        self.models = models if models is not None else SpeechModels(self.registry)
         
         # Speaker profiles with pre-generated embeddings (will be created if models available)
         self.speaker_profiles = {
@@ -61,16 +80,39 @@ class TTSManager:
             syn_path = os.path.join(clone_models_dir, 'synthesizer.pt')
             voc_path = os.path.join(clone_models_dir, 'vocoder.pt')
             
-            if os.path.exists(syn_path) and os.path.getsize(syn_path) > 1000:
+            if 'synthesizer' in self.registry:
+                # Already registered by another user of the models
+                with self.registry.use('synthesizer') as synthesizer:
+                    self.synthesizer = synthesizer
+                print("✓ Synthesizer shared")
+            elif os.path.exists(syn_path) and os.path.getsize(syn_path) > 1000:
                 print(f"Loading synthesizer from {syn_path}...")
-                self.synthesizer = self.Synthesizer(syn_path)
+                synthesizer = self.Synthesizer(syn_path)
+                
+                def load_synthesizer():
+                    synthesizer.load()
+                    return synthesizer
+                self.registry.register('synthesizer', load_synthesizer,
+                                       unload_fn=lambda synthesizer: synthesizer.unload(),
+                                       size_fn=lambda synthesizer: module_nbytes(synthesizer.get_model()))
+                self.synthesizer = synthesizer
                 print("✓ Synthesizer loaded")
             else:
                 print(f"⚠ Synthesizer not found at {syn_path}")
             
-            if os.path.exists(voc_path) and os.path.getsize(voc_path) > 1000:
+            if 'vocoder' in self.registry:
+                self.vocoder_loaded = True
+                print("✓ Vocoder shared")
+            elif os.path.exists(voc_path) and os.path.getsize(voc_path) > 1000:
                 print(f"Loading vocoder from {voc_path}...")
-                self.vocoder.load_model(voc_path)
+                
+                def load_vocoder():
+                    self.vocoder.load_model(voc_path)
+                    return self.vocoder
+                self.registry.register('vocoder', load_vocoder,
+                                       unload_fn=lambda vocoder: vocoder.unload_model(),
+                                       size_fn=lambda vocoder: module_nbytes(vocoder.get_model(), vocoder.get_sampler()))
+                self.registry.load('vocoder')
                 self.vocoder_loaded = True
                 print("✓ Vocoder loaded")
             else:
@@ -108,7 +150,7 @@ class TTSManager:
         except Exception as e:
             print(f"⚠ Error generating default embeddings: {e}")
     
-    def synthesize(self, text, speaker_id=0, embedding=None):
+    def synthesize(self, text, speaker_id=0, embedding=None, vocoder_name=None):
         """
         Synthesize speech from text.
         
@@ -121,6 +163,7 @@ class TTSManager:
             text: Text to synthesize
             speaker_id: Speaker ID (0=Natural, 1=Professional, 2=Warm)
             embedding: Optional voice embedding from voice cloning
+            vocoder_name: Name of the vocoder backend, None for the default
             
         Returns:
             numpy array of audio samples (int16 or float32)
@@ -132,17 +175,17 @@ class TTSManager:
         
         # Priority 1: Use provided embedding (cloned voice)
         if embedding is not None:
-            return self._synthesize_with_embedding(text, embedding)
+            return self._synthesize_with_embedding(text, embedding, vocoder_name)
         
         # Priority 2: Use speaker profile embedding
         if self.speaker_profiles.get(profile_name) is not None:
-            return self._synthesize_with_embedding(text, self.speaker_profiles[profile_name])
+            return self._synthesize_with_embedding(text, self.speaker_profiles[profile_name], vocoder_name)
         
         # Priority 3: Fall back to mock audio
         print(f"⚠ Using mock audio for '{profile_name}' profile")
         return self._generate_mock_audio(speaker_id, text)
     
-    def _synthesize_with_embedding(self, text, embedding):
+    def _synthesize_with_embedding(self, text, embedding, vocoder_name=None):
         """Synthesize using voice cloning with embedding"""
         if not self.synthesizer or not self.vocoder_loaded:
             print("⚠ Models not loaded, using mock audio")
@@ -153,12 +196,18 @@ class TTSManager:
             if isinstance(embedding, list):
                 embedding = np.array(embedding, dtype=np.float32)
             
-            # Synthesize mel spectrogram
-            specs = self.synthesizer.synthesize_spectrograms([text], [embedding])
-            spec = specs[0]
+            # Split long texts into sentences, which are decoded as one batch
+            segments = self.Synthesizer.split_text(text)
+            
+            # Keep the models loaded while they are used
+            with self.models.using(vocoder_name):
+                # Synthesize mel spectrograms
+                specs = self.models.synthesize_spectrograms(segments, [embedding] * len(segments))
+                
+                # Generate waveforms, all segments in one batch
+                wavs = self.models.infer_waveforms(specs, vocoder_name)
             
-            # Generate waveform
-            wav = self.vocoder.infer_waveform(spec)
+            wav = self.Synthesizer.join_segments(wavs)
             
             # Normalize
             wav = wav / (np.abs(wav).max() + 1e-8) * 0.95
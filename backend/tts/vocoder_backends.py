@@ -0,0 +1,188 @@
+"""
+Interchangeable vocoders for the synthesizer's mel spectrograms.
+
+All backends take the synthesizer's mel spectrograms of shape (n_mels, frames) and
+return waveforms at the synthesizer's sample rate, so they can be swapped per request:
+
+- wavernn: the autoregressive WaveRNN of the voice cloning models. Best quality, but
+  it generates sample by sample, which is slow on CPU.
+- hifigan: a mel-conditioned HiFi-GAN generator (tts/utils/vocoder/models.py). It is
+  not autoregressive and runs about an order of magnitude faster than WaveRNN on CPU.
+  Needs a generator trained on the synthesizer's mel spectrograms.
+- griffinlim: no vocoder model at all, the mel spectrograms are inverted by a batched
+  fast Griffin-Lim in torch. Draft quality, but near instant and always available.
+
+torch is only imported by the backends that run a model, so the backend names can be
+imported cheaply, before the models are loaded.
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+
+class VocoderBackend(object):
+    """A vocoder turning the synthesizer's mel spectrograms into waveforms"""
+
+    name = None
+    # Whether the backend can vocode the mel blocks of a streaming decoder as they
+    # arrive (infer_waveform_stream), rather than one whole spectrogram at a time
+    supports_streaming = False
+
+    def infer_waveforms(self, mels):
+        """
+        :param mels: list of mel spectrograms of shape (n_mels, frames)
+        :return: list of waveforms as numpy arrays, in the order of mels
+        """
+        raise NotImplementedError()
+
+    def get_step(self):
+        """Training step of the checkpoint, or None for backends without a model"""
+        return None
+
+    def get_status(self):
+        return {'name': self.name, 'streaming': self.supports_streaming}
+
+
+class WaveRNNBackend(VocoderBackend):
+    name = 'wavernn'
+    supports_streaming = True
+
+    def __init__(self, vocoder, lock, scheduler=None):
+        """
+        :param vocoder: the loaded vocoder.inference module
+        :param lock: the vocoder lock, held while vocoding without a scheduler
+        :param scheduler: optional VocoderScheduler, to vocode together with other jobs
+        """
+        self.vocoder = vocoder
+        self.lock = lock
+        self.scheduler = scheduler
+
+    def infer_waveforms(self, mels):
+        if self.scheduler is not None:
+            return self.scheduler.infer_waveforms(mels)
+        with self.lock:
+            return self.vocoder.infer_waveforms(mels)
+
+    def infer_waveform_stream(self, mel_blocks, section_frames, context_frames):
+        """See vocoder.inference.infer_waveform_stream. The vocoder lock is held per section."""
+        return self.vocoder.infer_waveform_stream(mel_blocks, section_frames, context_frames, lock=self.lock)
+
+    def get_step(self):
+        return self.vocoder.get_step()
+
+
+class HiFiGANBackend(VocoderBackend):
+    name = 'hifigan'
+
+    def __init__(self, checkpoint_path, config_path, hparams, device=None):
+        """
+        :param checkpoint_path: HiFi-GAN checkpoint, with the generator weights under 'generator'
+        :param config_path: json config of the generator
+        :param hparams: the synthesizer's hparams, which the generator must match
+        """
+        import torch
+        # The HiFi-GAN code imports its helpers as the top level package 'utils'
+        tts_dir = os.path.dirname(os.path.abspath(__file__))
+        if tts_dir not in sys.path:
+            sys.path.append(tts_dir)
+        from utils.vocoder.models import Generator
+        from utils.vocoder.utils import AttrDict
+
+        with open(config_path) as f:
+            h = AttrDict(json.load(f))
+        if h.model_in_dim != hparams.num_mels or int(np.prod(h.upsample_rates)) != hparams.hop_size:
+            raise ValueError(f"HiFi-GAN config {config_path} doesn't match the synthesizer "
+                             f"({hparams.num_mels} mels, hop size {hparams.hop_size})")
+
+        self.device = device if device else torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.hop_size = hparams.hop_size
+        self.pad_value = -hparams.max_abs_value  # Silence in the synthesizer's mel scale
+
+        checkpoint = torch.load(checkpoint_path, map_location=self.device)
+        self.generator = Generator(h).to(self.device)
+        self.generator.load_state_dict(checkpoint['generator'])
+        self.generator.eval()
+        self.generator.remove_weight_norm()
+        self.step = checkpoint.get('steps')
+
+    def infer_waveforms(self, mels):
+        if len(mels) == 0:
+            return []
+        import torch
+        # The generator is fully convolutional: pad to the longest and vocode in one batch
+        n_frames = [mel.shape[1] for mel in mels]
+        batch = np.full((len(mels), mels[0].shape[0], max(n_frames)), self.pad_value, dtype=np.float32)
+        for i, mel in enumerate(mels):
+            batch[i, :, :mel.shape[1]] = mel
+
+        with torch.inference_mode():
+            wavs = self.generator(torch.from_numpy(batch).to(self.device))[:, 0].cpu().numpy()
+        return [wav[:frames * self.hop_size] for wav, frames in zip(wavs, n_frames)]
+
+    def get_step(self):
+        return self.step
+
+
+class GriffinLimBackend(VocoderBackend):
+    name = 'griffinlim'
+
+    def __init__(self, synthesizer_class):
+        """
+        :param synthesizer_class: the Synthesizer class, whose griffin_lim_batch() is used
+        """
+        self.Synthesizer = synthesizer_class
+
+    def infer_waveforms(self, mels):
+        if len(mels) == 0:
+            return []
+        return self.Synthesizer.griffin_lim_batch(mels)
+
+
+class VocoderBackends(object):
+    """The available vocoder backends, by name, and the default one"""
+
+    def __init__(self, default='wavernn'):
+        self.default = default
+        self.backends = {}
+
+    def register(self, backend):
+        self.backends[backend.name] = backend
+
+    def available(self):
+        return list(self.backends)
+
+    def resolve(self, name=None):
+        """
+        The name of the backend a request for <name> is served by: the default for None,
+        or when the requested backend is known but not loaded.
+
+        Raises:
+            ValueError: for unknown names
+        """
+        if name is None:
+            name = self.default
+        if name not in VOCODER_NAMES:
+            raise ValueError(f"Unknown vocoder: {name} (expected one of {', '.join(VOCODER_NAMES)})")
+        if name in self.backends:
+            return name
+        if self.default in self.backends:
+            print(f"⚠ Vocoder '{name}' is not loaded, using '{self.default}'")
+            return self.default
+        if not self.backends:
+            raise RuntimeError("No vocoder is loaded")
+        return next(iter(self.backends))
+
+    def get(self, name=None):
+        return self.backends[self.resolve(name)]
+
+    def get_status(self):
+        return {
+            'default': self.default,
+            'available': self.available(),
+            'backends': {name: backend.get_status() for name, backend in self.backends.items()}
+        }
+
+
+VOCODER_NAMES = (WaveRNNBackend.name, HiFiGANBackend.name, GriffinLimBackend.name)
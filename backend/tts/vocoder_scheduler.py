@@ -0,0 +1,130 @@
+from tts.synthesis_scheduler import native_threading
+
+
+class VocodeRequest(object):
+    """Spectrograms of one caller, waiting to be vocoded"""
+
+    def __init__(self, mels, event):
+        self.mels = mels
+        self.event = event
+        self.wavs = None
+        self.error = None
+
+
+class VocoderScheduler(object):
+    """
+    Vocodes the spectrograms of concurrent synthesis jobs together. WaveRNN costs
+    about the same per sample step whether it runs one fold or a few dozen, so while
+    one batch is being vocoded the spectrograms of other jobs queue up and all go
+    into the next batch, in a single infer_waveforms() call.
+    """
+
+    def __init__(self, infer_waveforms_fn, lock, max_batch_mels=8):
+        """
+        :param infer_waveforms_fn: vocodes a list of mels, e.g. vocoder.infer_waveforms
+        :param lock: the vocoder lock, held while a batch is vocoded. It's not the
+        synthesizer's model lock, so the decoder keeps stepping meanwhile.
+        :param max_batch_mels: maximum number of spectrograms vocoded together (a single
+        request with more spectrograms is still vocoded at once)
+        """
+        self.infer_waveforms_fn = infer_waveforms_fn
+        self.lock = lock
+        self.max_batch_mels = max_batch_mels
+
+        threading = native_threading()
+        self._threading = threading
+        self._cond = threading.Condition()
+        self._pending = []
+        self.running = False
+
+        self.stats = {'requests': 0, 'batches': 0, 'mels': 0, 'max_batch': 0}
+
+    def start(self):
+        """Start the vocoder thread"""
+        with self._cond:
+            if self.running:
+                return
+            self.running = True
+        worker = self._threading.Thread(target=self._loop, name="vocoder-scheduler")
+        worker.daemon = True
+        worker.start()
+        print(f"✓ Vocoder scheduler started (up to {self.max_batch_mels} spectrograms per batch)")
+
+    def stop(self):
+        """Stop the vocoder thread. Waiting callers get an error."""
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+
+    def infer_waveforms(self, mels):
+        """
+        Vocode spectrograms together with those of other callers. Blocks until done,
+        so it must not be called with the vocoder lock held.
+
+        :param mels: list of mel spectrograms of shape (n_mels, frames)
+        :return: list of waveforms, in the order of mels
+        """
+        request = VocodeRequest(list(mels), self._threading.Event())
+        with self._cond:
+            if not self.running:
+                raise RuntimeError("Vocoder scheduler is not running")
+            self._pending.append(request)
+            self.stats['requests'] += 1
+            self._cond.notify()
+
+        request.event.wait()
+        if request.error is not None:
+            raise RuntimeError(f"Vocoding failed: {request.error}")
+        return request.wavs
+
+    def get_status(self):
+        with self._cond:
+            return {
+                'running': self.running,
+                'max_batch_mels': self.max_batch_mels,
+                'pending': len(self._pending),
+                'mean_batch': self.stats['mels'] / self.stats['batches'] if self.stats['batches'] else 0.0,
+                **self.stats
+            }
+
+    def _next_batch(self):
+        """Take whole requests off the queue until the batch is full"""
+        batch, n_mels = [], 0
+        while self._pending and (not batch or n_mels + len(self._pending[0].mels) <= self.max_batch_mels):
+            request = self._pending.pop(0)
+            batch.append(request)
+            n_mels += len(request.mels)
+        return batch, n_mels
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self.running and not self._pending:
+                    self._cond.wait()
+                if not self.running:
+                    batch, self._pending = self._pending, []
+                    for request in batch:
+                        request.error = "stopped"
+                        request.event.set()
+                    return
+                batch, n_mels = self._next_batch()
+
+            try:
+                with self.lock:
+                    wavs = self.infer_waveforms_fn([mel for request in batch for mel in request.mels])
+            except Exception as e:
+                print(f"✗ Vocoder batch failed: {e}")
+                for request in batch:
+                    request.error = str(e)
+                    request.event.set()
+                continue
+
+            with self._cond:
+                self.stats['batches'] += 1
+                self.stats['mels'] += n_mels
+                self.stats['max_batch'] = max(self.stats['max_batch'], n_mels)
+            i = 0
+            for request in batch:
+                request.wavs = wavs[i:i + len(request.mels)]
+                i += len(request.mels)
+                request.event.set()
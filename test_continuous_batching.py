@@ -0,0 +1,84 @@
+import sys
+import os
+
+# Set up paths
+backend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+sys.path.append(backend_dir)
+sys.path.append(os.path.join(backend_dir, "clone"))
+
+import numpy as np
+import torch
+
+from synthesizer.continuous_batching import ContinuousBatchDecoder
+from synthesizer.hparams import hparams
+from synthesizer.inference import Synthesizer
+from synthesizer.models.tacotron import PreNet, Tacotron
+from synthesizer.utils.symbols import symbols
+
+
+def _model():
+    """A Tacotron with random weights and the prenets' dropout (on at inference) disabled"""
+    torch.manual_seed(0)
+    model = Tacotron(embed_dims=hparams.tts_embed_dims,
+                     num_chars=len(symbols),
+                     encoder_dims=hparams.tts_encoder_dims,
+                     decoder_dims=hparams.tts_decoder_dims,
+                     n_mels=hparams.num_mels,
+                     fft_bins=hparams.num_mels,
+                     postnet_dims=hparams.tts_postnet_dims,
+                     encoder_K=hparams.tts_encoder_K,
+                     lstm_dims=hparams.tts_lstm_dims,
+                     postnet_K=hparams.tts_postnet_K,
+                     num_highways=hparams.tts_num_highways,
+                     dropout=hparams.tts_dropout,
+                     stop_threshold=hparams.tts_stop_threshold,
+                     speaker_embedding_size=hparams.speaker_embedding_size)
+    model.r = hparams.tts_schedule[-1][0]
+    for module in model.modules():
+        if isinstance(module, PreNet):
+            module.p = 0
+    model.eval()
+    return model
+
+
+def _embedding(seed):
+    embedding = np.random.RandomState(seed).rand(hparams.speaker_embedding_size).astype(np.float32)
+    return embedding / np.linalg.norm(embedding)
+
+
+def _decode(decoder, joining_at):
+    """
+    Steps the decoder until every request is done, each request joining at its step.
+
+    :param joining_at: list of (step, request)
+    """
+    pending = sorted(joining_at, key=lambda item: item[0])
+    step = 0
+    while pending or not decoder.is_idle():
+        joining = [request for at, request in pending if at <= step]
+        pending = [(at, request) for at, request in pending if at > step]
+        decoder.step(joining)
+        step += 1
+
+
+def test_row_does_not_depend_on_longer_joiner():
+    """A text decodes the same alone as next to a longer text joining mid-decode"""
+    model = _model()
+    text = "Short text."
+    longer = "A much longer text joins the batch while the short one is being decoded."
+
+    alone = Synthesizer.decode_request(text, _embedding(0))
+    _decode(ContinuousBatchDecoder(model, max_steps=60), [(0, alone)])
+
+    batched = Synthesizer.decode_request(text, _embedding(0))
+    joiner = Synthesizer.decode_request(longer, _embedding(1))
+    _decode(ContinuousBatchDecoder(model, max_steps=60), [(0, batched), (3, joiner)])
+
+    assert batched.error is None and joiner.error is None
+    assert alone.mel.shape == batched.mel.shape
+    np.testing.assert_allclose(batched.mel, alone.mel, atol=1e-5)
+
+
+if __name__ == "__main__":
+    test_row_does_not_depend_on_longer_joiner()
+    print("✓ Continuous batching is independent of the other rows")
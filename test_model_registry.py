@@ -0,0 +1,47 @@
+import sys
+import os
+import threading
+import time
+
+# Set up paths
+backend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+sys.path.append(backend_dir)
+sys.path.append(os.path.join(backend_dir, "clone"))
+
+from tts.model_registry import ModelRegistry
+
+
+def test_idle_model_unloads_without_registry_calls():
+    """An idle model times out while nobody calls the registry"""
+    unloaded = []
+    registry = ModelRegistry(idle_timeout=0.5)
+    registry.register('model', lambda: object(), unload_fn=unloaded.append)
+    registry.load('model')
+    assert registry.is_loaded('model')
+
+    time.sleep(1.5)
+    assert not registry.is_loaded('model')
+    assert len(unloaded) == 1
+
+
+def test_unload_fn_runs_without_registry_lock():
+    """A slow unload_fn doesn't block the other callers of the registry"""
+    unblocked = []
+
+    def unload_fn(model):
+        status = threading.Thread(target=registry.get_status)
+        status.start()
+        status.join(timeout=1)
+        unblocked.append(not status.is_alive())
+
+    registry = ModelRegistry()
+    registry.register('model', lambda: object(), unload_fn=unload_fn)
+    registry.load('model')
+    assert registry.unload('model')
+    assert unblocked == [True]
+
+
+if __name__ == "__main__":
+    test_idle_model_unloads_without_registry_calls()
+    test_unload_fn_runs_without_registry_lock()
+    print("✓ Models are unloaded in the background, without blocking the registry")